@@ -0,0 +1,396 @@
+"""Micro-benchmarks for the store and dispatch hot paths.
+
+Usage:
+  python benchmarks/hot_paths.py --output bench.json
+  python benchmarks/hot_paths.py --sizes 1000,100000,1000000 --only list_ready
+  python benchmarks/hot_paths.py --compare bench-before.json
+
+Each case runs against a fresh temporary database. Results are written as
+JSON (one entry per case with its parameters and latency summary) so runs
+from different commits can be compared with ``--compare``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ravel import store  # noqa: E402
+
+SHAPES = ("flat", "chains", "fanout")
+
+
+class _Database:
+    """Point the store at a fresh database for the duration of a case."""
+
+    def __enter__(self) -> str:
+        self._saved = dict(os.environ)
+        self._tmp = tempfile.TemporaryDirectory(prefix="ravel-bench-")
+        os.environ.update(
+            {
+                "RAVEL_STATE_DIR": self._tmp.name,
+                "RAVEL_DB_PATH": os.path.join(self._tmp.name, "ravel.db"),
+                "RAVEL_NO_GPU": "1",
+                "RAVEL_USAGE_INTERVAL": "0",
+            }
+        )
+        for name in ("RAVEL_TRACE", "RAVEL_RPC", "RAVEL_MAX_QUEUED", "RAVEL_MAX_QUEUED_PER_USER", "RAVEL_MAX_SUBMIT_RATE"):
+            os.environ.pop(name, None)
+        return os.environ["RAVEL_DB_PATH"]
+
+    def __exit__(self, *exc) -> None:
+        os.environ.clear()
+        os.environ.update(self._saved)
+        self._tmp.cleanup()
+
+
+def seed_jobs(count: int, shape: str = "flat", status: str = "queued", statuses: Optional[List[str]] = None) -> List[str]:
+    """Bulk-insert ``count`` jobs shaped as a DAG, bypassing ``add_job()``.
+
+    ``flat``: no dependencies. ``chains``: chains of 10, only heads are ready.
+    ``fanout``: 1% roots, every other job depends on one root.
+    """
+    base = datetime(2026, 1, 1)
+    ids = [f"b{i:08d}" for i in range(count)]
+    jobs = []
+    for i, job_id in enumerate(ids):
+        job_status = statuses[i % len(statuses)] if statuses else status
+        created = (base + timedelta(seconds=i)).isoformat(timespec="seconds")
+        jobs.append((job_id, '["true"]', 1, i % 3, None, None, job_status, created, "bench"))
+    deps = []
+    if shape == "chains":
+        deps = [(ids[i], ids[i - 1]) for i in range(count) if i % 10]
+    elif shape == "fanout":
+        roots = max(1, count // 100)
+        deps = [(ids[i], ids[i % roots]) for i in range(roots, count)]
+    elif shape == "deep":
+        deps = [(ids[i], ids[i - 1]) for i in range(1, count)]
+    conn = store._connect()
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO jobs (id, command, gpus, priority, memory_tag, cwd, status, created_at, user)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            jobs,
+        )
+        conn.executemany("INSERT INTO job_deps (job_id, depends_on) VALUES (?, ?)", deps)
+    return ids
+
+
+def _summary(samples: List[float]) -> Dict:
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 4),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 4),
+        "p95_ms": round(ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+    }
+
+
+def _timeit(fn: Callable[[], object], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_add_job(sizes: List[int], repeat: int) -> Iterator[Dict]:
+    count = min(2000, max(sizes))
+    with _Database():
+        samples = _timeit(lambda: store.add_job(["true"], gpus=1), count)
+    result = _summary(samples)
+    result["ops_per_s"] = round(count / sum(samples), 1)
+    yield {"name": "add_job", "params": {"jobs": count}, **result}
+
+
+def bench_list_ready(sizes: List[int], repeat: int) -> Iterator[Dict]:
+    for size in sizes:
+        for shape in SHAPES:
+            with _Database():
+                seed_jobs(size, shape)
+                for limit in (8, None):
+                    samples = _timeit(lambda: store.list_ready_jobs(limit=limit), repeat if limit else max(1, repeat // 5))
+                    yield {
+                        "name": "list_ready_jobs",
+                        "params": {"queued": size, "shape": shape, "limit": limit},
+                        **_summary(samples),
+                    }
+
+
+def _claim_worker(db_path: str, state_dir: str, results) -> None:
+    os.environ["RAVEL_DB_PATH"] = db_path
+    os.environ["RAVEL_STATE_DIR"] = state_dir
+    claims = conflicts = 0
+    while True:
+        ready = store.list_ready_jobs(limit=8)
+        if not ready:
+            break
+        for job in ready:
+            if store.try_claim_job(job["id"], [0]):
+                claims += 1
+                break
+            conflicts += 1
+    results.put((claims, conflicts))
+
+
+def bench_claim_contention(sizes: List[int], repeat: int) -> Iterator[Dict]:
+    count = min(2000, max(sizes))
+    ctx = multiprocessing.get_context("spawn")
+    for workers in (1, 4, 8):
+        with _Database() as db_path:
+            seed_jobs(count, "flat")
+            results = ctx.Queue()
+            procs = [
+                ctx.Process(target=_claim_worker, args=(db_path, os.environ["RAVEL_STATE_DIR"], results))
+                for _ in range(workers)
+            ]
+            start = time.perf_counter()
+            for proc in procs:
+                proc.start()
+            totals = [results.get() for _ in procs]
+            elapsed = time.perf_counter() - start
+            for proc in procs:
+                proc.join()
+        claims = sum(t[0] for t in totals)
+        yield {
+            "name": "try_claim_job",
+            "params": {"jobs": count, "processes": workers},
+            "n": claims,
+            "seconds": round(elapsed, 4),
+            "claims_per_s": round(claims / elapsed, 1),
+            "conflicts": sum(t[1] for t in totals),
+        }
+
+
+def _submit_worker(db_path: str, state_dir: str, use_rpc: bool, count: int, results) -> None:
+    os.environ["RAVEL_DB_PATH"] = db_path
+    os.environ["RAVEL_STATE_DIR"] = state_dir
+    os.environ["RAVEL_RPC"] = "1" if use_rpc else "0"
+    from ravel.scheduler import submit_jobs
+
+    samples = _timeit(lambda: submit_jobs([{"command": ["true"]}]), count)
+    results.put(samples)
+
+
+def bench_submit_contention(sizes: List[int], repeat: int) -> Iterator[Dict]:
+    from ravel import rpc
+
+    ctx = multiprocessing.get_context("spawn")
+    per_worker = 100
+    for use_rpc in (False, True):
+        for workers in (1, 8, 32):
+            with _Database() as db_path:
+                state_dir = os.environ["RAVEL_STATE_DIR"]
+                store.list_jobs(["queued"])
+                server = rpc.serve() if use_rpc else None
+                results = ctx.Queue()
+                procs = [
+                    ctx.Process(target=_submit_worker, args=(db_path, state_dir, use_rpc, per_worker, results))
+                    for _ in range(workers)
+                ]
+                start = time.perf_counter()
+                for proc in procs:
+                    proc.start()
+                samples = [s for _ in procs for s in results.get()]
+                elapsed = time.perf_counter() - start
+                for proc in procs:
+                    proc.join()
+                if server:
+                    server.shutdown()
+                    server.server_close()
+            yield {
+                "name": "submit",
+                "params": {"processes": workers, "rpc": use_rpc},
+                "ops_per_s": round(len(samples) / elapsed, 1),
+                **_summary(samples),
+            }
+
+
+def bench_mark_blocked(sizes: List[int], repeat: int) -> Iterator[Dict]:
+    for depth in sorted({min(s, 2000) for s in sizes}):
+        with _Database():
+            ids = seed_jobs(depth, "deep")
+            conn = store._connect()
+            with conn:
+                conn.execute("UPDATE jobs SET status = 'failed' WHERE id = ?", (ids[0],))
+            calls = 0
+            start = time.perf_counter()
+            while store.mark_blocked_jobs_due_to_failed_deps():
+                calls += 1
+            elapsed = time.perf_counter() - start
+            idle = _timeit(store.mark_blocked_jobs_due_to_failed_deps, repeat)
+        yield {
+            "name": "mark_blocked_jobs_due_to_failed_deps",
+            "params": {"chain_depth": depth},
+            "calls_to_converge": calls + 1,
+            "seconds_to_converge": round(elapsed, 4),
+            **_summary(idle),
+        }
+
+
+class _RecordingExecutor:
+    def __init__(self):
+        self.started: List[str] = []
+
+    def submit(self, fn, job_id: str, **kwargs) -> Future:
+        self.started.append(job_id)
+        return Future()
+
+
+def bench_run_once(sizes: List[int], repeat: int) -> Iterator[Dict]:
+    from ravel.daemon import run_once
+
+    for size in sizes:
+        with _Database():
+            os.environ["RAVEL_FAKE_GPUS"] = "8"
+            os.environ["RAVEL_MAX_WORKERS"] = "8"
+            seed_jobs(size, "chains")
+            executor = _RecordingExecutor()
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run_once(executor=executor, active_futures=set())
+                samples.append(time.perf_counter() - start)
+                for job_id in executor.started:
+                    store.set_job_finished(job_id, "done", 0, "", "")
+                executor.started = []
+        yield {"name": "run_once", "params": {"queued": size, "shape": "chains"}, **_summary(samples)}
+
+
+def bench_api_summary(sizes: List[int], repeat: int) -> Iterator[Dict]:
+    try:
+        from ravel_web.app import create_app
+    except ImportError:
+        return
+    for size in sizes:
+        with _Database():
+            seed_jobs(size, "flat", statuses=["done"] * 8 + ["failed", "queued"])
+            client = create_app().test_client()
+            samples = _timeit(lambda: client.get("/api/summary"), max(1, repeat // 5))
+        yield {"name": "api_summary", "params": {"jobs": size}, **_summary(samples)}
+
+
+def bench_ravelfile(sizes: List[int], repeat: int) -> Iterator[Dict]:
+    from ravel.ravelfile import load_plan
+
+    defaults = {"gpus": 1, "cpus": 0, "priority": 0, "memory_tag": None, "cache": False, "time_limit": None}
+    for size in sizes:
+        with _Database() as db_path:
+            path = os.path.join(os.path.dirname(db_path), "Ravelfile")
+            with open(path, "w") as handle:
+                handle.write("SET GPUS 0\n")
+                for i in range(size):
+                    after = f" after=j{i - 1}" if i % 10 else ""
+                    handle.write(f"JOB name=j{i}{after} -- python train.py --seed {i}\n")
+            rounds = max(1, repeat // 10)
+            cold = _timeit(lambda: load_plan(path, defaults, use_cache=False), rounds)
+            load_plan(path, defaults)
+            cached = _timeit(lambda: load_plan(path, defaults), rounds)
+        yield {"name": "ravelfile_compile", "params": {"lines": size}, **_summary(cold)}
+        yield {"name": "ravelfile_cached", "params": {"lines": size}, **_summary(cached)}
+
+
+CASES = {
+    "add_job": bench_add_job,
+    "list_ready": bench_list_ready,
+    "claim": bench_claim_contention,
+    "submit": bench_submit_contention,
+    "mark_blocked": bench_mark_blocked,
+    "run_once": bench_run_once,
+    "api_summary": bench_api_summary,
+    "ravelfile": bench_ravelfile,
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _case_key(result: Dict) -> str:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """Describe per-case changes of the headline number between two runs."""
+    before = {_case_key(r): r for r in baseline.get("results", [])}
+    lines = []
+    for result in current["results"]:
+        old = before.get(_case_key(result))
+        if not old:
+            continue
+        for metric, higher_is_better in (("p50_ms", False), ("claims_per_s", True), ("ops_per_s", True)):
+            if metric in result and old.get(metric):
+                ratio = result[metric] / old[metric]
+                worse = ratio < 1 if higher_is_better else ratio > 1
+                flag = "REGRESSION" if worse and abs(ratio - 1) > 0.2 else ""
+                lines.append(
+                    f"{result['name']} {result['params']}: {metric} {old[metric]} -> {result[metric]} (x{ratio:.2f}) {flag}".rstrip()
+                )
+                break
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000", help="Comma-separated queue sizes")
+    parser.add_argument("--repeat", type=int, default=50, help="Samples per latency case")
+    parser.add_argument("--only", action="append", default=[], choices=sorted(CASES), help="Run only these cases")
+    parser.add_argument("--output", default=None, help="Write JSON results to this file")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlite": store.sqlite3.sqlite_version,
+        "sizes": sizes,
+        "results": [],
+    }
+    for name in args.only or list(CASES):
+        for result in CASES[name](sizes, max(1, args.repeat)):
+            report["results"].append(result)
+            print(json.dumps(result), file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r") as handle:
+            for line in compare(json.load(handle), report):
+                print(line, file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,72 @@
+"""Generate a synthetic week of traffic and time ``ravel simulate`` on it.
+
+Usage:
+  python benchmarks/simulate_week.py --jobs 5000 --gpus 8 --policy max_workers=8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ravel import trace  # noqa: E402
+from ravel.simulate import parse_policy, simulate  # noqa: E402
+
+WEEK = 7 * 24 * 3600
+
+
+def write_trace(path: str, jobs: int, gpus: int, seed: int) -> None:
+    rng = random.Random(seed)
+    writer = trace.TraceWriter(path)
+    start = time.time() - WEEK
+    writer.gpus(start, gpus, 0)
+    users = [f"user{i}" for i in range(6)]
+    submitted = sorted(start + rng.random() * WEEK for _ in range(jobs))
+    clock = start
+    for idx, when in enumerate(submitted):
+        job_id = f"j{idx:06d}"
+        runtime = rng.lognormvariate(5.5, 1.2)
+        writer.submit(
+            {
+                "id": job_id,
+                "created_at": datetime.fromtimestamp(when).isoformat(timespec="seconds"),
+                "gpus": rng.choice([1, 1, 1, 2, 4]),
+                "priority": rng.choice([0, 0, 0, 1]),
+                "memory_tag": rng.choice([None, None, "large"]),
+                "user": rng.choice(users),
+            },
+            [],
+        )
+        clock = max(clock, when)
+        writer.start(job_id, clock, [])
+        writer.finish(job_id, clock + runtime, "done" if rng.random() > 0.05 else "failed", runtime)
+    writer.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--gpus", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policy", action="append", default=[])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "week.trace")
+        write_trace(path, args.jobs, args.gpus, args.seed)
+        start = time.perf_counter()
+        report = simulate(path, parse_policy(args.policy), gpus=args.gpus)
+        report["wall_seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Compare job start latency of the zygote runner against subprocess.Popen.
+
+Usage:
+  python benchmarks/zygote_startup.py --modules json,decimal --runs 20
+
+Latency is measured from the spawn call until the job script's body starts
+running, i.e. after the script's own imports of the preloaded modules.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ravel.zygote import Zygote  # noqa: E402
+
+
+def _write_script(directory: str, modules: list[str]) -> str:
+    path = os.path.join(directory, "job.py")
+    with open(path, "w") as handle:
+        for module in modules:
+            handle.write(f"import {module}\n")
+        handle.write("import time\nprint(time.time())\n")
+    return path
+
+
+def _popen_latency(script: str) -> float:
+    start = time.time()
+    out = subprocess.run(
+        [sys.executable, script], capture_output=True, text=True, check=True
+    ).stdout
+    return float(out.strip()) - start
+
+
+def _zygote_latency(zygote: Zygote, script: str) -> float:
+    start = time.time()
+    proc = zygote.spawn([script], cwd=os.path.dirname(script), env=dict(os.environ))
+    if proc is None:
+        raise RuntimeError("zygote is not ready")
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(err)
+    return float(out.strip()) - start
+
+
+def _summary(values: list[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p90_ms": round(ordered[int(len(ordered) * 0.9) - 1] * 1000, 2),
+    }
+
+
+def run(modules: list[str], runs: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        script = _write_script(tmp, modules)
+        zygote = Zygote(modules, path=os.path.join(tmp, "zygote.sock"))
+        zygote.ensure_started()
+        deadline = time.monotonic() + 120
+        while not zygote.ready():
+            if time.monotonic() > deadline:
+                raise RuntimeError("zygote did not start")
+            time.sleep(0.05)
+        try:
+            popen = [_popen_latency(script) for _ in range(runs)]
+            forked = [_zygote_latency(zygote, script) for _ in range(runs)]
+        finally:
+            zygote.stop()
+    return {
+        "modules": modules,
+        "runs": runs,
+        "popen": _summary(popen),
+        "zygote": _summary(forked),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", default="json", help="Comma-separated modules to preload")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    modules = [m for m in args.modules.split(",") if m]
+    print(json.dumps(run(modules, max(1, args.runs)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
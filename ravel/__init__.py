@@ -1 +1,12 @@
-__version__ = "0.1.0"
\ No newline at end of file
+__version__ = "0.1.0"
+
+__all__ = ["Client", "FunctionHandle", "JobError", "JobHandle", "JobResult"]
+
+
+def __getattr__(name):
+    # Imported on first use so `import ravel.cli` stays free of the client's imports.
+    if name in __all__:
+        from . import client
+
+        return getattr(client, name)
+    raise AttributeError(f"module 'ravel' has no attribute {name!r}")
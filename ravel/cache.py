@@ -0,0 +1,202 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from .store import (
+    delete_cache_entries,
+    get_cache_entry,
+    list_cache_entries,
+    put_cache_entry,
+    touch_cache_entry,
+)
+
+
+def _state_dir() -> str:
+    return os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+
+
+def cache_dir() -> str:
+    return os.environ.get("RAVEL_CACHE_DIR", os.path.join(_state_dir(), "cache"))
+
+
+def max_bytes() -> int:
+    try:
+        return int(os.getenv("RAVEL_CACHE_MAX_BYTES", str(1 << 30)))
+    except ValueError:
+        return 1 << 30
+
+
+def max_entries() -> int:
+    try:
+        return int(os.getenv("RAVEL_CACHE_MAX_ENTRIES", "1000"))
+    except ValueError:
+        return 1000
+
+
+def expand_patterns(patterns: List[str], cwd: Optional[str]) -> List[str]:
+    base = cwd or os.getcwd()
+    paths = set()
+    for pattern in patterns:
+        full = pattern if os.path.isabs(pattern) else os.path.join(base, pattern)
+        for path in glob.glob(full, recursive=True):
+            if os.path.isfile(path):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+# Digests are memoized per (path, mtime, size) so unchanged inputs are not re-read.
+_DIGESTS: Dict[str, Tuple[int, int, str]] = {}
+_DIGESTS_LOCK = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    stat = os.stat(path)
+    with _DIGESTS_LOCK:
+        cached = _DIGESTS.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _DIGESTS_LOCK:
+        _DIGESTS[path] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+
+# Set by the daemon for each run, so they never take part in a key.
+PER_RUN_ENV = frozenset({"NVIDIA_VISIBLE_DEVICES", "RAVEL_JOB_ID", "OMP_NUM_THREADS", "MKL_NUM_THREADS"})
+
+
+def job_key(job: Dict) -> str:
+    """Cache key of a job; ``cache_env`` values come from the daemon environment."""
+    cwd = job.get("cwd") or ""
+    inputs = [
+        (os.path.relpath(path, cwd or None), file_digest(path))
+        for path in expand_patterns(job.get("inputs") or [], cwd)
+    ]
+    payload = {
+        "command": job["command"],
+        "cwd": cwd,
+        "env": {
+            name: os.environ.get(name)
+            for name in sorted(job.get("cache_env") or [])
+            if name not in PER_RUN_ENV
+        },
+        "inputs": inputs,
+        "outputs": sorted(job.get("outputs") or []),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(key: str) -> Optional[Dict]:
+    entry = get_cache_entry(key)
+    if not entry:
+        return None
+    meta_path = os.path.join(cache_dir(), key, "meta.json")
+    try:
+        with open(meta_path, "r") as handle:
+            meta = json.load(handle)
+    except (OSError, ValueError):
+        delete_cache_entries([key])
+        return None
+    touch_cache_entry(key)
+    return meta
+
+
+def restore(key: str, meta: Dict) -> bool:
+    entry = os.path.join(cache_dir(), key)
+    for item in meta.get("files", []):
+        blob = os.path.join(entry, item["blob"])
+        if not os.path.exists(blob):
+            return False
+    for item in meta.get("files", []):
+        os.makedirs(os.path.dirname(item["path"]) or ".", exist_ok=True)
+        shutil.copy2(os.path.join(entry, item["blob"]), item["path"])
+    return True
+
+
+def save(
+    key: str,
+    job: Dict,
+    returncode: Optional[int],
+    stdout: str,
+    stderr: str,
+) -> None:
+    root = cache_dir()
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(os.path.join(staging, "files"))
+    files = []
+    size = 0
+    for idx, path in enumerate(expand_patterns(job.get("outputs") or [], job.get("cwd"))):
+        blob = os.path.join("files", str(idx))
+        shutil.copy2(path, os.path.join(staging, blob))
+        size += os.path.getsize(path)
+        files.append({"path": path, "blob": blob})
+    meta = {
+        "job_id": job["id"],
+        "returncode": returncode,
+        "stdout": stdout,
+        "stderr": stderr,
+        "files": files,
+    }
+    with open(os.path.join(staging, "meta.json"), "w") as handle:
+        json.dump(meta, handle)
+    size += len(stdout or "") + len(stderr or "")
+
+    target = os.path.join(root, key)
+    shutil.rmtree(target, ignore_errors=True)
+    try:
+        os.replace(staging, target)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return
+    put_cache_entry(key, size, time.time())
+    evict()
+
+
+def evict() -> int:
+    entries = list_cache_entries()
+    total = sum(e["size"] for e in entries)
+    limit_bytes = max_bytes()
+    limit_entries = max_entries()
+    doomed = []
+    # list_cache_entries() is ordered least recently used first.
+    for entry in entries:
+        if total <= limit_bytes and len(entries) - len(doomed) <= limit_entries:
+            break
+        doomed.append(entry["key"])
+        total -= entry["size"]
+    for key in doomed:
+        shutil.rmtree(os.path.join(cache_dir(), key), ignore_errors=True)
+    delete_cache_entries(doomed)
+    return len(doomed)
+
+
+def clear() -> int:
+    keys = [e["key"] for e in list_cache_entries()]
+    delete_cache_entries(keys)
+    shutil.rmtree(cache_dir(), ignore_errors=True)
+    return len(keys)
+
+
+def stats() -> Dict:
+    entries = list_cache_entries()
+    return {
+        "entries": len(entries),
+        "bytes": sum(e["size"] for e in entries),
+        "max_entries": max_entries(),
+        "max_bytes": max_bytes(),
+        "dir": cache_dir(),
+    }
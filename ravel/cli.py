@@ -5,10 +5,12 @@ from typing import Optional
 
 import click
 
-from .daemon import daemon_running, daemon_status, start_daemon, stop_daemon
-from .scheduler import add_job, list_jobs
-from .store import get_job
-from .utils import console
+from .lifecycle import daemon_running, daemon_status, start_daemon, stop_daemon
+from .ravelfile import collect_jobs as _collect_submit_jobs
+from .ravelfile import load_plan
+from .ravelfile import parse_job_line as _parse_submit_line
+from .scheduler import add_job, list_jobs, submit_jobs
+from .utils import console, parse_duration
 
 @click.group()
 def main():
@@ -17,6 +19,7 @@ def main():
 @main.command()
 @click.argument("command", nargs=-1, required=True)
 @click.option("--gpus", "-g", default=1, help="Number of GPUs")
+@click.option("--cpus", "-c", default=0, help="CPU cores to pin the job to (0 = no pinning)")
 @click.option("--priority", "-p", default=0, help="Higher runs first")
 @click.option(
     "--after",
@@ -24,20 +27,42 @@ def main():
     help="Job ID(s) that must finish before this runs (repeatable)",
 )
 @click.option("--memory-tag", "--mem", default=None, help="Memory tag for limits")
+@click.option(
+    "--time-limit",
+    "-t",
+    default=None,
+    help="Walltime limit, e.g. 600, 45m, 1h30m or 01:30:00",
+)
+@click.option("--cache", is_flag=True, help="Reuse the result of an identical earlier run")
+@click.option("--input", "inputs", multiple=True, help="Input file glob for the cache key (repeatable)")
+@click.option("--output", "outputs", multiple=True, help="Output file glob to cache and restore (repeatable)")
+@click.option("--cache-env", multiple=True, help="Environment variable to include in the cache key (repeatable)")
 @click.option("--dash", is_flag=True, help="Display the dashboard")
 @click.option(
     "--no-wait",
     is_flag=True,
     help="Enqueue the job and exit without waiting",
 )
+@click.option(
+    "--block-timeout",
+    default=0.0,
+    help="Seconds to wait for queue capacity if admission limits reject the job",
+)
 def run(
     command: tuple[str],
     gpus: int,
+    cpus: int,
     priority: int,
     after: tuple[str],
     memory_tag: Optional[str],
+    time_limit: Optional[str],
+    cache: bool,
+    inputs: tuple[str],
+    outputs: tuple[str],
+    cache_env: tuple[str],
     dash: bool,
     no_wait: bool,
+    block_timeout: float,
 ):
     """Run a command or .py file"""
     cmd_str = command[0]
@@ -54,14 +79,23 @@ def run(
             if not os.path.isabs(cmd_list[1]):
                 cmd_list[1] = os.path.abspath(cmd_list[1])
 
+    limit_seconds = _parse_time_limit(time_limit)
     depends_on = list(after) if after else None
-    job_id = add_job(
+    job_id = _admit(
+        block_timeout,
+        add_job,
         cmd_list,
         gpus=gpus,
         priority=priority,
         depends_on=depends_on,
         memory_tag=memory_tag,
         cwd=os.getcwd(),
+        cpus=cpus,
+        cache=cache,
+        inputs=list(inputs),
+        outputs=list(outputs),
+        cache_env=list(cache_env),
+        time_limit=limit_seconds,
     )
 
     if not daemon_running():
@@ -75,11 +109,56 @@ def run(
         console.print(f"[dim]Enqueued {job_id}. Exiting (no-wait).[/]")
         return
 
-    _wait_for_job(job_id)
+    _wait_for_jobs([job_id])
 
     console.print("[bold cyan]All done! Exiting.[/]")
 
 
+@main.command()
+@click.argument("job_ids", nargs=-1)
+@click.option(
+    "--all-from-file",
+    "id_file",
+    type=click.File("r"),
+    default=None,
+    help="Read job IDs (whitespace-separated, '#' comments) from a file, or - for stdin",
+)
+@click.option("--tag", "memory_tag", default=None, help="Wait for all queued and running jobs with this memory tag")
+@click.option("--timeout", default=None, help="Give up after this long, e.g. 600, 45m or 2h")
+@click.option("--quiet", "-q", is_flag=True, help="Print only the status line of each job")
+def wait(job_ids: tuple[str], id_file, memory_tag: Optional[str], timeout: Optional[str], quiet: bool):
+    """Wait for jobs and print results in completion order"""
+    ids = list(job_ids)
+    if id_file is not None:
+        for line in id_file:
+            ids.extend(line.split("#", 1)[0].split())
+    if memory_tag:
+        from .store import list_jobs as list_store_jobs
+
+        ids.extend(
+            job["id"]
+            for job in list_store_jobs(["queued", "running"])
+            if job.get("memory_tag") == memory_tag
+        )
+    if not ids:
+        console.print("[yellow]No jobs to wait for.[/]")
+        return
+
+    try:
+        limit = parse_duration(timeout) if timeout else None
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="--timeout")
+
+    counts = _wait_for_jobs(ids, show_output=not quiet, timeout=limit)
+    succeeded = counts.get("done", 0) + counts.get("cached", 0)
+    summary = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+    console.print(f"[bold]{succeeded}/{len(set(ids))} succeeded[/] ({summary})")
+    if counts.get("pending"):
+        raise SystemExit(124)
+    if succeeded < len(set(ids)):
+        raise SystemExit(1)
+
+
 @main.command()
 def queue():
     """List the queued jobs"""
@@ -141,155 +220,128 @@ def stop(job_id: str):
 @main.command()
 @click.argument("file", type=click.Path(exists=True, dir_okay=False))
 @click.option("--gpus", "-g", default=1, help="Number of GPUs")
+@click.option("--cpus", "-c", default=0, help="CPU cores per job (0 = no pinning)")
 @click.option("--priority", "-p", default=0, help="Higher runs first")
 @click.option("--memory-tag", "--mem", default=None, help="Memory tag for limits")
+@click.option("--time-limit", "-t", default=None, help="Default walltime limit per job")
+@click.option("--cache", is_flag=True, help="Enable result caching for every job")
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only enqueue jobs whose outputs are older than their inputs",
+)
 @click.option("--no-wait", is_flag=True, help="Enqueue jobs and exit immediately")
-def submit(file: str, gpus: int, priority: int, memory_tag: Optional[str], no_wait: bool):
+@click.option(
+    "--block-timeout",
+    default=0.0,
+    help="Seconds to wait for queue capacity if admission limits reject a job",
+)
+def submit(
+    file: str,
+    gpus: int,
+    cpus: int,
+    priority: int,
+    memory_tag: Optional[str],
+    time_limit: Optional[str],
+    cache: bool,
+    incremental: bool,
+    no_wait: bool,
+    block_timeout: float,
+):
     """Submit a batch of jobs from a text file"""
-    from .store import add_dependencies
-
-    with open(file, "r") as handle:
-        lines = handle.read().splitlines()
-
     defaults = {
         "gpus": gpus,
+        "cpus": cpus,
         "priority": priority,
         "memory_tag": memory_tag,
+        "cache": cache,
+        "time_limit": _parse_time_limit(time_limit),
     }
 
-    jobs = _collect_submit_jobs(lines, defaults)
+    parsed_jobs, errors = load_plan(file, defaults)
+    if errors:
+        _print_plan_errors(errors)
+        raise SystemExit(1)
 
-    if not jobs:
+    if not parsed_jobs:
         console.print("[yellow]No jobs found in file.[/]")
         return
 
+    submit_cwd = os.path.abspath(os.path.dirname(file))
+    if incremental:
+        from .incremental import select_dirty_jobs
+
+        parsed_jobs, skipped = select_dirty_jobs(parsed_jobs, submit_cwd)
+        if skipped:
+            console.print(f"[dim]Skipped {len(skipped)} up-to-date jobs.[/]")
+        if not parsed_jobs:
+            console.print("[green]Everything is up to date.[/]")
+            return
+
     if not daemon_running():
         start_daemon()
 
-    parsed_jobs = [
-        _parse_submit_line(raw, defaults["gpus"], defaults["priority"], defaults["memory_tag"])
-        for raw in jobs
+    specs = [
+        {
+            "name": entry["name"],
+            "command": _shell_command(entry["command"]),
+            "gpus": entry["gpus"],
+            "priority": entry["priority"],
+            "depends_on": entry["after"],
+            "memory_tag": entry["memory_tag"],
+            "cwd": submit_cwd,
+            "cpus": entry["cpus"],
+            "cache": entry["cache"],
+            "inputs": entry["inputs"],
+            "outputs": entry["outputs"],
+            "cache_env": entry["cache_env"],
+            "time_limit": entry["time_limit"],
+        }
+        for entry in parsed_jobs
     ]
-
-    job_ids = []
-    name_to_id: dict[str, str] = {}
-    submit_cwd = os.path.abspath(os.path.dirname(file))
-    for entry in parsed_jobs:
-        cmd_list = _shell_command(entry["command"])
-        job_id = add_job(
-            cmd_list,
-            gpus=entry["gpus"],
-            priority=entry["priority"],
-            memory_tag=entry["memory_tag"],
-            cwd=submit_cwd,
-        )
-        job_ids.append(job_id)
-        if entry["name"]:
-            name_to_id[entry["name"]] = job_id
-
-    for entry, job_id in zip(parsed_jobs, job_ids):
-        depends_on = []
-        for dep in entry["after"]:
-            depends_on.append(name_to_id.get(dep, dep))
-        add_dependencies(job_id, depends_on)
+    job_ids = _admit(block_timeout, submit_jobs, specs)
 
     console.print(f"[green]Queued {len(job_ids)} jobs.[/]")
     if no_wait:
         return
 
-    for job_id in job_ids:
-        _wait_for_job(job_id)
+    _wait_for_jobs(job_ids)
 
 @main.command()
 @click.argument("file", type=click.Path(exists=True, dir_okay=False))
 def validate(file: str):
     """Validate a Ravelfile or jobs file"""
-    with open(file, "r") as handle:
-        lines = handle.read().splitlines()
-
-    defaults = {"gpus": 1, "priority": 0, "memory_tag": None}
-    errors = []
-    jobs = _collect_submit_jobs(lines, defaults, errors=errors)
-
-    parsed = []
-    for idx, raw in enumerate(jobs, start=1):
-        try:
-            entry = _parse_submit_line(raw, defaults["gpus"], defaults["priority"], defaults["memory_tag"])
-        except Exception as exc:
-            errors.append(f"job {idx}: failed to parse metadata ({exc})")
-            continue
-        parsed.append(entry)
-
-    names = {p["name"] for p in parsed if p["name"]}
-    for idx, entry in enumerate(parsed, start=1):
-        for dep in entry["after"]:
-            if dep in names:
-                continue
-            if len(dep) == 8 and dep.isalnum():
-                continue
-            errors.append(f"job {idx}: unknown dependency '{dep}'")
-
+    defaults = {
+        "gpus": 1,
+        "cpus": 0,
+        "priority": 0,
+        "memory_tag": None,
+        "cache": False,
+        "time_limit": None,
+    }
+    jobs, errors = load_plan(file, defaults)
     if errors:
-        console.print("[red]Invalid Ravelfile/jobs file:[/]")
-        for err in errors:
-            console.print(f"- {err}")
+        _print_plan_errors(errors)
         raise SystemExit(1)
 
-    console.print("[green]Ravelfile/jobs file is valid.[/]")
+    console.print(f"[green]Ravelfile/jobs file is valid ({len(jobs)} jobs).[/]")
 
 
-def _parse_submit_line(
-    raw: str,
-    default_gpus: int,
-    default_priority: int,
-    default_memory_tag: Optional[str],
-) -> dict:
-    if " -- " in raw:
-        meta, command = raw.split(" -- ", 1)
-        meta = meta.strip()
-    else:
-        meta = ""
-        command = raw
-
-    gpus = default_gpus
-    priority = default_priority
-    memory_tag = default_memory_tag
-    name = None
-    after: list[str] = []
-
-    if meta:
-        parts = [p for p in meta.split() if p]
-        for part in parts:
-            if "=" not in part:
-                continue
-            key, value = part.split("=", 1)
-            key = key.strip().lower()
-            value = value.strip()
-            if key == "gpus":
-                try:
-                    gpus = int(value)
-                except ValueError:
-                    pass
-            elif key == "priority":
-                try:
-                    priority = int(value)
-                except ValueError:
-                    pass
-            elif key in {"memory", "mem", "memory_tag"}:
-                memory_tag = value or None
-            elif key == "name":
-                name = value or None
-            elif key in {"after", "depends"}:
-                after = [v.strip() for v in value.split(",") if v.strip()]
-
-    return {
-        "command": command,
-        "gpus": gpus,
-        "priority": priority,
-        "memory_tag": memory_tag,
-        "name": name,
-        "after": after,
-    }
+def _print_plan_errors(errors: list[str]) -> None:
+    console.print("[red]Invalid Ravelfile/jobs file:[/]")
+    for err in errors[:50]:
+        console.print(f"- {err}")
+    if len(errors) > 50:
+        console.print(f"- ... and {len(errors) - 50} more")
+
+
+def _parse_time_limit(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parse_duration(value)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="--time-limit")
 
 
 def _shell_command(command: str) -> list[str]:
@@ -297,87 +349,6 @@ def _shell_command(command: str) -> list[str]:
         return ["powershell", "-NoProfile", "-Command", command]
     return ["/bin/bash", "-lc", command]
 
-def _apply_ravelfile_set(line: str, defaults: dict) -> bool:
-    parts = line.split(None, 2)
-    if len(parts) < 3:
-        return False
-    key = parts[1].strip().lower()
-    value = parts[2].strip()
-    if key == "gpus":
-        try:
-            defaults["gpus"] = int(value)
-        except ValueError:
-            return False
-    elif key == "priority":
-        try:
-            defaults["priority"] = int(value)
-        except ValueError:
-            return False
-    elif key in {"memory", "mem", "memory_tag"}:
-        defaults["memory_tag"] = value or None
-    else:
-        return False
-    return True
-
-
-def _collect_submit_jobs(
-    lines: list[str],
-    defaults: dict,
-    errors: Optional[list[str]] = None,
-) -> list[str]:
-    jobs: list[str] = []
-    idx = 0
-    while idx < len(lines):
-        raw = lines[idx]
-        line = raw.strip()
-        if not line:
-            idx += 1
-            continue
-        if line.startswith("#"):
-            idx += 1
-            continue
-
-        if line.upper().startswith("SET "):
-            if not _apply_ravelfile_set(line, defaults):
-                if errors is not None:
-                    errors.append(f"line {idx + 1}: invalid SET directive")
-            idx += 1
-            continue
-
-        if line.upper().startswith("JOB "):
-            line = raw[raw.upper().find("JOB") + 3 :].lstrip()
-
-        command_lines = [line]
-        heredoc_tag = _detect_heredoc_tag(line)
-        if heredoc_tag:
-            idx += 1
-            while idx < len(lines):
-                command_lines.append(lines[idx])
-                if lines[idx].strip() == heredoc_tag:
-                    break
-                idx += 1
-            if idx >= len(lines) or (lines[idx].strip() != heredoc_tag):
-                if errors is not None:
-                    errors.append(f"line {idx + 1}: unterminated heredoc '{heredoc_tag}'")
-        jobs.append("\n".join(command_lines))
-        idx += 1
-    return jobs
-
-def _detect_heredoc_tag(line: str) -> Optional[str]:
-    if "<<'" in line:
-        start = line.split("<<'", 1)[1]
-        if "'" in start:
-            return start.split("'", 1)[0]
-    if "<<\"" in line:
-        start = line.split("<<\"", 1)[1]
-        if "\"" in start:
-            return start.split("\"", 1)[0]
-    if "<<" in line:
-        start = line.split("<<", 1)[1].strip()
-        if start:
-            return start.split()[0]
-    return None
-
 @main.command()
 def version():
     from . import __version__
@@ -408,12 +379,31 @@ def web(host: str, port: int):
     "--status",
     "status_filter",
     default=None,
-    help="Filter by status: queued,running,done,failed,blocked",
+    help="Filter by status: queued,running,done,failed,blocked,cached,timeout",
 )
-def logs(limit: int, only_failed: bool, only_passed: bool, only_blocked:bool, status_filter: Optional[str]):
-    """Show recent jobs with summaries"""
+@click.argument("job_id", required=False)
+@click.option("--follow", "-f", is_flag=True, help="Stream JOB_ID's output until it finishes")
+@click.option("--offset", default=None, help="Resume JOB_ID's output at byte offset N (stdout) or N,M (stdout,stderr)")
+def logs(
+    limit: int,
+    only_failed: bool,
+    only_passed: bool,
+    only_blocked: bool,
+    status_filter: Optional[str],
+    job_id: Optional[str],
+    follow: bool,
+    offset: Optional[str],
+):
+    """Show recent jobs with summaries, or the output of one job"""
     from .store import list_recent_jobs
 
+    if job_id:
+        _print_job_output(job_id, follow, offset)
+        return
+    if follow:
+        console.print("[red]--follow needs a JOB_ID[/]")
+        return
+
     if only_failed and only_passed:
         console.print("[red]Choose only one of --failed, --passed, or --blocked[/]")
         return
@@ -447,6 +437,10 @@ def logs(limit: int, only_failed: bool, only_passed: bool, only_blocked:bool, st
             status = "[bold red]failed[/]"
         elif raw_status == "blocked":
             status = "[bold yellow]blocked[/]"
+        elif raw_status == "cached":
+            status = "[bold cyan]cached[/]"
+        elif raw_status == "timeout":
+            status = "[bold red]timeout[/]"
         else:
             status = raw_status
         cmd = " ".join(job["command"])
@@ -455,13 +449,94 @@ def logs(limit: int, only_failed: bool, only_passed: bool, only_blocked:bool, st
         rc = job.get("returncode")
         rc_text = "-" if rc is None else str(rc)
         cwd = job.get("cwd") or "-"
-        extra = f" cwd={cwd}" if raw_status == "failed" else ""
+        extra = f" cwd={cwd}" if raw_status in {"failed", "timeout"} else ""
+        extra += _usage_text(job)
         console.print(
             f"{job['id']} {status} rc={rc_text} "
             f"created={created} finished={finished}{extra} :: {cmd}"
         )
 
 
+def _print_job_output(job_id: str, follow: bool, offset: Optional[str]) -> None:
+    import sys
+
+    from . import spool
+    from .store import get_job
+
+    try:
+        positions = spool.offsets(offset)
+    except ValueError:
+        raise click.BadParameter("expected N or N,M", param_hint="--offset")
+    targets = {"stdout": sys.stdout.buffer, "stderr": sys.stderr.buffer}
+    try:
+        while True:
+            job = get_job(job_id)
+            if not job:
+                console.print(f"[red]Job {job_id} not found[/]")
+                raise SystemExit(1)
+            complete = True
+            for stream in spool.STREAMS:
+                while True:
+                    data, positions[stream], done = spool.read_chunk(job, stream, positions[stream])
+                    if data:
+                        targets[stream].write(data)
+                        targets[stream].flush()
+                    if done or len(data) < spool.CHUNK_BYTES:
+                        break
+                complete = complete and done
+            if complete or not follow:
+                return
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        click.echo(f"Stopped; resume with --offset {positions['stdout']},{positions['stderr']}", err=True)
+
+
+def _usage_text(job: dict) -> str:
+    from .usage import format_bytes
+
+    parts = []
+    if job.get("peak_rss") is not None:
+        parts.append(f"peak_rss={format_bytes(job['peak_rss'])}")
+    if job.get("cpu_seconds") is not None:
+        parts.append(f"cpu={job['cpu_seconds']:.1f}s")
+    if job.get("gpu_util_mean") is not None:
+        parts.append(f"gpu_util={job['gpu_util_mean']:.0f}%")
+    if job.get("gpu_mem_peak") is not None:
+        parts.append(f"gpu_mem={job['gpu_mem_peak']}MB")
+    if job.get("gpu_seconds"):
+        parts.append(f"gpu_s={job['gpu_seconds']:.0f}")
+    return "".join(f" {p}" for p in parts)
+
+
+@main.group("cache")
+def cache_group():
+    """Inspect or clear the result cache"""
+    pass
+
+
+@cache_group.command("stats")
+def cache_stats():
+    """Show result cache usage"""
+    from . import cache
+    from .usage import format_bytes
+
+    info = cache.stats()
+    console.print(
+        f"entries={info['entries']}/{info['max_entries']} "
+        f"size={format_bytes(info['bytes'])}/{format_bytes(info['max_bytes'])} "
+        f"dir={info['dir']}"
+    )
+
+
+@cache_group.command("clear")
+def cache_clear():
+    """Delete all cached results"""
+    from . import cache
+
+    removed = cache.clear()
+    console.print(f"[green]Removed {removed} cache entries.[/]")
+
+
 @main.group()
 def daemon():
     """Manage the ravel daemon"""
@@ -489,7 +564,7 @@ def daemon_show_status(verbose: bool):
     if not verbose:
         return
     from .store import list_recent_jobs
-    from .daemon import _read_pid
+    from .lifecycle import _read_pid
     pid = _read_pid()
     console.print(f"pid={pid if pid else '-'}")
     console.print(f"db={os.environ.get('RAVEL_DB_PATH', '') or 'default'}")
@@ -499,23 +574,303 @@ def daemon_show_status(verbose: bool):
         console.print(
             f"last_job={job['id']} status={job['status']} created={job.get('created_at','-')}"
         )
+    _print_admission_status()
+
+
+@daemon.command("profile")
+@click.option("--duration", "-d", default=30.0, type=float, help="Seconds to record")
+@click.option("--output", "-o", default=None, help="Chrome/Perfetto trace file (default: state dir)")
+def daemon_profile(duration: float, output: Optional[str]):
+    """Record a span profile of the running daemon"""
+    import json
+
+    from rich.table import Table
+
+    from . import profiler
+    from .lifecycle import request_profile
+
+    output = os.path.abspath(output) if output else profiler.default_output()
+    summary_file = profiler.summary_path(output)
+    for stale in (output, summary_file):
+        if os.path.exists(stale):
+            os.remove(stale)
+    if not request_profile(duration, output):
+        raise click.ClickException("daemon is not running (or cannot be signalled on this platform)")
+    console.print(f"[dim]Profiling daemon for {duration:g}s...[/]")
+    deadline = time.monotonic() + duration + 30
+    while not os.path.exists(summary_file):
+        if time.monotonic() > deadline:
+            raise click.ClickException("daemon did not write the profile")
+        time.sleep(0.5)
+    with open(summary_file, "r") as handle:
+        summary = json.load(handle)
+
+    table = Table(title=f"Daemon profile ({summary['duration']:g}s)")
+    for column in ("phase", "calls", "total ms", "mean ms", "p95 ms", "max ms", "% wall"):
+        table.add_column(column, justify="left" if column == "phase" else "right")
+    wall_ms = max(summary["duration"] * 1000, 1e-9)
+    for row in summary["phases"]:
+        table.add_row(
+            row["name"],
+            str(row["calls"]),
+            f"{row['total_ms']:.1f}",
+            f"{row['mean_ms']:.3f}",
+            f"{row['p95_ms']:.3f}",
+            f"{row['max_ms']:.3f}",
+            f"{row['total_ms'] / wall_ms * 100:.1f}",
+        )
+    console.print(table)
+    console.print(f"Trace: {output} (open in ui.perfetto.dev or chrome://tracing)")
+
+
+def _print_admission_status() -> None:
+    from .store import ADMISSION_LIMITS, admission_status
+
+    info = admission_status()
+    limits = info["limits"]
+    limit_text = " ".join(
+        f"{name}={limits[name]:g}" if name in limits else f"{name}=unlimited"
+        for name in ADMISSION_LIMITS
+    )
+    console.print(f"admission: {limit_text}")
+    console.print(f"queued={info['queued']}")
+    for user, queued in info["queued_by_user"].items():
+        cap = limits.get("max_queued_per_user")
+        cap_text = f"/{cap:g}" if cap else ""
+        console.print(f"  {user}: {queued}{cap_text} queued")
+
+
+@main.command()
+@click.option("--max-queued", type=float, default=None, help="Max queued jobs in total (0 = unlimited)")
+@click.option("--max-queued-per-user", type=float, default=None, help="Max queued jobs per user (0 = unlimited)")
+@click.option("--max-submit-rate", type=float, default=None, help="Max submissions per second per user (0 = unlimited)")
+@click.option("--reset", is_flag=True, help="Remove stored limits (env vars apply again)")
+def limits(
+    max_queued: Optional[float],
+    max_queued_per_user: Optional[float],
+    max_submit_rate: Optional[float],
+    reset: bool,
+):
+    """Show or set queue admission limits"""
+    from .store import ADMISSION_LIMITS, set_admission_limit
+
+    if reset:
+        for name in ADMISSION_LIMITS:
+            set_admission_limit(name, None)
+    updates = {
+        "max_queued": max_queued,
+        "max_queued_per_user": max_queued_per_user,
+        "max_submit_rate": max_submit_rate,
+    }
+    for name, value in updates.items():
+        if value is not None:
+            set_admission_limit(name, max(0.0, value))
+    _print_admission_status()
+
+
+@main.command()
+@click.option(
+    "--by",
+    "dimension",
+    type=click.Choice(["all", "user", "tag", "script"]),
+    default="all",
+    help="Group finished jobs by this field",
+)
+@click.option("--since", default="7d", help="Window to report, e.g. 24h, 7d or 30d")
+@click.option("--rebuild", is_flag=True, help="Recompute the rollups from the jobs table first")
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON")
+def stats(dimension: str, since: str, rebuild: bool, as_json: bool):
+    """Summarize finished jobs from the hourly/daily rollups"""
+    import json
+    from datetime import timedelta
+
+    from rich.table import Table
+
+    from .history import format_runtime
+    from .store import job_stats, rebuild_rollups
+    from .utils import current_time
+
+    try:
+        window = parse_duration(since)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="--since")
+    if rebuild:
+        console.print(f"Rebuilt rollups from {rebuild_rollups()} finished jobs.")
+    rows = job_stats(dimension, since=current_time() - timedelta(seconds=window))
+    if as_json:
+        click.echo(json.dumps({"by": dimension, "since": since, "stats": rows}, indent=2))
+        return
+    if not rows:
+        console.print(f"No jobs finished in the last {since}.")
+        return
+
+    table = Table(title=f"Finished jobs, last {since}")
+    table.add_column(dimension if dimension != "all" else "")
+    for name in ("jobs", "failed", "fail %", "GPU h", "wait p50", "wait p95", "run p50", "run p95"):
+        table.add_column(name, justify="right")
+    for row in rows:
+        table.add_row(
+            row["key"] or "-",
+            str(row["jobs"]),
+            str(row["failed"]),
+            f"{100 * row['failure_rate']:.1f}",
+            f"{row['gpu_hours']:.1f}",
+            format_runtime(row["wait_p50"]),
+            format_runtime(row["wait_p95"]),
+            format_runtime(row["runtime_p50"]),
+            format_runtime(row["runtime_p95"]),
+        )
+    console.print(table)
 
 
-def _wait_for_job(job_id: str) -> None:
+@main.command()
+@click.argument("trace_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--policy",
+    "policies",
+    multiple=True,
+    help="Override as KEY=VALUE, e.g. max_workers=8, memory_limits=large=2, backfill=1, priority.alice=5 (repeatable)",
+)
+@click.option("--gpus", "-g", type=int, default=None, help="GPUs to simulate (default: from the trace)")
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON")
+def simulate(trace_file: str, policies: tuple, gpus: Optional[int], as_json: bool):
+    """Replay a recorded trace against the scheduler in virtual time"""
+    import json
+
+    from rich.table import Table
+
+    from .simulate import parse_policy, simulate as run_simulation
+
+    try:
+        report = run_simulation(trace_file, parse_policy(list(policies)), gpus=gpus)
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    policy_text = " ".join(f"{k}={v}" for k, v in report["policy"].items()) or "current environment"
+    table = Table(title=f"{report['jobs']} jobs on {report['gpus']} GPUs — {policy_text}")
+    table.add_column("metric")
+    table.add_column("recorded", justify="right")
+    table.add_column("simulated", justify="right")
+    keys = ["started", "unscheduled", "makespan", "utilization", "wait_mean", "wait_p50", "wait_p90", "wait_p99", "fairness"]
+    for key in keys:
+        table.add_row(
+            key,
+            str(report["recorded"].get(key, "-")),
+            str(report["simulated"].get(key, "-")),
+        )
+    console.print(table)
+
+
+def _admit(block_timeout: float, submit_fn, *args, **kwargs) -> str:
+    from .store import AdmissionError
+
+    deadline = time.monotonic() + max(0.0, block_timeout)
+    delay = 0.1
+    announced = False
     while True:
-        job = get_job(job_id)
-        if not job:
-            time.sleep(0.3)
-            continue
-        if job["status"] in {"done", "failed"}:
-            if job["stdout"]:
-                console.print(job["stdout"].strip())
-            if job["stderr"]:
-                console.print(f"[red]{job['stderr'].strip()}[/]")
-            status = job["status"]
-            console.print(f"[bold green]Finished[/] {job_id} — {status}")
-            return
-        time.sleep(0.3)
+        try:
+            return submit_fn(*args, **kwargs)
+        except ValueError as exc:
+            console.print(f"[red]Invalid job:[/] {exc}")
+            raise SystemExit(2)
+        except AdmissionError as exc:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                console.print(f"[red]Rejected by admission control:[/] {exc}")
+                raise SystemExit(2)
+            if not announced:
+                console.print(f"[yellow]Waiting for queue capacity:[/] {exc}")
+                announced = True
+            pause = exc.retry_after if exc.retry_after else delay
+            time.sleep(min(remaining, max(0.05, pause)))
+            delay = min(delay * 2, 2.0)
+
+
+def _wait_for_jobs(
+    job_ids: list[str],
+    show_output: bool = True,
+    timeout: Optional[float] = None,
+    poll_interval: float = 0.3,
+) -> dict[str, int]:
+    """Wait for all ``job_ids`` and print each result as it finishes.
+
+    Each wakeup costs one ``PRAGMA data_version``; the store is only queried,
+    with one batched query, when another process has committed since.
+    Returns the number of jobs per final status (``missing``/``pending`` for
+    ids that are unknown or removed while waiting, and jobs still unfinished
+    at the timeout).
+    """
+    from .store import FINISHED_STATUSES, data_version, get_jobs
+
+    pending = set(job_ids)
+    counts: dict[str, int] = {}
+    known = {job["id"] for job in get_jobs(list(pending))}
+    for job_id in sorted(pending - known):
+        console.print(f"[yellow]Unknown job {job_id}[/]")
+        counts["missing"] = counts.get("missing", 0) + 1
+    pending &= known
+
+    progress = None
+    if len(pending) > 1 and console.is_terminal:
+        from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeElapsedColumn
+
+        progress = Progress(
+            TextColumn("[bold]waiting"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TimeElapsedColumn(),
+            console=console,
+            transient=True,
+        )
+        task = progress.add_task("wait", total=len(pending))
+        progress.start()
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    version = None
+    try:
+        while pending:
+            current = data_version()
+            if current != version:
+                version = current
+                jobs = get_jobs(list(pending))
+                # A job removed by `ravel clear` will never finish.
+                for job_id in sorted(pending - {job["id"] for job in jobs}):
+                    pending.discard(job_id)
+                    console.print(f"[yellow]Job {job_id} was removed[/]")
+                    counts["missing"] = counts.get("missing", 0) + 1
+                    if progress:
+                        progress.advance(task)
+                for job in jobs:
+                    if job["status"] not in FINISHED_STATUSES:
+                        continue
+                    pending.discard(job["id"])
+                    counts[job["status"]] = counts.get(job["status"], 0) + 1
+                    _print_result(job, show_output)
+                    if progress:
+                        progress.advance(task)
+            if not pending:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                counts["pending"] = len(pending)
+                break
+            time.sleep(poll_interval)
+    finally:
+        if progress:
+            progress.stop()
+    return counts
+
+
+def _print_result(job: dict, show_output: bool) -> None:
+    if show_output:
+        if job["stdout"]:
+            console.print(job["stdout"].strip())
+        if job["stderr"]:
+            console.print(f"[red]{job['stderr'].strip()}[/]")
+    status = job["status"]
+    console.print(f"[bold green]Finished[/] {job['id']} — {status}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,295 @@
+"""In-process client for submitting jobs and collecting their results.
+
+``Client.submit()`` queues a job and returns a ``JobHandle``, which is a
+``concurrent.futures.Future`` (so ``result()``, ``done()``,
+``add_done_callback()``, ``concurrent.futures.wait()`` and
+``as_completed()`` work) and can also be awaited from asyncio;
+``submit_fn()`` handles resolve to the function's return value. All handles
+of a client are resolved by one watcher thread that follows the
+``job_events`` change feed: each wakeup costs one ``PRAGMA data_version``,
+and only jobs that actually changed are read back.
+"""
+import asyncio
+import os
+import shlex
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+
+from .store import FINISHED_STATUSES, data_version, get_jobs, job_events_since, latest_job_event
+from .utils import parse_duration
+POLL_INTERVAL = 0.2
+MAX_EVENTS = 5000
+
+
+class JobResult(NamedTuple):
+    id: str
+    status: str
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    command: List[str]
+    created_at: Optional[str]
+    started_at: Optional[str]
+    finished_at: Optional[str]
+    gpus_assigned: List[int]
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("done", "cached")
+
+    @classmethod
+    def from_job(cls, job: Dict) -> "JobResult":
+        return cls(
+            id=job["id"],
+            status=job["status"],
+            returncode=job.get("returncode"),
+            stdout=job.get("stdout") or "",
+            stderr=job.get("stderr") or "",
+            command=job["command"],
+            created_at=job.get("created_at"),
+            started_at=job.get("started_at"),
+            finished_at=job.get("finished_at"),
+            gpus_assigned=job.get("gpus_assigned") or [],
+        )
+
+
+class JobError(Exception):
+    """A ``submit_fn`` job ended without a return value or exception of its own."""
+
+    def __init__(self, result: JobResult):
+        super().__init__(f"job {result.id} {result.status} (returncode {result.returncode})")
+        self.result = result
+
+
+class JobHandle(Future):
+    """A queued job; resolves to its ``JobResult`` once it finishes."""
+
+    def __init__(self, job_id: str):
+        super().__init__()
+        self.id = job_id
+        self.job: Optional[JobResult] = None
+
+    def _finish(self, result: JobResult) -> None:
+        self.job = result
+        self.set_result(result)
+
+    def cancel(self) -> bool:
+        # The job keeps running either way; stop it with ``ravel stop``.
+        return False
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+    def __repr__(self) -> str:
+        state = self.job.status if self.job else "pending"
+        return f"<{type(self).__name__} {self.id} {state}>"
+
+
+class FunctionHandle(JobHandle):
+    """A ``submit_fn`` job; resolves to the function's return value or exception."""
+
+    def _finish(self, result: JobResult) -> None:
+        from .store import get_job_result
+        from .worker import load_result
+
+        self.job = result
+        data = get_job_result(self.id)
+        if data is None:
+            self.set_exception(JobError(result))
+            return
+        try:
+            value = load_result(data)
+        except BaseException as exc:
+            self.set_exception(exc)
+        else:
+            self.set_result(value)
+
+
+class _Watcher:
+    """One thread that resolves every pending handle of a client."""
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._handles: Dict[str, List[JobHandle]] = {}
+        self._unchecked: set = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._seq: Optional[int] = None
+        self._version: Optional[int] = None
+        self._closed = False
+
+    def watch(self, handles: Iterable[JobHandle]) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("client is closed")
+            for handle in handles:
+                self._handles.setdefault(handle.id, []).append(handle)
+                # New ids are read once directly, since they may have finished
+                # before the change feed position the watcher holds.
+                self._unchecked.add(handle.id)
+            if self._thread is None and self._handles and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="ravel-client", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        # Nothing resolves these any more; fail them rather than leave
+        # ``result()`` and ``await`` waiting forever.
+        self._fail_all(RuntimeError("client closed"))
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._closed or not self._handles:
+                    self._thread = None
+                    self._seq = self._version = None
+                    return
+            try:
+                self.tick()
+            except Exception as exc:
+                self._fail_all(exc)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def tick(self) -> None:
+        if self._seq is None:
+            self._seq = latest_job_event()
+        with self._lock:
+            unchecked, self._unchecked = self._unchecked, set()
+        version = data_version()
+        changed: set = set()
+        removed: set = set()
+        if version != self._version:
+            events, complete = job_events_since(self._seq, limit=MAX_EVENTS)
+            if complete:
+                for seq, job_id, status in events:
+                    if status is None:
+                        removed.add(job_id)
+                        changed.discard(job_id)
+                    elif status in FINISHED_STATUSES:
+                        changed.add(job_id)
+                        removed.discard(job_id)
+                if events:
+                    self._seq = events[-1][0]
+                if len(events) < MAX_EVENTS:
+                    self._version = version
+            else:
+                # The feed was pruned or is far ahead: re-read every pending job.
+                self._seq = latest_job_event()
+                self._version = version
+                with self._lock:
+                    unchecked |= set(self._handles)
+        with self._lock:
+            wanted = [job_id for job_id in unchecked | changed if job_id in self._handles]
+        found = {job["id"]: job for job in get_jobs(wanted)} if wanted else {}
+        for job_id in wanted:
+            job = found.get(job_id)
+            if job is None:
+                if job_id in unchecked or job_id in removed:
+                    self._resolve(job_id, exception=KeyError(f"job {job_id} does not exist"))
+            elif job["status"] in FINISHED_STATUSES:
+                self._resolve(job_id, result=JobResult.from_job(job))
+        for job_id in removed - set(wanted):
+            self._resolve(job_id, exception=KeyError(f"job {job_id} was removed"))
+
+    def _resolve(self, job_id: str, result: Optional[JobResult] = None, exception: Optional[BaseException] = None) -> None:
+        with self._lock:
+            handles = self._handles.pop(job_id, [])
+        for handle in handles:
+            if exception is not None:
+                handle.set_exception(exception)
+            else:
+                handle._finish(result)
+
+    def _fail_all(self, exc: BaseException) -> None:
+        with self._lock:
+            job_ids = list(self._handles)
+        for job_id in job_ids:
+            self._resolve(job_id, exception=exc)
+
+
+JobSpec = Dict
+
+
+class Client:
+    """Submit jobs from Python and wait on them without polling per job.
+
+    ``submit()`` takes the options of ``ravel run``; ``command`` is a list or
+    a string split like the shell would. ``depends_on`` accepts job ids or
+    handles. Submission goes through ``scheduler.submit_jobs``, so
+    ``RAVEL_RPC`` and admission limits apply (``AdmissionError`` is raised).
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL, start_daemon: bool = True):
+        self._watcher = _Watcher(poll_interval)
+        self._start_daemon = start_daemon
+        self._daemon_checked = False
+
+    def submit(self, command: Union[str, List[str]], **options) -> JobHandle:
+        return self.submit_many([dict(options, command=command)])[0]
+
+    def submit_many(self, jobs: List[JobSpec]) -> List[JobHandle]:
+        """Queue ``jobs`` in one transaction; a ``name`` lets later entries depend on it."""
+        return self._submit([_normalize(job) for job in jobs], JobHandle)
+
+    def submit_fn(self, func: Callable, *args, **options) -> FunctionHandle:
+        """Run ``func(*args)`` in a pooled worker; ``options`` are those of ``submit()``.
+
+        Pass keyword arguments with ``functools.partial``. Without
+        ``cloudpickle`` the function must be importable by the worker.
+        """
+        from .worker import task_command, write_task
+
+        command = task_command(write_task(func, args, {}))
+        return self._submit([_normalize(dict(options, command=command))], FunctionHandle)[0]
+
+    def _submit(self, jobs: List[Dict], handle_type: type) -> List:
+        from .scheduler import submit_jobs
+
+        job_ids = submit_jobs(jobs)
+        handles = [handle_type(job_id) for job_id in job_ids]
+        self._ensure_daemon()
+        self._watcher.watch(handles)
+        return handles
+
+    def get(self, job_id: str) -> JobHandle:
+        """A handle for an existing job; it fails with ``KeyError`` if there is none."""
+        handle = JobHandle(job_id)
+        self._watcher.watch([handle])
+        return handle
+
+    def close(self) -> None:
+        """Stop watching; handles still pending fail with ``RuntimeError``."""
+        self._watcher.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _ensure_daemon(self) -> None:
+        if not self._start_daemon or self._daemon_checked:
+            return
+        from .lifecycle import daemon_running, start_daemon
+
+        if not daemon_running():
+            start_daemon()
+        self._daemon_checked = True
+
+
+def _normalize(job: JobSpec) -> Dict:
+    job = dict(job)
+    command = job["command"]
+    job["command"] = shlex.split(command) if isinstance(command, str) else list(command)
+    job.setdefault("cwd", os.getcwd())
+    if job.get("depends_on"):
+        job["depends_on"] = [d.id if isinstance(d, JobHandle) else d for d in job["depends_on"]]
+    if isinstance(job.get("time_limit"), str):
+        job["time_limit"] = parse_duration(job["time_limit"])
+    return job
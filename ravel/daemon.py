@@ -1,95 +1,50 @@
 import os
 import signal
 import subprocess
-import sys
+import threading
 import time
 from concurrent.futures import Future, ThreadPoolExecutor
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional
 
+from . import cache, metrics, profiler, rpc, spool, telemetry, trace
 from .store import (
+    count_jobs_by_status_and_tag,
     db_path,
+    get_cache_entry,
+    get_dependencies,
     get_job,
+    get_jobs,
+    job_events_since,
+    latest_job_event,
     list_jobs,
     list_ready_jobs,
     mark_blocked_jobs_due_to_failed_deps,
+    prune_job_events,
+    prune_rollups,
+    requeue_job,
+    set_job_cache_key,
     set_job_finished,
     set_job_pid,
+    set_job_usage,
     try_claim_job,
 )
-from .utils import console, get_free_gpus
-
-
-def _state_dir() -> str:
-    return os.environ.get(
-        "RAVEL_STATE_DIR",
-        os.path.join(os.path.expanduser("~"), ".ravel"),
-    )
-
-def _pid_path() -> str:
-    return os.path.join(_state_dir(), "daemon.pid")
-
-def _log_path() -> str:
-    return os.path.join(_state_dir(), "daemon.log")
-
-def daemon_running() -> bool:
-    pid = _read_pid()
-    if not pid:
-        return False
-    if os.name == "nt":
-        try:
-            import psutil
-            if psutil.pid_exists(pid):
-                return True
-        except Exception:
-            pass
-        _clear_pid()
-        return False
-    try:
-        os.kill(pid, 0)
-        return True
-    except OSError:
-        _clear_pid()
-        return False
-
-def start_daemon() -> None:
-    os.makedirs(_state_dir(), exist_ok=True)
-    if daemon_running():
-        console.print("[yellow]Daemon already running[/]")
-        return
-    log = open(_log_path(), "a", buffering=1)
-    proc = subprocess.Popen(
-        [sys.executable, "-m", "ravel.daemon"],
-        stdout=log,
-        stderr=log,
-        stdin=subprocess.DEVNULL,
-        start_new_session=True,
-        close_fds=True,
-    )
-    _write_pid(proc.pid)
-    console.print(f"[green]Daemon started[/] (pid {proc.pid})")
-
-def stop_daemon() -> None:
-    pid = _read_pid()
-    if not pid:
-        console.print("[yellow]Daemon not running[/]")
-        return
-    try:
-        if os.name == "nt":
-            import psutil
-            proc = psutil.Process(pid)
-            proc.terminate()
-            proc.wait(timeout=10)
-        else:
-            os.kill(pid, signal.SIGTERM)
-        console.print("[green]Daemon stopped[/]")
-    except OSError:
-        console.print("[yellow]Daemon already stopped[/]")
-    _clear_pid()
+from .topology import allocate_cpus, pinned_thread
+from .usage import start_sampler
+from .zygote import get_zygote, zygote_target
+from .worker import get_pool, task_path
+from .lifecycle import (  # noqa: F401 - re-exported for callers of ravel.daemon
+    _clear_pid,
+    _read_pid,
+    _write_pid,
+    daemon_running,
+    daemon_status,
+    request_profile,
+    start_daemon,
+    stop_daemon,
+)
+from .utils import console, current_time, get_free_gpus
 
-def daemon_status() -> str:
-    if daemon_running():
-        return "running"
-    return "stopped"
 
 def run_daemon_forever(poll_interval: float = 1.0) -> None:
     _ensure_stdio()
@@ -97,12 +52,66 @@ def run_daemon_forever(poll_interval: float = 1.0) -> None:
     max_workers = _get_max_workers()
     executor = ThreadPoolExecutor(max_workers=max_workers)
     active: set[Future] = set()
+    zygote = get_zygote()
+    if zygote:
+        zygote.ensure_started()
+    port = metrics.metrics_port()
+    if port:
+        host = os.getenv("RAVEL_METRICS_HOST", "127.0.0.1")
+        try:
+            metrics.serve(port, host=host)
+            console.print(f"[dim]metrics on http://{host}:{port}/metrics[/]")
+        except OSError as exc:
+            console.print(f"[yellow]Could not serve metrics on port {port}: {exc}[/]")
+    if hasattr(rpc.socket, "AF_UNIX"):
+        try:
+            rpc.serve()
+        except OSError as exc:
+            console.print(f"[yellow]Could not listen on {rpc.socket_path()}: {exc}[/]")
+    try:
+        telemetry.start_sampler()
+    except (OSError, ValueError) as exc:
+        console.print(f"[yellow]Could not start telemetry sampler: {exc}[/]")
+    profiler.install_signal_handler()
+    next_refresh = 0.0
     while True:
+        profiler.poll()
+        if time.monotonic() >= next_refresh:
+            refresh_metrics()
+            _prune_history()
+            _reap_idle_workers()
+            next_refresh = time.monotonic() + metrics.refresh_interval()
         active = {f for f in active if not f.done()}
         did_work = run_once(executor=executor, active_futures=active)
         if not did_work:
             time.sleep(poll_interval)
 
+def refresh_metrics() -> None:
+    """Refresh queue-depth gauges and write the snapshot served by ravel_web."""
+    try:
+        counts = count_jobs_by_status_and_tag()
+    except Exception as exc:
+        console.print(f"[yellow]Could not refresh metrics: {exc}[/]")
+        return
+    metrics.QUEUE_JOBS.replace({(status, tag): n for status, tag, n in counts})
+    try:
+        metrics.write_snapshot()
+    except OSError as exc:
+        console.print(f"[yellow]Could not write metrics snapshot: {exc}[/]")
+
+def _prune_history() -> None:
+    """Keep the job_events backlog and the hourly rollups bounded."""
+    try:
+        prune_job_events()
+        prune_rollups()
+    except Exception as exc:
+        console.print(f"[yellow]Could not prune job history: {exc}[/]")
+
+def _reap_idle_workers() -> None:
+    pool = get_pool()
+    if pool:
+        pool.reap_idle()
+
 def run_once(
     executor: Optional[ThreadPoolExecutor] = None,
     active_futures: Optional[set[Future]] = None,
@@ -112,6 +121,7 @@ def run_once(
     active_futures = active_futures or set()
     if executor is None and not inline:
         executor = ThreadPoolExecutor(max_workers=max_workers)
+    tick_start = time.perf_counter()
 
     mark_blocked_jobs_due_to_failed_deps()
 
@@ -119,73 +129,445 @@ def run_once(
     running = list_jobs(["running"])
     running_count = len(running)
     slots = max(0, max_workers - running_count - len(active_futures))
-    if slots <= 0:
-        return False
 
     memory_limits = _parse_memory_limits(os.getenv("RAVEL_MEMORY_LIMITS", ""))
     running_by_tag = _count_running_by_memory_tag(running)
     reserved_gpus = _reserved_gpus(running)
-
-    for job in list_ready_jobs(limit=slots * 2 or 1):
+    reserved_cpus = _reserved_cpus(running)
+
+    backfill = _backfill_enabled()
+    reservation: Optional[_Reservation] = None
+    now = current_time()
+    recorder = trace.get_writer()
+    if recorder:
+        _trace_submissions(recorder, now)
+
+    for job in list_ready_jobs(limit=max(1, slots) * 2):
+        # Cache hits finish here, without a worker slot, GPUs or cores.
+        if job.get("cache"):
+            checked = _check_cache(job, inline)
+            if checked is None:
+                continue
+            if checked:
+                did_work = True
+                continue
         if slots <= 0:
             break
         if not _memory_tag_available(job.get("memory_tag"), memory_limits, running_by_tag):
             continue
-        free = get_free_gpus(job["gpus"], reserved=reserved_gpus)
+        blocked = reserved_gpus
+        if reservation and not _finishes_before(job, reservation.until, now):
+            blocked = reserved_gpus | reservation.gpus
+        with profiler.span("run_once.get_free_gpus"):
+            free = get_free_gpus(job["gpus"], reserved=blocked)
         if len(free) < job["gpus"]:
+            if backfill and reservation is None:
+                reservation = _reserve_gpus(job, free, running, now)
             continue
-        if not try_claim_job(job["id"], free):
+        cores: list[int] = []
+        if job.get("cpus"):
+            with profiler.span("run_once.allocate_cpus"):
+                cores = allocate_cpus(job["cpus"], reserved=reserved_cpus, gpus=free)
+            if len(cores) < job["cpus"]:
+                continue
+        if not try_claim_job(job["id"], free, cores):
+            metrics.CLAIM_CONFLICTS.inc()
             continue
+        metrics.JOBS_STARTED.inc()
+        waited = _seconds_since(job.get("created_at"), now)
+        if waited is not None:
+            metrics.QUEUE_WAIT_SECONDS.observe(waited, memory_tag=job.get("memory_tag") or "")
+        if recorder:
+            recorder.start(job["id"], now.timestamp(), free)
 
         reserved_gpus.update(free)
+        reserved_cpus.update(cores)
         if job.get("memory_tag"):
             running_by_tag[job["memory_tag"]] = running_by_tag.get(job["memory_tag"], 0) + 1
 
         if executor and not inline:
-            future = executor.submit(_run_job, job_id=job["id"], gpus_assigned=free)
+            future = executor.submit(
+                profiler.handoff(_run_job), job_id=job["id"], gpus_assigned=free, cpus_assigned=cores
+            )
             active_futures.add(future)
         else:
-            _run_job(job_id=job["id"], gpus_assigned=free)
+            _run_job(job_id=job["id"], gpus_assigned=free, cpus_assigned=cores)
         did_work = True
         slots -= 1
 
+    _record_gpu_allocation(reserved_gpus)
+    if recorder:
+        recorder.gpus(now.timestamp(), int(metrics.GPUS_TOTAL.value() or 0), len(reserved_gpus))
+    _finish_tick(tick_start)
     return did_work
 
-def _run_job(job_id: str, gpus_assigned: list[int]) -> None:
+def _trace_submissions(recorder: trace.TraceWriter, now: datetime) -> None:
+    """Write SUBMIT for jobs queued since the last tick and FINISH for jobs blocked.
+
+    Follows ``job_events``, so jobs from every submitter are traced with their
+    real ``created_at`` whether or not they ever start. On the first call, or
+    when the feed was pruned past the last position, every queued job is
+    (re)written instead.
+    """
+    queued: list[str] = []
+    blocked: list[str] = []
+    events, complete = ([], False)
+    if recorder.events_seq is not None:
+        events, complete = job_events_since(recorder.events_seq)
+    if complete:
+        for seq, job_id, status in events:
+            if status == "queued":
+                queued.append(job_id)
+            elif status == "blocked":
+                blocked.append(job_id)
+        if events:
+            recorder.events_seq = events[-1][0]
+        jobs = get_jobs(list(dict.fromkeys(queued)))
+    else:
+        recorder.events_seq = latest_job_event()
+        jobs = list_jobs(["queued"])
+    deps = get_dependencies([job["id"] for job in jobs])
+    for job in sorted(jobs, key=lambda j: j.get("created_at") or ""):
+        recorder.submit(job, deps.get(job["id"], []))
+    for job_id in dict.fromkeys(blocked):
+        recorder.finish(job_id, now.timestamp(), "blocked", 0.0)
+
+def _finish_tick(tick_start: float) -> None:
+    end = time.perf_counter()
+    metrics.DISPATCH_TICK_SECONDS.observe(end - tick_start)
+    profiler.record("run_once", tick_start, end)
+
+def _record_gpu_allocation(reserved_gpus: set[int]) -> None:
+    metrics.GPUS_ALLOCATED.set(len(reserved_gpus))
+    total = metrics.GPUS_TOTAL.value()
+    if total:
+        metrics.GPU_ALLOCATION_RATIO.set(round(min(1.0, len(reserved_gpus) / total), 4))
+
+def _seconds_since(timestamp: Optional[str], now: datetime) -> Optional[float]:
+    if not timestamp:
+        return None
+    try:
+        return max(0.0, (now - datetime.fromisoformat(timestamp)).total_seconds())
+    except ValueError:
+        return None
+
+def _run_job(
+    job_id: str,
+    gpus_assigned: list[int],
+    cpus_assigned: Optional[list[int]] = None,
+) -> None:
     job = get_job(job_id)
     if not job:
         return
 
     env = os.environ.copy()
     env["NVIDIA_VISIBLE_DEVICES"] = ",".join(map(str, gpus_assigned))
-
+    env["RAVEL_JOB_ID"] = job_id
+    if cpus_assigned:
+        threads = str(len(cpus_assigned))
+        env["OMP_NUM_THREADS"] = threads
+        env["MKL_NUM_THREADS"] = threads
+
+    with profiler.span("job.cache_lookup"):
+        cache_key = _cache_key(job)
+        if cache_key and _finish_from_cache(job, cache_key):
+            return
+
+    sampler = None
+    cpu_seconds = None
+    started = time.monotonic()
+    out_file = err_file = None
+    raw_output: Dict[str, bytes] = {}
     try:
-        proc = subprocess.Popen(
-            job["command"],
-            shell=False,
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=job.get("cwd") or None,
-            env=env,
+        out_file, err_file = spool.open_spools(job_id)
+        spawn_start = time.perf_counter()
+        proc = (
+            _spawn_pool_task(job, env, gpus_assigned, cpus_assigned, out_file, err_file)
+            or _spawn_zygote_job(job, env, cpus_assigned, out_file, err_file)
         )
+        if proc is None:
+            # The child inherits this thread's mask, so it is pinned before it runs.
+            with pinned_thread(cpus_assigned or []):
+                proc = subprocess.Popen(
+                    job["command"],
+                    shell=False,
+                    stdin=subprocess.DEVNULL,
+                    stdout=out_file,
+                    stderr=err_file,
+                    text=True,
+                    cwd=job.get("cwd") or None,
+                    env=env,
+                    start_new_session=True,
+                )
+        profiler.record("job.spawn", spawn_start, time.perf_counter())
         set_job_pid(job_id, proc.pid)
-        stdout, stderr = proc.communicate()
+        # Pooled tasks run in a worker that already used CPU and memory.
+        sampler = start_sampler(proc.pid, gpus_assigned, baseline=getattr(proc, "usage_baseline", None))
+        wait_start = time.perf_counter()
+        timed_out = False
+        time_limit = job.get("time_limit")
+        if isinstance(proc, _POPEN) and hasattr(os, "wait4"):
+            timed_out, cpu_seconds = _wait_and_account(proc, time_limit)
+            stdout = stderr = None
+        elif time_limit:
+            try:
+                stdout, stderr = proc.communicate(timeout=time_limit)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                _terminate_process_group(proc)
+                stdout, stderr = proc.communicate()
+        else:
+            stdout, stderr = proc.communicate()
         returncode = proc.returncode
-        status = "done" if returncode == 0 else "failed"
+        profiler.record("job.wait", wait_start, time.perf_counter())
+        # Output went to the spool files unless the process object captured it.
+        if stdout is None:
+            raw_output["stdout"] = spool.read_spool_bytes(job_id, "stdout")
+            stdout = raw_output["stdout"].decode(errors="replace")
+        if stderr is None:
+            raw_output["stderr"] = spool.read_spool_bytes(job_id, "stderr")
+            stderr = raw_output["stderr"].decode(errors="replace")
+        if timed_out:
+            status = "timeout"
+            note = f"\nravel: time limit of {time_limit:g}s exceeded\n"
+            stderr = (stderr or "") + note
+            if "stderr" in raw_output:
+                raw_output["stderr"] += note.encode()
+        else:
+            status = "done" if returncode == 0 else "failed"
     except Exception as exc:
         status = "failed"
         stdout = ""
         stderr = str(exc)
         returncode = None
+        raw_output = {}
+    finally:
+        for handle in (out_file, err_file):
+            if handle is not None:
+                handle.close()
+
+    usage = sampler.stop(cpu_seconds) if sampler else None
+    if usage:
+        set_job_usage(job_id, usage)
+
+    if cache_key and status == "done":
+        try:
+            with profiler.span("job.cache_save"):
+                cache.save(cache_key, job, returncode, stdout, stderr)
+        except OSError as exc:
+            console.print(f"[yellow]Could not cache {job_id}: {exc}[/]")
 
+    runtime = time.monotonic() - started
     set_job_finished(
         job_id=job_id,
         status=status,
         returncode=returncode,
         stdout=stdout,
         stderr=stderr,
+        runtime=runtime,
+        raw_output=raw_output,
+    )
+    spool.remove_spools(job_id)
+    metrics.JOBS_FINISHED.inc(status=status)
+    metrics.JOB_RUNTIME_SECONDS.observe(runtime, status=status)
+    _trace_finish(job_id, status, runtime)
+
+def _trace_finish(job_id: str, status: str, runtime: float) -> None:
+    recorder = trace.get_writer()
+    if recorder:
+        recorder.finish(job_id, current_time().timestamp(), status, runtime)
+
+_POPEN = subprocess.Popen
+
+
+def _wait_and_account(proc: subprocess.Popen, time_limit: Optional[float]) -> tuple[bool, float]:
+    """Reap a job started with ``Popen``; return (timed out, CPU seconds).
+
+    ``os.wait4`` reports the CPU time of the job and of every descendant it
+    waited for, including time used after the sampler's last look. A time
+    limit sends SIGTERM to the process group, then SIGKILL after the grace.
+    """
+    exited = threading.Event()
+    expired = threading.Event()
+
+    def expire() -> None:
+        expired.set()
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except OSError:
+            return
+        if not exited.wait(_get_kill_grace()):
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    timer = threading.Timer(time_limit, expire) if time_limit else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    finally:
+        exited.set()
+        if timer:
+            timer.cancel()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return expired.is_set(), rusage.ru_utime + rusage.ru_stime
+
+
+def _terminate_process_group(proc) -> None:
+    grace = _get_kill_grace()
+    try:
+        if os.name == "nt":
+            proc.terminate()
+        else:
+            os.killpg(proc.pid, signal.SIGTERM)
+    except OSError:
+        return
+    try:
+        proc.wait(timeout=grace)
+        return
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        if os.name == "nt":
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    proc.wait()
+
+def _cache_key(job: dict) -> Optional[str]:
+    """Compute a cache job's key and store it on the row ("" if it has none)."""
+    if not job.get("cache"):
+        return None
+    try:
+        key = cache.job_key(job)
+    except OSError as exc:
+        console.print(f"[yellow]Could not hash inputs of {job['id']}: {exc}[/]")
+        key = None
+    set_job_cache_key(job["id"], key or "")
+    return key
+
+# Ids of jobs whose inputs are being hashed on the cache thread.
+_CACHE_CHECKS: set[str] = set()
+_CACHE_CHECKS_LOCK = threading.Lock()
+_CACHE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+
+def _check_cache(job: dict, inline: bool) -> Optional[bool]:
+    """Look a ready cache job up before it is given any resources.
+
+    Returns True if the job finished from the cache, False if it should be
+    dispatched, and None while its inputs are still being hashed. Hashing
+    runs on a cache thread so large inputs never stall the dispatch loop.
+    A job whose row already has a ``cache_key`` was checked before and is
+    dispatched; ``_run_job()`` still finds a result that appeared since.
+    """
+    global _CACHE_EXECUTOR
+    if job.get("cache_key") is not None:
+        return False
+    if inline:
+        return _finish_cached_unclaimed(job)
+    with _CACHE_CHECKS_LOCK:
+        if job["id"] not in _CACHE_CHECKS:
+            _CACHE_CHECKS.add(job["id"])
+            if _CACHE_EXECUTOR is None:
+                _CACHE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ravel-cache")
+            _CACHE_EXECUTOR.submit(_check_cache_in_background, job)
+    return None
+
+
+def _check_cache_in_background(job: dict) -> None:
+    try:
+        _finish_cached_unclaimed(job)
+    except Exception as exc:
+        console.print(f"[yellow]Cache lookup for {job['id']} failed: {exc}[/]")
+    finally:
+        with _CACHE_CHECKS_LOCK:
+            _CACHE_CHECKS.discard(job["id"])
+
+
+def _finish_cached_unclaimed(job: dict) -> bool:
+    """Finish a queued job from the cache without claiming any resources."""
+    with profiler.span("job.cache_lookup"):
+        cache_key = _cache_key(job)
+        if not cache_key or not get_cache_entry(cache_key):
+            return False
+        if not try_claim_job(job["id"], []):
+            return False
+        if _finish_from_cache(job, cache_key):
+            return True
+    # The entry could not be restored: queue the job again to run normally.
+    requeue_job(job["id"])
+    return False
+
+def _finish_from_cache(job: dict, cache_key: str) -> bool:
+    meta = cache.lookup(cache_key)
+    if not meta:
+        return False
+    try:
+        if not cache.restore(cache_key, meta):
+            return False
+    except OSError as exc:
+        console.print(f"[yellow]Could not restore cached outputs of {job['id']}: {exc}[/]")
+        return False
+    set_job_finished(
+        job_id=job["id"],
+        status="cached",
+        returncode=meta.get("returncode"),
+        stdout=meta.get("stdout") or "",
+        stderr=meta.get("stderr") or "",
+    )
+    metrics.JOBS_FINISHED.inc(status="cached")
+    _trace_finish(job["id"], "cached", 0.0)
+    return True
+
+def _spawn_zygote_job(
+    job: dict,
+    env: dict,
+    cpus_assigned: Optional[list[int]],
+    stdout=None,
+    stderr=None,
+):
+    zygote = get_zygote()
+    if not zygote:
+        return None
+    argv = zygote_target(job["command"], env)
+    if not argv:
+        return None
+    return zygote.spawn(
+        argv,
+        cwd=job.get("cwd") or None,
+        env=env,
+        cpus=cpus_assigned,
+        stdout=stdout,
+        stderr=stderr,
+    )
+
+def _spawn_pool_task(
+    job: dict,
+    env: dict,
+    gpus_assigned: list[int],
+    cpus_assigned: Optional[list[int]],
+    stdout,
+    stderr,
+):
+    path = task_path(job["command"])
+    pool = get_pool() if path else None
+    if not pool or stdout is None or stderr is None:
+        return None
+    return pool.submit(
+        path,
+        job["id"],
+        gpus=gpus_assigned,
+        env=env,
+        cwd=job.get("cwd") or None,
+        cpus=cpus_assigned,
+        stdout=stdout.name,
+        stderr=stderr.name,
     )
 
 def _ensure_stdio() -> None:
@@ -204,6 +586,61 @@ def _get_max_workers() -> int:
     except ValueError:
         return 1
 
+def _get_kill_grace() -> float:
+    try:
+        return max(0.0, float(os.getenv("RAVEL_KILL_GRACE", "10")))
+    except ValueError:
+        return 10.0
+
+def _backfill_enabled() -> bool:
+    return os.getenv("RAVEL_BACKFILL") == "1"
+
+class _Reservation(NamedTuple):
+    gpus: set[int]
+    until: Optional[datetime]
+
+def _expected_end(job: dict) -> Optional[datetime]:
+    if not job.get("time_limit") or not job.get("started_at"):
+        return None
+    try:
+        started = datetime.fromisoformat(job["started_at"])
+    except ValueError:
+        return None
+    return started + timedelta(seconds=job["time_limit"])
+
+def _reserve_gpus(
+    job: dict,
+    free: list[int],
+    running: list[dict],
+    now: datetime,
+) -> _Reservation:
+    """Hold the currently free GPUs for a job that does not fit yet.
+
+    ``until`` is the earliest time enough GPUs are expected to be released by
+    running jobs with a time limit; later jobs may still use the held GPUs if
+    their own limit ends before then (EASY backfill). Without enough declared
+    limits the GPUs are held with no backfill window.
+    """
+    needed = job["gpus"] - len(free)
+    released = 0
+    until = None
+    ends = []
+    for other in running:
+        end = _expected_end(other)
+        if end is not None:
+            ends.append((end, len(other.get("gpus_assigned", []))))
+    for end, count in sorted(ends):
+        released += count
+        if released >= needed:
+            until = max(end, now)
+            break
+    return _Reservation(gpus=set(free), until=until)
+
+def _finishes_before(job: dict, until: Optional[datetime], now: datetime) -> bool:
+    if until is None or not job.get("time_limit"):
+        return False
+    return now + timedelta(seconds=job["time_limit"]) <= until
+
 def _parse_memory_limits(value: str) -> dict[str, int]:
     limits: dict[str, int] = {}
     for part in value.split(","):
@@ -247,25 +684,12 @@ def _reserved_gpus(running: list[dict]) -> set[int]:
             reserved.add(gpu)
     return reserved
 
-def _write_pid(pid: int) -> None:
-    with open(_pid_path(), "w") as handle:
-        handle.write(str(pid))
-
-def _read_pid() -> Optional[int]:
-    try:
-        with open(_pid_path(), "r") as handle:
-            data = handle.read().strip()
-            return int(data) if data else None
-    except FileNotFoundError:
-        return None
-    except ValueError:
-        return None
-
-def _clear_pid() -> None:
-    try:
-        os.remove(_pid_path())
-    except FileNotFoundError:
-        pass
+def _reserved_cpus(running: list[dict]) -> set[int]:
+    reserved: set[int] = set()
+    for job in running:
+        for cpu in job.get("cpus_assigned", []):
+            reserved.add(cpu)
+    return reserved
 
 def main() -> None:
     run_daemon_forever()
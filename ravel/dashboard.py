@@ -1,55 +1,181 @@
+import os
 import select
 import sys
 import time
+from contextlib import contextmanager
 from rich.console import Console
 from rich.live import Live
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.table import Table
-from .store import list_jobs
+from .history import format_runtime
+from .store import count_jobs_by_status, data_version, list_jobs_window, predict_runtimes
+
+ACTIVE_STATUSES = ["running", "queued"]
+MAX_REFRESH = 5.0
+# Header panel (3), body panel borders (2), table title (1) and table borders/header (4).
+CHROME_ROWS = 10
+
+_KEYS = {
+    "q": "quit",
+    "k": "up",
+    "\x1b[A": "up",
+    "j": "down",
+    "\x1b[B": "down",
+    "\x1b[5~": "page_up",
+    "b": "page_up",
+    "\x1b[6~": "page_down",
+    " ": "page_down",
+    "g": "top",
+    "\x1b[H": "top",
+    "G": "bottom",
+    "\x1b[F": "bottom",
+}
+
 
 def dashboard(refresh=0.5):
     """Display the dashboard"""
     console = Console()
+    offset = 0
+    total = 0
+    last_version = None
+    last_view = None
+    last_frame = None
+    interval = refresh
     try:
-        with Live(
-            _render_dashboard([], [], [], []),
+        with _cbreak(), Live(
+            _render_dashboard({}, [], 0, 0),
             console=console,
-            refresh_per_second=max(1, int(1 / refresh)),
+            auto_refresh=False,
             screen=True,
         ) as live:
             while True:
-                if _stdin_closed():
+                visible = _visible_rows(console)
+                version = data_version()
+                changed = False
+                # Only query when another connection committed or the view moved,
+                # and only render when the visible frame differs from the last one.
+                if version != last_version or (offset, visible) != last_view:
+                    counts = count_jobs_by_status()
+                    total = sum(counts.get(s, 0) for s in ACTIVE_STATUSES)
+                    offset = _clamp(offset, total, visible)
+                    jobs = list_jobs_window(ACTIVE_STATUSES, offset, visible, counts=counts)
+                    predict_runtimes(jobs)
+                    rows = [_row_cells(job) for job in jobs]
+                    frame = (_header_cells(counts), rows, offset, total)
+                    if frame != last_frame:
+                        live.update(_render_dashboard(counts, rows, offset, total), refresh=True)
+                        last_frame = frame
+                        changed = True
+                    last_version, last_view = version, (offset, visible)
+                keys = _read_keys(interval)
+                if keys is None or "quit" in keys:
                     break
-                running = list_jobs(["running"])
-                queued = list_jobs(["queued"])
-                blocked = list_jobs(["blocked"])
-                failed = list_jobs(["failed"])
-                live.update(_render_dashboard(running, queued, blocked, failed))
-                time.sleep(refresh)
+                for key in keys:
+                    offset = _scroll(offset, key, visible, total)
+                # Back off while nothing changes; any change or key press resets.
+                interval = refresh if changed or keys else min(MAX_REFRESH, interval * 1.5)
     except KeyboardInterrupt:
         pass
 
-def _stdin_closed() -> bool:
+
+def _visible_rows(console: Console) -> int:
+    return max(1, console.size.height - CHROME_ROWS)
+
+
+def _clamp(offset: int, total: int, visible: int) -> int:
+    return max(0, min(offset, total - visible))
+
+
+def _scroll(offset: int, key: str, visible: int, total: int) -> int:
+    step = {
+        "up": -1,
+        "down": 1,
+        "page_up": -visible,
+        "page_down": visible,
+        "top": -total,
+        "bottom": total,
+    }.get(key, 0)
+    return _clamp(offset + step, total, visible)
+
+
+@contextmanager
+def _cbreak():
+    """Deliver keys without Enter while the dashboard is open (POSIX terminals)."""
+    try:
+        import termios
+        import tty
+    except ImportError:
+        yield
+        return
+    if not sys.stdin or sys.stdin.closed or not sys.stdin.isatty():
+        yield
+        return
+    fd = sys.stdin.fileno()
+    saved = termios.tcgetattr(fd)
+    tty.setcbreak(fd)
+    try:
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+
+
+def _read_keys(timeout: float):
+    """Wait up to ``timeout`` for key presses; ``None`` once stdin is closed."""
     if not sys.stdin or sys.stdin.closed:
-        return True
+        return None
     if not sys.stdin.isatty():
-        return False
+        time.sleep(timeout)
+        return []
     try:
-        ready, _, _ = select.select([sys.stdin], [], [], 0)
-        if ready:
-            data = sys.stdin.read(1)
-            return data == ""
-    except Exception:
-        return False
-    return False
+        ready, _, _ = select.select([sys.stdin], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(sys.stdin.fileno(), 64).decode(errors="ignore")
+    except (OSError, ValueError):
+        time.sleep(timeout)
+        return []
+    if data == "":
+        return None
+    return _parse_keys(data)
+
+
+def _parse_keys(data: str) -> list[str]:
+    keys = []
+    idx = 0
+    while idx < len(data):
+        for length in (4, 3, 1):
+            action = _KEYS.get(data[idx:idx + length])
+            if action:
+                keys.append(action)
+                idx += length
+                break
+        else:
+            idx += 1
+    return keys
+
+
+def _header_cells(counts: dict) -> tuple:
+    return tuple(counts.get(s, 0) for s in ("running", "queued", "blocked", "failed"))
+
+
+def _row_cells(job: dict) -> tuple:
+    return (
+        job["status"],
+        job["id"],
+        str(job.get("gpus", "-")),
+        str(job.get("priority", 0)),
+        job.get("created_at", "-"),
+        format_runtime(job.get("predicted_runtime")),
+        _truncate_command(job.get("command", [])),
+    )
 
 
 def _render_dashboard(
-    running: list[dict],
-    queued: list[dict],
-    blocked: list[dict],
-    failed: list[dict],
+    counts: dict,
+    rows: list[tuple],
+    offset: int,
+    total: int,
 ) -> Layout:
     layout = Layout()
     layout.split(
@@ -57,15 +183,18 @@ def _render_dashboard(
         Layout(name="body"),
     )
 
+    running, queued, blocked, failed = _header_cells(counts)
     header_text = (
-        f"running={len(running)}  "
-        f"queued={len(queued)}  "
-        f"blocked={len(blocked)}  "
-        f"failed={len(failed)}"
+        f"running={running}  "
+        f"queued={queued}  "
+        f"blocked={blocked}  "
+        f"failed={failed}"
     )
+    if total > len(rows):
+        header_text += f"  rows {offset + 1}-{offset + len(rows)} of {total} (j/k, PgUp/PgDn, g/G, q)"
     layout["header"].update(Panel(header_text, title="Ravel", padding=(0, 2)))
 
-    if not running and not queued:
+    if not rows:
         layout["body"].update(Panel("No active jobs. Waiting for new jobs..."))
         return layout
 
@@ -75,26 +204,11 @@ def _render_dashboard(
     table.add_column("GPUs", no_wrap=True)
     table.add_column("Priority", no_wrap=True)
     table.add_column("Created", no_wrap=True)
-    table.add_column("Command", overflow="fold")
-
-    for job in running:
-        table.add_row(
-            "running",
-            job["id"],
-            str(job.get("gpus", "-")),
-            str(job.get("priority", 0)),
-            job.get("created_at", "-"),
-            _truncate_command(job.get("command", [])),
-        )
-    for job in queued:
-        table.add_row(
-            "queued",
-            job["id"],
-            str(job.get("gpus", "-")),
-            str(job.get("priority", 0)),
-            job.get("created_at", "-"),
-            _truncate_command(job.get("command", [])),
-        )
+    table.add_column("Est.", no_wrap=True)
+    table.add_column("Command", no_wrap=True, overflow="ellipsis")
+
+    for cells in rows:
+        table.add_row(*cells)
 
     layout["body"].update(Panel(table))
     return layout
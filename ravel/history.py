@@ -0,0 +1,119 @@
+"""Command signatures and streaming runtime statistics.
+
+A signature keeps a command's program, script or subcommand and option
+names, and replaces argument values by their shape, so ``python train.py
+--lr 0.1 data/a.csv`` and ``python train.py --lr 0.3 data/b.csv`` share the
+estimate ``python train.py --lr <num> <path>``. Per signature the store
+keeps an EWMA and a log-binned histogram of runtimes; both update in O(1).
+"""
+import math
+import os
+import re
+import shlex
+from typing import List, Optional
+
+BINS = 64
+ALPHA_DEFAULT = 0.3
+
+_NUMBER_RE = re.compile(r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+_PYTHON_RE = re.compile(r"^python(\d+(\.\d+)?)?$")
+_SHELLS = {"bash", "sh", "zsh"}
+
+
+def _shape(token: str) -> str:
+    if _NUMBER_RE.match(token):
+        return "<num>"
+    if "/" in token or os.path.splitext(token)[1]:
+        return "<path>"
+    return "<str>"
+
+
+def signature(command: List[str]) -> str:
+    argv = list(command)
+    if (
+        len(argv) == 3
+        and os.path.basename(argv[0]) in _SHELLS
+        and argv[1] in ("-c", "-lc")
+    ):
+        try:
+            argv = shlex.split(argv[2])
+        except ValueError:
+            pass
+    if not argv:
+        return ""
+    program = os.path.basename(argv[0])
+    parts = ["python" if _PYTHON_RE.match(program) else program]
+    kept_target = False
+    for token in argv[1:]:
+        if token.startswith("-") and not _NUMBER_RE.match(token):
+            if "=" in token:
+                name, value = token.split("=", 1)
+                parts.append(f"{name}={_shape(value)}")
+            else:
+                parts.append(token)
+        elif not kept_target:
+            parts.append(token)
+            kept_target = True
+        else:
+            parts.append(_shape(token))
+    return " ".join(parts)
+
+
+def alpha() -> float:
+    try:
+        value = float(os.getenv("RAVEL_HISTORY_ALPHA", str(ALPHA_DEFAULT)))
+    except ValueError:
+        return ALPHA_DEFAULT
+    return min(1.0, max(0.01, value))
+
+
+def bin_index(seconds: float) -> int:
+    """Half-octave bins: bin 0 is < 1s, bin k covers [2^((k-1)/2), 2^(k/2))."""
+    if seconds < 1.0:
+        return 0
+    return min(BINS - 1, 1 + int(2 * math.log2(seconds)))
+
+
+def bin_value(index: int) -> float:
+    if index == 0:
+        return 0.5
+    return 2 ** ((index - 0.5) / 2)
+
+
+def add_sample(histogram: List[float], seconds: float) -> List[float]:
+    counts = list(histogram) if len(histogram) == BINS else [0.0] * BINS
+    counts[bin_index(seconds)] += 1
+    # Halve old counts now and then so the histogram follows recent behavior.
+    if sum(counts) > 512:
+        counts = [c / 2 for c in counts]
+    return counts
+
+
+def quantile(histogram: List[float], q: float) -> Optional[float]:
+    total = sum(histogram)
+    if not total:
+        return None
+    target = q * total
+    seen = 0.0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= target:
+            return bin_value(index)
+    return bin_value(len(histogram) - 1)
+
+
+def update_ewma(current: Optional[float], sample: float) -> float:
+    if current is None:
+        return sample
+    a = alpha()
+    return a * sample + (1 - a) * current
+
+
+def format_runtime(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    return f"{seconds / 3600:.1f}h"
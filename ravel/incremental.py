@@ -0,0 +1,227 @@
+import fnmatch
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+
+def _state_dir() -> str:
+    return os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+
+
+def index_path() -> str:
+    return os.path.join(_state_dir(), "stat_index.json")
+
+
+class StatIndex:
+    """Directory listing and stat cache used by ``ravel submit --incremental``.
+
+    Directory listings are persisted between runs and reused while the
+    directory's own mtime is unchanged, so expanding globs over a large tree
+    costs one stat per directory instead of a full listing. File stats are
+    taken at most once per run.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or index_path()
+        self._dirs: Dict[str, list] = {}
+        self._stats: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r") as handle:
+                self._dirs = json.load(handle).get("dirs", {})
+        except (OSError, ValueError):
+            self._dirs = {}
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}"
+        with open(tmp_path, "w") as handle:
+            json.dump({"dirs": self._dirs}, handle)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def stat(self, path: str) -> Optional[Tuple[int, int]]:
+        if path not in self._stats:
+            try:
+                st = os.stat(path)
+                self._stats[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                self._stats[path] = None
+        return self._stats[path]
+
+    def listdir(self, directory: str) -> Tuple[List[str], List[str]]:
+        stat = self.stat(directory)
+        if stat is None:
+            return [], []
+        cached = self._dirs.get(directory)
+        if cached and cached[0] == stat[0]:
+            return cached[1], cached[2]
+        files: List[str] = []
+        dirs: List[str] = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        (dirs if entry.is_dir() else files).append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return [], []
+        files.sort()
+        dirs.sort()
+        self._dirs[directory] = [stat[0], files, dirs]
+        self._dirty = True
+        return files, dirs
+
+    def expand(self, pattern: str, base: str) -> List[str]:
+        full = pattern if os.path.isabs(pattern) else os.path.join(base, pattern)
+        full = os.path.normpath(full)
+        if not _has_magic(full):
+            return [full] if self.stat(full) and not os.path.isdir(full) else []
+        anchor, parts = _split_pattern(full)
+        return sorted(set(self._walk(anchor, parts)))
+
+    def _walk(self, directory: str, parts: List[str]) -> Iterator[str]:
+        part, rest = parts[0], parts[1:]
+        files, dirs = self.listdir(directory)
+        if part == "**":
+            if rest:
+                yield from self._walk(directory, rest)
+            else:
+                yield from (os.path.join(directory, f) for f in files)
+            for name in dirs:
+                if not name.startswith("."):
+                    yield from self._walk(os.path.join(directory, name), parts)
+            return
+        if not rest:
+            yield from (
+                os.path.join(directory, name)
+                for name in files
+                if _match(name, part)
+            )
+            return
+        for name in dirs:
+            if _match(name, part):
+                yield from self._walk(os.path.join(directory, name), rest)
+
+    def newest(self, paths: List[str]) -> Optional[int]:
+        stamps = [s[0] for s in (self.stat(p) for p in paths) if s]
+        return max(stamps) if stamps else None
+
+    def oldest(self, paths: List[str]) -> Optional[int]:
+        stamps = [s[0] for s in (self.stat(p) for p in paths) if s]
+        return min(stamps) if stamps else None
+
+
+def _has_magic(value: str) -> bool:
+    return any(ch in value for ch in "*?[")
+
+
+def _match(name: str, part: str) -> bool:
+    if name.startswith(".") and not part.startswith("."):
+        return False
+    return fnmatch.fnmatchcase(name, part)
+
+
+def _split_pattern(path: str) -> Tuple[str, List[str]]:
+    parts = path.split(os.sep)
+    anchor: List[str] = []
+    while parts and not _has_magic(parts[0]):
+        anchor.append(parts.pop(0))
+    return os.sep.join(anchor) or os.sep, parts
+
+
+def select_dirty_jobs(
+    entries: List[dict],
+    cwd: str,
+    index: Optional[StatIndex] = None,
+) -> Tuple[List[dict], List[dict]]:
+    """Split parsed Ravelfile entries into (dirty, up_to_date).
+
+    A job is dirty if it declares no outputs, any output is missing, an
+    upstream job in the same file is dirty, or its newest input (declared
+    inputs plus upstream outputs) is newer than its oldest output. Dirty
+    entries are returned with ``after`` references to up-to-date jobs removed,
+    since those dependencies are already satisfied.
+    """
+    index = index or StatIndex()
+    by_name = {e["name"]: i for i, e in enumerate(entries) if e.get("name")}
+    dirty: Set[int] = set()
+    newest_output: Dict[int, Optional[int]] = {}
+
+    for idx in _topological_order(entries, by_name):
+        entry = entries[idx]
+        upstream = [by_name[d] for d in entry["after"] if d in by_name]
+        outs = [p for pat in entry.get("outputs") or [] for p in index.expand(pat, cwd)]
+        newest_output[idx] = index.newest(outs)
+
+        if not entry.get("outputs") or not outs:
+            dirty.add(idx)
+            continue
+        if any(u in dirty for u in upstream):
+            dirty.add(idx)
+            continue
+        missing = any(
+            not _has_magic(pat) and not index.expand(pat, cwd)
+            for pat in entry["outputs"]
+        )
+        if missing:
+            dirty.add(idx)
+            continue
+        ins = [p for pat in entry.get("inputs") or [] for p in index.expand(pat, cwd)]
+        stamps = [index.newest(ins)] + [newest_output[u] for u in upstream]
+        newest_input = max((s for s in stamps if s is not None), default=None)
+        oldest_output = index.oldest(outs)
+        if (
+            newest_input is not None
+            and oldest_output is not None
+            and newest_input > oldest_output
+        ):
+            dirty.add(idx)
+
+    index.save()
+
+    clean_names = {
+        entry["name"]
+        for idx, entry in enumerate(entries)
+        if idx not in dirty and entry.get("name")
+    }
+    selected = []
+    skipped = []
+    for idx, entry in enumerate(entries):
+        if idx in dirty:
+            selected.append({**entry, "after": [d for d in entry["after"] if d not in clean_names]})
+        else:
+            skipped.append(entry)
+    return selected, skipped
+
+
+def _topological_order(entries: List[dict], by_name: Dict[str, int]) -> List[int]:
+    order: List[int] = []
+    state: Dict[int, int] = {}
+    for start in range(len(entries)):
+        if start in state:
+            continue
+        stack = [(start, iter(entries[start]["after"]))]
+        state[start] = 1
+        while stack:
+            node, deps = stack[-1]
+            advanced = False
+            for dep in deps:
+                nxt = by_name.get(dep)
+                if nxt is None or state.get(nxt) is not None:
+                    continue
+                state[nxt] = 1
+                stack.append((nxt, iter(entries[nxt]["after"])))
+                advanced = True
+                break
+            if not advanced:
+                stack.pop()
+                state[node] = 2
+                order.append(node)
+    return order
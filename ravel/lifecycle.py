@@ -0,0 +1,119 @@
+"""Daemon pid file and process control.
+
+Kept free of the scheduler's heavier imports so CLI commands that only
+check or start the daemon (``ravel run --no-wait``) stay fast to launch.
+"""
+import os
+import signal
+import subprocess
+import sys
+from typing import Optional
+
+from . import profiler
+from .utils import console
+
+
+def _state_dir() -> str:
+    return os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+
+def _pid_path() -> str:
+    return os.path.join(_state_dir(), "daemon.pid")
+
+def _log_path() -> str:
+    return os.path.join(_state_dir(), "daemon.log")
+
+def daemon_running() -> bool:
+    pid = _read_pid()
+    if not pid:
+        return False
+    if os.name == "nt":
+        try:
+            import psutil
+            if psutil.pid_exists(pid):
+                return True
+        except Exception:
+            pass
+        _clear_pid()
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        _clear_pid()
+        return False
+
+def start_daemon() -> None:
+    os.makedirs(_state_dir(), exist_ok=True)
+    if daemon_running():
+        console.print("[yellow]Daemon already running[/]")
+        return
+    log = open(_log_path(), "a", buffering=1)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "ravel.daemon"],
+        stdout=log,
+        stderr=log,
+        stdin=subprocess.DEVNULL,
+        start_new_session=True,
+        close_fds=True,
+    )
+    _write_pid(proc.pid)
+    console.print(f"[green]Daemon started[/] (pid {proc.pid})")
+
+def stop_daemon() -> None:
+    pid = _read_pid()
+    if not pid:
+        console.print("[yellow]Daemon not running[/]")
+        return
+    try:
+        if os.name == "nt":
+            import psutil
+            proc = psutil.Process(pid)
+            proc.terminate()
+            proc.wait(timeout=10)
+        else:
+            os.kill(pid, signal.SIGTERM)
+        console.print("[green]Daemon stopped[/]")
+    except OSError:
+        console.print("[yellow]Daemon already stopped[/]")
+    _clear_pid()
+
+def request_profile(duration: float, output: str) -> bool:
+    """Ask the running daemon to record a profile; False if it cannot be signalled."""
+    if not daemon_running() or not hasattr(signal, "SIGUSR1"):
+        return False
+    profiler.write_request(duration, output)
+    try:
+        os.kill(_read_pid(), signal.SIGUSR1)
+    except OSError:
+        return False
+    return True
+
+def daemon_status() -> str:
+    if daemon_running():
+        return "running"
+    return "stopped"
+
+
+def _write_pid(pid: int) -> None:
+    with open(_pid_path(), "w") as handle:
+        handle.write(str(pid))
+
+def _read_pid() -> Optional[int]:
+    try:
+        with open(_pid_path(), "r") as handle:
+            data = handle.read().strip()
+            return int(data) if data else None
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        return None
+
+def _clear_pid() -> None:
+    try:
+        os.remove(_pid_path())
+    except FileNotFoundError:
+        pass
+
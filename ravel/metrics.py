@@ -0,0 +1,305 @@
+import bisect
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200, 14400, 43200, 86400, 604800)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "unknown"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self, namespace: str) -> List[str]:
+        full = f"{namespace}_{self.name}"
+        lines = [f"# TYPE {full} {self.kind}", f"# HELP {full} {self.help}"]
+        lines.extend(self._samples(full))
+        return lines
+
+    def _samples(self, full: str) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self, full: str) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labels:
+            items = [((), 0.0)]
+        return [
+            f"{full}_total{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def replace(self, values: Dict[LabelKey, float]) -> None:
+        with self._lock:
+            self._values = dict(values)
+
+    def value(self, **labels: str) -> Optional[float]:
+        return self._values.get(self._key(labels))
+
+    def _samples(self, full: str) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{full}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[idx] += 1
+            state[-1] += value
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return int(sum(state[:-1])) if state else 0
+
+    def _samples(self, full: str) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, hits in zip((*self.buckets, float("inf")), state[:-1]):
+                cumulative += hits
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{full}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{full}_count{labels} {cumulative}")
+            lines.append(f"{full}_sum{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets)
+
+    def render(self, namespace: str = "ravel", eof: bool = True) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render(namespace))
+        if eof:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+DB_OPERATION_SECONDS = REGISTRY.histogram(
+    "db_operation_seconds", "Latency of ravel.store operations.", ["op"]
+)
+NVIDIA_SMI_SECONDS = REGISTRY.histogram(
+    "nvidia_smi_seconds", "Latency of nvidia-smi invocations."
+)
+DISPATCH_TICK_SECONDS = REGISTRY.histogram(
+    "dispatch_tick_seconds", "Duration of one run_once() dispatch tick."
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "queue_wait_seconds",
+    "Time from submission to start of claimed jobs.",
+    ["memory_tag"],
+    buckets=DURATION_BUCKETS,
+)
+JOB_RUNTIME_SECONDS = REGISTRY.histogram(
+    "job_runtime_seconds",
+    "Wall time of finished jobs.",
+    ["status"],
+    buckets=DURATION_BUCKETS,
+)
+CLAIM_CONFLICTS = REGISTRY.counter(
+    "claim_conflicts", "Claims lost to another dispatcher."
+)
+JOBS_STARTED = REGISTRY.counter("jobs_started", "Jobs claimed and started.")
+JOBS_FINISHED = REGISTRY.counter("jobs_finished", "Jobs finished.", ["status"])
+QUEUE_JOBS = REGISTRY.gauge(
+    "queue_jobs", "Jobs in the store by status and memory tag.", ["status", "memory_tag"]
+)
+GPUS_TOTAL = REGISTRY.gauge("gpus_total", "GPUs reported by nvidia-smi.")
+GPUS_ALLOCATED = REGISTRY.gauge("gpus_allocated", "GPUs assigned to running jobs.")
+GPU_ALLOCATION_RATIO = REGISTRY.gauge(
+    "gpu_allocation_ratio", "Fraction of GPUs assigned to running jobs."
+)
+RPC_BATCH_SUBMISSIONS = REGISTRY.histogram(
+    "rpc_batch_submissions",
+    "Socket submissions written per store transaction.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+SNAPSHOT_TIMESTAMP = REGISTRY.gauge(
+    "metrics_snapshot_timestamp_seconds", "Unix time the metrics snapshot was written."
+)
+
+
+def _state_dir() -> str:
+    return os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+
+
+def snapshot_path() -> str:
+    return os.path.join(_state_dir(), "metrics.prom")
+
+
+def write_snapshot(registry: Registry = REGISTRY) -> None:
+    """Write the registry to ``metrics.prom`` so other processes can serve it."""
+    SNAPSHOT_TIMESTAMP.set(round(time.time(), 3))
+    path = snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}"
+    with open(tmp_path, "w") as handle:
+        handle.write(registry.render(eof=False))
+    os.replace(tmp_path, path)
+
+
+def read_snapshot() -> str:
+    try:
+        with open(snapshot_path(), "r") as handle:
+            return handle.read()
+    except OSError:
+        return ""
+
+
+def refresh_interval() -> float:
+    try:
+        return max(0.5, float(os.getenv("RAVEL_METRICS_REFRESH", "5")))
+    except ValueError:
+        return 5.0
+
+
+def metrics_port() -> Optional[int]:
+    value = os.getenv("RAVEL_METRICS_PORT", "")
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def serve(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name="ravel-metrics", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,221 @@
+"""Opt-in span profiler for the daemon with Chrome/Perfetto trace output.
+
+Spans are only recorded between ``start()`` and ``stop()``; otherwise
+``span()`` returns a shared no-op context manager and ``record()`` returns
+immediately. The daemon starts a profile when it receives ``SIGUSR1``
+(sent by ``ravel daemon profile``) and writes the trace when the requested
+duration has elapsed.
+"""
+import json
+import os
+import signal
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# (name, category, start, end, thread ident); times from time.perf_counter().
+Event = Tuple[str, str, float, float, int]
+
+_events: Optional[List[Event]] = None
+_started = 0.0
+_deadline = 0.0
+_output = ""
+_requested = False
+_lock = threading.Lock()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "start")
+
+    def __init__(self, name: str, cat: str):
+        self.name = name
+        self.cat = cat
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        record(self.name, self.start, time.perf_counter(), self.cat)
+
+
+def active() -> bool:
+    return _events is not None
+
+
+def span(name: str, cat: str = "daemon"):
+    if _events is None:
+        return _NOOP
+    return _Span(name, cat)
+
+
+def record(name: str, start: float, end: float, cat: str = "daemon") -> None:
+    events = _events
+    if events is None:
+        return
+    events.append((name, cat, start, end, threading.get_ident()))
+
+
+def handoff(fn: Callable) -> Callable:
+    """Wrap an executor target so the time spent queued in the pool is recorded."""
+    if _events is None:
+        return fn
+    submitted = time.perf_counter()
+
+    def wrapper(*args, **kwargs):
+        record("executor.queue", submitted, time.perf_counter(), "thread")
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def start(duration: float, output: str) -> None:
+    global _events, _started, _deadline, _output
+    with _lock:
+        _started = time.perf_counter()
+        _deadline = _started + max(0.0, duration)
+        _output = output
+        _events = []
+
+
+def stop() -> Optional[str]:
+    """Stop recording and write the trace and summary; returns the trace path."""
+    global _events
+    with _lock:
+        events, _events = _events, None
+    if events is None:
+        return None
+    write_chrome_trace(_output, events, _started)
+    summary = {
+        "duration": round(time.perf_counter() - _started, 3),
+        "phases": summarize(events),
+    }
+    _write_json(summary_path(_output), summary)
+    return _output
+
+
+def _state_dir() -> str:
+    return os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+
+
+def request_path() -> str:
+    return os.path.join(_state_dir(), "profile.request")
+
+
+def summary_path(output: str) -> str:
+    return f"{output}.summary.json"
+
+
+def default_output() -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(_state_dir(), f"profile-{stamp}.json")
+
+
+def write_request(duration: float, output: str) -> None:
+    _write_json(request_path(), {"duration": duration, "output": output})
+
+
+def install_signal_handler() -> None:
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    def _on_signal(signum, frame) -> None:
+        global _requested
+        _requested = True
+
+    signal.signal(signal.SIGUSR1, _on_signal)
+
+
+def poll() -> None:
+    """Called once per daemon loop: start a requested profile or finish a due one."""
+    global _requested
+    if _requested:
+        _requested = False
+        duration, output = 30.0, default_output()
+        try:
+            with open(request_path(), "r") as handle:
+                request = json.load(handle)
+            os.remove(request_path())
+            duration = float(request.get("duration", duration))
+            output = request.get("output") or output
+        except (OSError, ValueError, TypeError):
+            pass
+        if _events is None:
+            start(duration, output)
+    if _events is not None and time.perf_counter() >= _deadline:
+        stop()
+
+
+def summarize(events: List[Event]) -> List[Dict]:
+    by_name: Dict[str, List[float]] = {}
+    for name, _, begin, end, _ in events:
+        by_name.setdefault(name, []).append(end - begin)
+    rows = []
+    for name, durations in by_name.items():
+        durations.sort()
+        total = sum(durations)
+        rows.append(
+            {
+                "name": name,
+                "calls": len(durations),
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total / len(durations) * 1000, 4),
+                "p95_ms": round(durations[max(0, int(len(durations) * 0.95) - 1)] * 1000, 4),
+                "max_ms": round(durations[-1] * 1000, 4),
+            }
+        )
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
+
+
+def write_chrome_trace(path: str, events: List[Event], origin: float) -> None:
+    pid = os.getpid()
+    threads: Dict[int, int] = {}
+    trace_events = []
+    for name, cat, begin, end, ident in events:
+        tid = threads.setdefault(ident, len(threads) + 1)
+        trace_events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": round((begin - origin) * 1e6, 3),
+                "dur": round((end - begin) * 1e6, 3),
+                "pid": pid,
+                "tid": tid,
+            }
+        )
+    names = {t.ident: t.name for t in threading.enumerate()}
+    for ident, tid in threads.items():
+        trace_events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": names.get(ident, f"thread-{tid}")},
+            }
+        )
+    _write_json(path, {"traceEvents": trace_events, "displayTimeUnit": "ms"})
+
+
+def _write_json(path: str, payload: Dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}"
+    with open(tmp_path, "w") as handle:
+        json.dump(payload, handle)
+    os.replace(tmp_path, path)
@@ -0,0 +1,515 @@
+"""Ravelfile compiler.
+
+Lines are read one at a time and classified by their first word, so a
+Ravelfile is never held in memory as a whole. ``SET`` changes the defaults
+for the jobs that follow it. ``MATRIX`` (cross product) and ``FOREACH``
+(zip) blocks repeat their body, up to the matching ``END``, once per
+combination of values, replacing ``{name}`` with the value of each loop
+variable. Compiled plans are cached by content hash under
+``$RAVEL_STATE_DIR/plans``, so resubmitting an unchanged file skips parsing.
+"""
+import gc
+import hashlib
+import itertools
+import json
+import os
+import re
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .utils import parse_duration
+
+PLAN_FORMAT = 1
+MAX_PLANS = 32
+
+_BLOCKS = {"MATRIX", "FOREACH"}
+_VAR_RE = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+_RANGE_RE = re.compile(r"^(-?\d+)\.\.(-?\d+)$")
+
+
+def _state_dir() -> str:
+    return os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+
+
+def plan_dir() -> str:
+    return os.path.join(_state_dir(), "plans")
+
+
+def parse_bool(value: str) -> bool:
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def parse_job_line(
+    raw: str,
+    default_gpus: int,
+    default_priority: int,
+    default_memory_tag: Optional[str],
+    default_cpus: int = 0,
+    default_cache: bool = False,
+    default_time_limit: Optional[float] = None,
+    errors: Optional[List[str]] = None,
+) -> dict:
+    """Parse ``key=value ... -- command``; unparsable values keep their default.
+
+    An invalid ``time=`` is also appended to ``errors`` when a list is given,
+    since silently dropping a time limit is easy to miss.
+    """
+    meta, sep, command = raw.partition(" -- ")
+    if sep:
+        meta = meta.strip()
+    else:
+        meta, command = "", raw
+
+    gpus = default_gpus
+    cpus = default_cpus
+    priority = default_priority
+    memory_tag = default_memory_tag
+    name = None
+    after: List[str] = []
+    cache = default_cache
+    time_limit = default_time_limit
+    inputs: List[str] = []
+    outputs: List[str] = []
+    cache_env: List[str] = []
+
+    for part in meta.split():
+        key, sep, value = part.partition("=")
+        if not sep:
+            continue
+        key = key.lower()
+        if key == "gpus":
+            try:
+                gpus = int(value)
+            except ValueError:
+                pass
+        elif key == "cpus":
+            try:
+                cpus = int(value)
+            except ValueError:
+                pass
+        elif key == "priority":
+            try:
+                priority = int(value)
+            except ValueError:
+                pass
+        elif key in {"memory", "mem", "memory_tag"}:
+            memory_tag = value or None
+        elif key == "name":
+            name = value or None
+        elif key in {"after", "depends"}:
+            after = _csv(value)
+        elif key == "cache":
+            cache = parse_bool(value)
+        elif key in {"time", "time_limit"}:
+            try:
+                time_limit = parse_duration(value)
+            except ValueError:
+                if errors is not None:
+                    errors.append(f"invalid time limit '{value}'")
+        elif key == "inputs":
+            inputs = _csv(value)
+        elif key == "outputs":
+            outputs = _csv(value)
+        elif key == "cache_env":
+            cache_env = _csv(value)
+
+    return {
+        "command": command,
+        "gpus": gpus,
+        "cpus": cpus,
+        "priority": priority,
+        "memory_tag": memory_tag,
+        "name": name,
+        "after": after,
+        "cache": cache,
+        "inputs": inputs,
+        "outputs": outputs,
+        "cache_env": cache_env,
+        "time_limit": time_limit,
+    }
+
+
+def _csv(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def apply_set(line: str, defaults: dict) -> bool:
+    parts = line.split(None, 2)
+    if len(parts) < 3:
+        return False
+    key = parts[1].strip().lower()
+    value = parts[2].strip()
+    if key == "gpus":
+        try:
+            defaults["gpus"] = int(value)
+        except ValueError:
+            return False
+    elif key == "cpus":
+        try:
+            defaults["cpus"] = int(value)
+        except ValueError:
+            return False
+    elif key == "priority":
+        try:
+            defaults["priority"] = int(value)
+        except ValueError:
+            return False
+    elif key in {"memory", "mem", "memory_tag"}:
+        defaults["memory_tag"] = value or None
+    elif key == "cache":
+        defaults["cache"] = parse_bool(value)
+    elif key in {"time", "time_limit"}:
+        try:
+            defaults["time_limit"] = parse_duration(value)
+        except ValueError:
+            return False
+    else:
+        return False
+    return True
+
+
+def detect_heredoc_tag(line: str) -> Optional[str]:
+    if "<<'" in line:
+        start = line.split("<<'", 1)[1]
+        if "'" in start:
+            return start.split("'", 1)[0]
+    if "<<\"" in line:
+        start = line.split("<<\"", 1)[1]
+        if "\"" in start:
+            return start.split("\"", 1)[0]
+    if "<<" in line:
+        start = line.split("<<", 1)[1].strip()
+        if start:
+            return start.split()[0]
+    return None
+
+
+def _keyword(line: str) -> Tuple[str, str]:
+    """Split a stripped line into its upper-cased first word and the rest."""
+    head, _, rest = line.partition(" ")
+    if "\t" in head:
+        head, _, tail = head.partition("\t")
+        rest = f"{tail} {rest}" if rest else tail
+    return head.upper(), rest.lstrip()
+
+
+def collect_jobs(
+    lines: List[str],
+    defaults: dict,
+    errors: Optional[List[str]] = None,
+) -> List[str]:
+    """Raw job texts of ``lines``; ``SET`` directives update ``defaults`` in place."""
+    jobs: List[str] = []
+    numbered = enumerate(lines, start=1)
+    for lineno, raw in numbered:
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        keyword, rest = _keyword(line)
+        if keyword == "SET":
+            if not apply_set(line, defaults):
+                if errors is not None:
+                    errors.append(f"line {lineno}: invalid SET directive")
+            continue
+        jobs.append(_job_text(rest if keyword == "JOB" else line, numbered, lineno, errors))
+    return jobs
+
+
+def _job_text(
+    line: str,
+    numbered: Iterator[Tuple[int, str]],
+    lineno: int,
+    errors: Optional[List[str]],
+) -> str:
+    tag = detect_heredoc_tag(line) if "<<" in line else None
+    if not tag:
+        return line
+    command_lines = [line]
+    for lineno, raw in numbered:
+        command_lines.append(raw)
+        if raw.strip() == tag:
+            break
+    else:
+        if errors is not None:
+            errors.append(f"line {lineno + 1}: unterminated heredoc '{tag}'")
+    return "\n".join(command_lines)
+
+
+def _axis_values(value: str) -> List[str]:
+    match = _RANGE_RE.match(value)
+    if match:
+        start, stop = int(match.group(1)), int(match.group(2))
+        step = 1 if stop >= start else -1
+        return [str(v) for v in range(start, stop + step, step)]
+    return _csv(value)
+
+
+def _combinations(keyword: str, spec: str) -> Iterator[Dict[str, str]]:
+    axes: List[Tuple[str, List[str]]] = []
+    for part in spec.split():
+        name, sep, value = part.partition("=")
+        if not sep or not _VAR_RE.fullmatch("{" + name + "}"):
+            raise ValueError(f"expected name=v1,v2,... or name=1..N, got '{part}'")
+        values = _axis_values(value)
+        if not values:
+            raise ValueError(f"no values for '{name}'")
+        axes.append((name, values))
+    if not axes:
+        raise ValueError(f"{keyword} needs at least one name=values axis")
+    names = [name for name, _ in axes]
+    if keyword == "FOREACH":
+        lengths = {len(values) for _, values in axes}
+        if len(lengths) > 1:
+            raise ValueError("FOREACH axes must have the same number of values")
+        rows = zip(*(values for _, values in axes))
+    else:
+        rows = itertools.product(*(values for _, values in axes))
+    return (dict(zip(names, row)) for row in rows)
+
+
+def _substitute(line: str, bindings: Dict[str, str]) -> str:
+    if not bindings or "{" not in line:
+        return line
+    return _VAR_RE.sub(lambda m: bindings.get(m.group(1), m.group(0)), line)
+
+
+def _read_block(
+    numbered: Iterator[Tuple[int, str]],
+    start: int,
+    errors: List[str],
+) -> List[Tuple[int, str]]:
+    """Body lines of a block up to its matching END (heredoc bodies are skipped)."""
+    body: List[Tuple[int, str]] = []
+    depth = 0
+    tag = None
+    for lineno, raw in numbered:
+        line = raw.strip()
+        if tag is not None:
+            body.append((lineno, raw))
+            if line == tag:
+                tag = None
+            continue
+        keyword = _keyword(line)[0] if line and not line.startswith("#") else ""
+        if keyword == "END":
+            if depth == 0:
+                return body
+            depth -= 1
+        elif keyword in _BLOCKS:
+            depth += 1
+        elif keyword and keyword != "SET" and "<<" in line:
+            tag = detect_heredoc_tag(line)
+        body.append((lineno, raw))
+    errors.append(f"line {start}: unterminated block (missing END)")
+    return body
+
+
+def _compile(
+    numbered: Iterator[Tuple[int, str]],
+    defaults: dict,
+    bindings: Dict[str, str],
+    errors: List[str],
+) -> Iterator[dict]:
+    for lineno, raw in numbered:
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        line = _substitute(line, bindings)
+        keyword, rest = _keyword(line)
+        if keyword == "SET":
+            if not apply_set(line, defaults):
+                errors.append(f"line {lineno}: invalid SET directive")
+            continue
+        if keyword in _BLOCKS:
+            body = _read_block(numbered, lineno, errors)
+            try:
+                combos = _combinations(keyword, rest)
+            except ValueError as exc:
+                errors.append(f"line {lineno}: {exc}")
+                continue
+            for combo in combos:
+                scope = dict(bindings)
+                scope.update(combo)
+                yield from _compile(iter(body), defaults, scope, errors)
+            continue
+        if keyword == "END":
+            errors.append(f"line {lineno}: END without MATRIX or FOREACH")
+            continue
+        text = _job_text(rest if keyword == "JOB" else line, numbered, lineno, errors)
+        if bindings and "\n" in text:
+            text = _substitute(text, bindings)
+        problems: List[str] = []
+        try:
+            entry = parse_job_line(
+                text,
+                defaults["gpus"],
+                defaults["priority"],
+                defaults["memory_tag"],
+                default_cpus=defaults.get("cpus", 0),
+                default_cache=defaults.get("cache", False),
+                default_time_limit=defaults.get("time_limit"),
+                errors=problems,
+            )
+        except ValueError as exc:
+            errors.append(f"line {lineno}: failed to parse metadata ({exc})")
+            continue
+        errors.extend(f"line {lineno}: {problem}" for problem in problems)
+        entry["line"] = lineno
+        yield entry
+
+
+def compile_lines(
+    lines: Iterable[str],
+    defaults: dict,
+    errors: Optional[List[str]] = None,
+) -> Iterator[dict]:
+    """Yield parsed job entries of ``lines`` in file order.
+
+    Each job takes the defaults in effect at its position; ``defaults`` itself
+    is not modified. Problems are appended to ``errors`` and the offending
+    line is skipped.
+    """
+    if errors is None:
+        errors = []
+    numbered = ((n, raw.rstrip("\r\n")) for n, raw in enumerate(lines, start=1))
+    yield from _compile(numbered, dict(defaults), {}, errors)
+
+
+def compile_file(path: str, defaults: dict, errors: Optional[List[str]] = None) -> Iterator[dict]:
+    with open(path, "r") as handle:
+        yield from compile_lines(handle, defaults, errors)
+
+
+def check_dependencies(entries: List[dict]) -> List[str]:
+    """Duplicate names, unknown ``after=`` references and cycles, in O(V+E)."""
+    errors: List[str] = []
+    index: Dict[str, int] = {}
+    for pos, entry in enumerate(entries):
+        name = entry.get("name")
+        if not name:
+            continue
+        if name in index:
+            errors.append(f"line {entry.get('line', pos + 1)}: duplicate job name '{name}'")
+        else:
+            index[name] = pos
+
+    dependents: List[List[int]] = [[] for _ in entries]
+    pending = [0] * len(entries)
+    for pos, entry in enumerate(entries):
+        for dep in entry["after"]:
+            upstream = index.get(dep)
+            if upstream is None:
+                # Anything shaped like a job id is left to check_job_ids.
+                if not _is_job_id(dep):
+                    errors.append(f"line {entry.get('line', pos + 1)}: unknown dependency '{dep}'")
+                continue
+            dependents[upstream].append(pos)
+            pending[pos] += 1
+
+    ready = deque(pos for pos, count in enumerate(pending) if count == 0)
+    visited = 0
+    while ready:
+        pos = ready.popleft()
+        visited += 1
+        for child in dependents[pos]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                ready.append(child)
+    if visited < len(entries):
+        stuck = [entries[pos].get("name") or f"line {entries[pos].get('line', pos + 1)}"
+                 for pos, count in enumerate(pending) if count]
+        shown = ", ".join(stuck[:10]) + (", ..." if len(stuck) > 10 else "")
+        errors.append(f"dependency cycle among {len(stuck)} jobs: {shown}")
+    return errors
+
+
+def _is_job_id(dep: str) -> bool:
+    return len(dep) == 8 and dep.isalnum()
+
+
+def check_job_ids(entries: List[dict]) -> List[str]:
+    """``after=`` job ids that name neither a job in ``entries`` nor one in the database."""
+    names = {entry.get("name") for entry in entries}
+    wanted = {
+        dep for entry in entries for dep in entry["after"] if dep not in names and _is_job_id(dep)
+    }
+    if not wanted:
+        return []
+    from .store import get_jobs
+
+    existing = {job["id"] for job in get_jobs(sorted(wanted))}
+    errors: List[str] = []
+    for pos, entry in enumerate(entries):
+        for dep in entry["after"]:
+            if dep in wanted and dep not in existing:
+                errors.append(f"line {entry.get('line', pos + 1)}: unknown dependency '{dep}'")
+    return errors
+
+
+def plan_key(path: str, defaults: dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(json.dumps([PLAN_FORMAT, defaults], sort_keys=True).encode())
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _gc_paused():
+    # Plans are large acyclic lists of dicts; letting the cycle collector walk
+    # them repeatedly while they are built roughly doubles compile/load time.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_plan(path: str, defaults: dict, use_cache: bool = True) -> Tuple[List[dict], List[str]]:
+    """Compile and check ``path``, reusing the cached plan when the file is unchanged."""
+    key = plan_key(path, defaults)
+    cache_path = os.path.join(plan_dir(), f"{key}.json")
+    plan = None
+    with _gc_paused():
+        if use_cache:
+            try:
+                with open(cache_path, "r") as handle:
+                    plan = json.load(handle)
+                os.utime(cache_path)
+                jobs, errors = plan["jobs"], plan["errors"]
+            except (OSError, ValueError, KeyError):
+                plan = None
+
+        if plan is None:
+            errors = []
+            jobs = list(compile_file(path, defaults, errors))
+            errors.extend(check_dependencies(jobs))
+    if plan is None and use_cache:
+        _save_plan(cache_path, {"jobs": jobs, "errors": errors})
+    # Job ids refer to the database, which the cached plan does not cover.
+    return jobs, errors + check_job_ids(jobs)
+
+
+def _save_plan(cache_path: str, plan: dict) -> None:
+    try:
+        os.makedirs(plan_dir(), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        # json.dumps uses the C encoder; json.dump to a file does not.
+        data = json.dumps(plan, separators=(",", ":"))
+        with open(tmp_path, "w") as handle:
+            handle.write(data)
+        os.replace(tmp_path, cache_path)
+        plans = sorted(
+            (entry for entry in os.scandir(plan_dir()) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in plans[:-MAX_PLANS]:
+            os.remove(entry.path)
+    except OSError:
+        pass
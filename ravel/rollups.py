@@ -0,0 +1,132 @@
+"""Hourly and daily rollups of finished jobs.
+
+Every finished job adds itself, once, to one row per period (hour, day) and
+dimension (all jobs, user, memory tag, script), keyed by the period prefix
+of its ``finished_at`` timestamp. A row holds counts, sums and two sparse
+log-binned sketches (queue wait and runtime), so a report over any window
+merges a few rows per key instead of reading the jobs it covers.
+"""
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Length of the ISO timestamp prefix that names a bucket.
+PERIODS = {"hour": 13, "day": 10}
+DIMENSIONS = ("all", "user", "tag", "script")
+FAILED_STATUSES = ("failed", "timeout")
+# Windows up to this long are answered from hourly rows.
+HOURLY_WINDOW = timedelta(hours=48)
+HOURLY_RETENTION = timedelta(days=7)
+
+# Quarter-octave bins: bin 0 is < 1s, bin k covers [2^((k-1)/4), 2^(k/4)).
+BINS_PER_OCTAVE = 4
+MAX_BIN = 100
+
+
+def bin_index(seconds: float) -> int:
+    if seconds < 1.0:
+        return 0
+    return min(MAX_BIN, 1 + int(BINS_PER_OCTAVE * math.log2(seconds)))
+
+
+def bin_value(index: int) -> float:
+    if index == 0:
+        return 0.5
+    return 2 ** ((index - 0.5) / BINS_PER_OCTAVE)
+
+
+def add_to_sketch(sketch: Dict[str, int], seconds: Optional[float]) -> Dict[str, int]:
+    if seconds is not None:
+        key = str(bin_index(max(0.0, seconds)))
+        sketch[key] = sketch.get(key, 0) + 1
+    return sketch
+
+
+def merge_sketches(into: Dict[str, int], other: Dict[str, int]) -> Dict[str, int]:
+    for key, count in other.items():
+        into[key] = into.get(key, 0) + count
+    return into
+
+
+def sketch_quantile(sketch: Dict[str, int], q: float) -> Optional[float]:
+    total = sum(sketch.values())
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for index in sorted(int(k) for k in sketch):
+        seen += sketch[str(index)]
+        if seen >= target:
+            return round(bin_value(index), 1)
+    return None
+
+
+def script(command: List[str]) -> str:
+    """The program and its first non-option argument, e.g. ``python train.py``."""
+    from .history import signature
+
+    parts = signature(command).split()
+    target = next((p for p in parts[1:] if not p.startswith("-")), None)
+    return " ".join(parts[:1] + ([target] if target else []))
+
+
+def dimension_keys(user: Optional[str], memory_tag: Optional[str], command: List[str]) -> List[Tuple[str, str]]:
+    return [
+        ("all", ""),
+        ("user", user or ""),
+        ("tag", memory_tag or ""),
+        ("script", script(command)),
+    ]
+
+
+def buckets(finished_at: str) -> List[Tuple[str, str]]:
+    return [(period, finished_at[:length]) for period, length in PERIODS.items()]
+
+
+def period_for(since: datetime, now: datetime) -> str:
+    return "hour" if now - since <= HOURLY_WINDOW else "day"
+
+
+def first_bucket(period: str, since: datetime) -> str:
+    return since.isoformat(timespec="seconds")[: PERIODS[period]]
+
+
+def hourly_retention() -> timedelta:
+    try:
+        return timedelta(hours=max(48.0, float(os.getenv("RAVEL_ROLLUP_HOURS", "168"))))
+    except ValueError:
+        return HOURLY_RETENTION
+
+
+def summarize(key: str, rows: Iterable[Dict]) -> Dict:
+    """Combine the rows of one key into a report line."""
+    jobs = failed = cached = 0
+    gpu_seconds = runtime_seconds = wait_seconds = 0.0
+    waits: Dict[str, int] = {}
+    runtimes: Dict[str, int] = {}
+    for row in rows:
+        jobs += row["jobs"]
+        failed += row["failed"]
+        cached += row["cached"]
+        gpu_seconds += row["gpu_seconds"]
+        runtime_seconds += row["runtime_seconds"]
+        wait_seconds += row["wait_seconds"]
+        merge_sketches(waits, row["wait_sketch"])
+        merge_sketches(runtimes, row["runtime_sketch"])
+    waited = sum(waits.values())
+    ran = sum(runtimes.values())
+    return {
+        "key": key,
+        "jobs": jobs,
+        "failed": failed,
+        "cached": cached,
+        "failure_rate": round(failed / jobs, 4) if jobs else 0.0,
+        "gpu_hours": round(gpu_seconds / 3600, 3),
+        "wait_mean": round(wait_seconds / waited, 1) if waited else None,
+        "wait_p50": sketch_quantile(waits, 0.5),
+        "wait_p95": sketch_quantile(waits, 0.95),
+        "runtime_mean": round(runtime_seconds / ran, 1) if ran else None,
+        "runtime_p50": sketch_quantile(runtimes, 0.5),
+        "runtime_p95": sketch_quantile(runtimes, 0.95),
+    }
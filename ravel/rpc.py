@@ -0,0 +1,226 @@
+"""Job submission over the daemon's unix socket.
+
+Clients send one JSON line per request and read one JSON line back. The
+daemon hands every submission to a single writer thread, which inserts
+whatever has queued up since its last commit in one transaction, so many
+concurrent submitters cost one SQLite write lock per batch instead of one
+each. Clients fall back to writing the database directly when the daemon
+is not listening.
+
+Jobs are charged to the user the kernel reports for the connecting process
+(``SO_PEERCRED``, or ``LOCAL_PEERCRED`` on macOS and the BSDs), not to a
+name the client sends, so admission caps and per-user stats cannot be
+dodged through the socket. Where neither exists the daemon does not listen.
+The socket is ``0600``, or ``0660`` when the state dir is group-writable
+(a state dir shared by a team).
+"""
+import json
+import os
+import queue
+import socket
+import stat
+import struct
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+MAX_BATCH = 256
+# struct xucred: cr_version, cr_uid, cr_ngroups, cr_groups[16].
+_XUCRED = struct.Struct("IIh16I")
+_SOL_LOCAL = 0
+_LOCAL_PEERCRED = 0x001
+
+
+def _state_dir() -> str:
+    return os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+
+
+def socket_path() -> str:
+    return os.path.join(_state_dir(), "daemon.sock")
+
+
+def enabled() -> bool:
+    return os.getenv("RAVEL_RPC") == "1" and hasattr(socket, "AF_UNIX")
+
+
+def peer_credentials_supported() -> bool:
+    return hasattr(socket, "SO_PEERCRED") or sys.platform == "darwin" or "bsd" in sys.platform
+
+
+def peer_uid(sock: socket.socket) -> Optional[int]:
+    """Uid of the process on the other end of a unix socket, or None."""
+    try:
+        if hasattr(socket, "SO_PEERCRED"):
+            creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+            return struct.unpack("3i", creds)[1]
+        if peer_credentials_supported():
+            creds = sock.getsockopt(_SOL_LOCAL, _LOCAL_PEERCRED, _XUCRED.size)
+            return _XUCRED.unpack_from(creds)[1]
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def user_name(uid: int) -> str:
+    try:
+        import pwd
+
+        return pwd.getpwuid(uid).pw_name
+    except (ImportError, KeyError):
+        return str(uid)
+
+
+def _socket_mode(path: str) -> int:
+    try:
+        shared = os.stat(os.path.dirname(os.path.abspath(path))).st_mode & stat.S_IWGRP
+    except OSError:
+        shared = 0
+    return 0o660 if shared else 0o600
+
+
+def _timeout() -> float:
+    try:
+        return max(1.0, float(os.getenv("RAVEL_RPC_TIMEOUT", "60")))
+    except ValueError:
+        return 60.0
+
+
+def submit(jobs: List[Dict]) -> Optional[List[str]]:
+    """Submit ``jobs`` through the daemon; ``None`` if it is not reachable.
+
+    The daemon charges them to the uid of this process.
+
+    Raises ``AdmissionError`` when the daemon rejects the batch,
+    ``ValueError`` when a job in it is invalid, and
+    ``RuntimeError`` if the daemon fails after the request was sent, since
+    the jobs may already be queued and retrying directly could duplicate them.
+    """
+    from .store import AdmissionError
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1.0)
+        try:
+            sock.connect(socket_path())
+        except OSError:
+            return None
+        sock.settimeout(_timeout())
+        request = {"op": "submit", "jobs": jobs}
+        try:
+            sock.sendall(json.dumps(request).encode() + b"\n")
+        except OSError:
+            return None
+        try:
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+            reply = json.loads(line) if line else None
+        except (OSError, ValueError) as exc:
+            raise RuntimeError(f"no reply from the daemon: {exc}") from exc
+    finally:
+        sock.close()
+    if not reply:
+        raise RuntimeError("the daemon closed the connection without replying")
+    if "ids" in reply:
+        return reply["ids"]
+    if reply.get("admission"):
+        raise AdmissionError(reply["error"], retry_after=reply.get("retry_after"))
+    if reply.get("invalid"):
+        raise ValueError(reply["error"])
+    raise RuntimeError(reply.get("error") or "submission failed")
+
+
+class _Batcher:
+    """Single writer that coalesces queued submissions into one transaction."""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[str, List[Dict], Dict]]" = queue.Queue()
+
+    def submit(self, user: str, jobs: List[Dict]) -> Dict:
+        slot: Dict = {"done": threading.Event()}
+        self._queue.put((user, jobs, slot))
+        slot["done"].wait()
+        return slot["reply"]
+
+    def run(self) -> None:
+        from . import metrics
+        from .store import AdmissionError, add_job_batches
+
+        while True:
+            pending = [self._queue.get()]
+            while len(pending) < MAX_BATCH:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            metrics.RPC_BATCH_SUBMISSIONS.observe(len(pending))
+            try:
+                results = add_job_batches([(user, jobs) for user, jobs, _ in pending])
+            except Exception as exc:
+                results = [exc] * len(pending)
+            for (_, _, slot), result in zip(pending, results):
+                if isinstance(result, AdmissionError):
+                    slot["reply"] = {
+                        "error": str(result),
+                        "admission": True,
+                        "retry_after": result.retry_after,
+                    }
+                elif isinstance(result, ValueError):
+                    slot["reply"] = {"error": str(result), "invalid": True}
+                elif isinstance(result, Exception):
+                    slot["reply"] = {"error": str(result)}
+                else:
+                    slot["reply"] = {"ids": result}
+                slot["done"].set()
+
+
+def serve(path: Optional[str] = None):
+    """Listen on the daemon socket in background threads; returns the server."""
+    import socketserver
+
+    if not peer_credentials_supported():
+        raise OSError("this platform cannot report the uid of socket clients")
+    path = path or socket_path()
+    batcher = _Batcher()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            uid = peer_uid(self.request)
+            user = user_name(uid) if uid is not None else None
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    reply = {"error": "invalid request"}
+                else:
+                    if request.get("op") == "submit":
+                        if user is None:
+                            reply = {"error": "could not identify the submitting user"}
+                        else:
+                            reply = batcher.submit(user, request.get("jobs") or [])
+                    elif request.get("op") == "ping":
+                        reply = {"ok": True}
+                    else:
+                        reply = {"error": f"unknown op {request.get('op')!r}"}
+                self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    mode = _socket_mode(path)
+    # Bind under a umask so the socket is never reachable with wider
+    # permissions, then set the mode explicitly.
+    old_umask = os.umask(0o777 & ~mode)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    finally:
+        os.umask(old_umask)
+    os.chmod(path, mode)
+    server.daemon_threads = True
+    threading.Thread(target=batcher.run, name="ravel-rpc-writer", daemon=True).start()
+    threading.Thread(target=server.serve_forever, name="ravel-rpc", daemon=True).start()
+    return server
@@ -1,6 +1,8 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from .store import add_job as _add_job, list_jobs as _list_jobs
+from . import rpc
+from .history import format_runtime
+from .store import current_user, add_jobs, list_jobs as _list_jobs, predict_runtimes
 from .utils import console
 
 DASHBOARD_MODE = False
@@ -16,30 +18,62 @@ def add_job(
     depends_on: Optional[List[str]] = None,
     memory_tag: Optional[str] = None,
     cwd: Optional[str] = None,
+    cpus: int = 0,
+    cache: bool = False,
+    inputs: Optional[List[str]] = None,
+    outputs: Optional[List[str]] = None,
+    cache_env: Optional[List[str]] = None,
+    time_limit: Optional[float] = None,
 ) -> str:
-    job_id = _add_job(
-        command,
-        gpus=gpus,
-        priority=priority,
-        depends_on=depends_on,
-        memory_tag=memory_tag,
-        cwd=cwd,
+    (job_id,) = submit_jobs(
+        [
+            {
+                "command": command,
+                "gpus": gpus,
+                "priority": priority,
+                "depends_on": depends_on,
+                "memory_tag": memory_tag,
+                "cwd": cwd,
+                "cpus": cpus,
+                "cache": cache,
+                "inputs": inputs,
+                "outputs": outputs,
+                "cache_env": cache_env,
+                "time_limit": time_limit,
+            }
+        ]
     )
     if not DASHBOARD_MODE:
+        cpu_text = f", CPUs: {cpus}" if cpus else ""
         console.print(
-            f"[green]Job {job_id} queued:[/] {_format_command(command)} (GPUs: {gpus})"
+            f"[green]Job {job_id} queued:[/] {_format_command(command)} (GPUs: {gpus}{cpu_text})"
         )
     return job_id
 
+def submit_jobs(jobs: List[Dict]) -> List[str]:
+    """Queue ``jobs`` (see ``store.add_jobs``) and return their ids.
+
+    With ``RAVEL_RPC=1`` the jobs go through the daemon socket; if the daemon
+    is not listening they are written to SQLite directly.
+    """
+    if rpc.enabled():
+        job_ids = rpc.submit(jobs)
+        if job_ids is not None:
+            return job_ids
+    return add_jobs(jobs, user=current_user())
+
 def list_jobs():
     queued = _list_jobs(["queued"])
     running = _list_jobs(["running"])
     if not queued and not running:
         console.print("[yellow]No jobs queued![/]")
         return
+    predict_runtimes(queued)
     for job in queued:
+        estimate = job.get("predicted_runtime")
+        estimate_text = f" (~{format_runtime(estimate)})" if estimate is not None else ""
         console.print(
-            f"[blue]QUEUED[/] {job['id']} :: {_format_command(job['command'])}"
+            f"[blue]QUEUED[/] {job['id']} :: {_format_command(job['command'])}{estimate_text}"
         )
     for job in running:
         console.print(
@@ -0,0 +1,256 @@
+"""Replay a scheduler trace through ``run_once()`` in virtual time.
+
+Jobs from the trace are submitted to a throwaway SQLite database at their
+recorded submission time; ``run_once()`` makes the real dispatch decisions
+against ``RAVEL_FAKE_GPUS`` fake GPUs, and each started job "finishes" after
+its recorded runtime with its recorded status. Jobs the trace never saw
+finish (still queued or running when it ends) are submitted too, so they
+compete for the queue; if one starts it holds its GPUs until the replay ends.
+No processes are started.
+"""
+import heapq
+import math
+import os
+import tempfile
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import trace
+from .utils import set_clock
+
+# Environment the simulation must not inherit from the caller.
+_ISOLATED_ENV = (
+    "RAVEL_TRACE",
+    "RAVEL_ZYGOTE",
+    "RAVEL_MAX_QUEUED",
+    "RAVEL_MAX_QUEUED_PER_USER",
+    "RAVEL_MAX_SUBMIT_RATE",
+    "RAVEL_METRICS_PORT",
+)
+
+
+def parse_policy(items: List[str]) -> Dict[str, str]:
+    """Parse ``KEY=VALUE`` overrides; short keys map to ``RAVEL_<KEY>``.
+
+    ``priority.<user>=N`` adds ``N`` to the priority of that user's jobs.
+    """
+    policy: Dict[str, str] = {}
+    for item in items:
+        if "=" not in item:
+            raise ValueError(f"invalid policy '{item}', expected KEY=VALUE")
+        key, value = item.split("=", 1)
+        key = key.strip()
+        if not key.startswith("priority."):
+            key = key.upper()
+            if not key.startswith("RAVEL_"):
+                key = f"RAVEL_{key}"
+        policy[key] = value.strip()
+    return policy
+
+
+def load_trace(path: str) -> Tuple[Dict[str, Dict], int]:
+    jobs: Dict[str, Dict] = {}
+    gpus_total = 0
+    for kind, timestamp, payload in trace.read_trace(path):
+        if kind == trace.GPUS:
+            gpus_total = max(gpus_total, int(payload.get("total") or 0))
+            continue
+        job = jobs.setdefault(payload["id"], {"id": payload["id"]})
+        if kind == trace.SUBMIT:
+            job.update(payload)
+            job["submitted"] = timestamp
+        elif kind == trace.START:
+            job["started"] = timestamp
+            job["gpus_assigned"] = payload.get("gpus") or []
+        elif kind == trace.FINISH:
+            job["status"] = payload.get("status", "done")
+            job["runtime"] = float(payload.get("runtime") or 0.0)
+    return jobs, gpus_total
+
+
+class _Clock:
+    def __init__(self, origin: datetime):
+        self.origin = origin
+        self.offset = 0.0
+
+    def __call__(self) -> datetime:
+        return self.origin + timedelta(seconds=self.offset)
+
+
+class _RecordingExecutor:
+    """Stands in for the daemon's thread pool; records starts instead of running jobs."""
+
+    def __init__(self):
+        self.started: List[Tuple[str, List[int]]] = []
+
+    def submit(self, fn, job_id: str, gpus_assigned: List[int], cpus_assigned=None) -> Future:
+        self.started.append((job_id, gpus_assigned))
+        return Future()
+
+
+@contextmanager
+def _sandbox(policy: Dict[str, str], gpus: int, clock: _Clock) -> Iterator[str]:
+    saved = dict(os.environ)
+    with tempfile.TemporaryDirectory(prefix="ravel-sim-") as tmp:
+        for name in _ISOLATED_ENV:
+            os.environ.pop(name, None)
+        os.environ.update(
+            {
+                "RAVEL_STATE_DIR": tmp,
+                "RAVEL_DB_PATH": os.path.join(tmp, "sim.db"),
+                "RAVEL_NO_GPU": "1",
+                "RAVEL_FAKE_GPUS": str(gpus),
+                "RAVEL_USAGE_INTERVAL": "0",
+            }
+        )
+        os.environ.update({k: v for k, v in policy.items() if k.startswith("RAVEL_")})
+        set_clock(clock)
+        try:
+            yield tmp
+        finally:
+            set_clock(None)
+            os.environ.clear()
+            os.environ.update(saved)
+
+
+def simulate(
+    path: str,
+    policy: Optional[Dict[str, str]] = None,
+    gpus: Optional[int] = None,
+) -> Dict:
+    from .daemon import run_once
+    from .store import add_job, set_job_finished
+
+    policy = policy or {}
+    recorded, traced_gpus = load_trace(path)
+    jobs = sorted(
+        (j for j in recorded.values() if "submitted" in j),
+        key=lambda j: (j["submitted"], j.get("started", 0.0)),
+    )
+    if not any("runtime" in j for j in jobs):
+        raise ValueError("trace contains no completed jobs")
+    total_gpus = gpus or traced_gpus or max(j.get("gpus", 1) for j in jobs)
+    boosts = {k.split(".", 1)[1]: int(v) for k, v in policy.items() if k.startswith("priority.")}
+
+    origin = jobs[0]["submitted"]
+    clock = _Clock(datetime.fromtimestamp(origin))
+    by_sim_id: Dict[str, Dict] = {}
+    sim_ids: Dict[str, str] = {}
+    results: Dict[str, Dict] = {}
+    finishes: List[Tuple[float, int, str]] = []
+    seq = 0
+    ticks = 0
+    idx = 0
+
+    with _sandbox(policy, total_gpus, clock):
+        executor = _RecordingExecutor()
+        while idx < len(jobs) or finishes:
+            next_submit = jobs[idx]["submitted"] - origin if idx < len(jobs) else math.inf
+            next_finish = finishes[0][0] if finishes else math.inf
+            clock.offset = min(next_submit, next_finish)
+
+            while finishes and finishes[0][0] <= clock.offset:
+                _, _, sim_id = heapq.heappop(finishes)
+                job = by_sim_id[sim_id]
+                status = job.get("status", "done")
+                set_job_finished(sim_id, status, 0 if status in ("done", "cached") else 1, "", "", runtime=job["runtime"])
+                results[job["id"]]["finished"] = clock.offset
+
+            while idx < len(jobs) and jobs[idx]["submitted"] - origin <= clock.offset:
+                job = jobs[idx]
+                idx += 1
+                sim_id = add_job(
+                    ["ravel-sim", job["id"]],
+                    gpus=job.get("gpus", 1),
+                    priority=job.get("priority", 0) + boosts.get(job.get("user") or "", 0),
+                    depends_on=[sim_ids[d] for d in job.get("after") or [] if d in sim_ids],
+                    memory_tag=job.get("memory_tag"),
+                    time_limit=job.get("time_limit"),
+                )
+                sim_ids[job["id"]] = sim_id
+                by_sim_id[sim_id] = job
+                results[job["id"]] = {"submitted": clock.offset}
+
+            executor.started = []
+            while run_once(executor=executor, active_futures=set()):
+                ticks += 1
+            ticks += 1
+            for sim_id, assigned in executor.started:
+                job = by_sim_id[sim_id]
+                results[job["id"]]["started"] = clock.offset
+                if "runtime" in job:
+                    seq += 1
+                    heapq.heappush(finishes, (clock.offset + job["runtime"], seq, sim_id))
+
+    simulated = [
+        {**results[j["id"]], "gpus": j.get("gpus", 1), "runtime": j.get("runtime"), "user": j.get("user")}
+        for j in jobs
+    ]
+    baseline = [
+        {
+            "submitted": j["submitted"] - origin,
+            **({"started": j["started"] - origin} if "started" in j else {}),
+            "gpus": j.get("gpus", 1),
+            "runtime": j.get("runtime"),
+            "user": j.get("user"),
+        }
+        for j in jobs
+    ]
+    return {
+        "jobs": len(jobs),
+        "gpus": total_gpus,
+        "ticks": ticks,
+        "policy": policy,
+        "recorded": summarize(baseline, total_gpus),
+        "simulated": summarize(simulated, total_gpus),
+    }
+
+
+def summarize(jobs: List[Dict], total_gpus: int) -> Dict:
+    """Queue metrics of ``jobs``; waits cover every started job, while
+    makespan, utilization and fairness only cover jobs with a known runtime.
+    """
+    ran = [j for j in jobs if "started" in j]
+    finished = [j for j in ran if j.get("runtime") is not None]
+    if not finished:
+        return {"started": len(ran), "unscheduled": len(jobs) - len(ran)}
+    first = min(j["submitted"] for j in jobs)
+    last = max(j["started"] + j["runtime"] for j in finished)
+    makespan = max(0.0, last - first)
+    busy = sum(j["gpus"] * j["runtime"] for j in finished)
+    waits = sorted(j["started"] - j["submitted"] for j in ran)
+    return {
+        "started": len(ran),
+        "unscheduled": len(jobs) - len(ran),
+        "makespan": round(makespan, 1),
+        "utilization": round(busy / (total_gpus * makespan), 4) if makespan and total_gpus else 0.0,
+        "wait_mean": round(sum(waits) / len(waits), 1),
+        "wait_p50": round(_percentile(waits, 50), 1),
+        "wait_p90": round(_percentile(waits, 90), 1),
+        "wait_p99": round(_percentile(waits, 99), 1),
+        "fairness": round(_jain_index(_slowdown_by_user(finished)), 4),
+    }
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def _slowdown_by_user(jobs: List[Dict]) -> List[float]:
+    """Mean bounded slowdown per user: (wait + runtime) / max(runtime, 10s)."""
+    per_user: Dict[str, List[float]] = {}
+    for job in jobs:
+        wait = job["started"] - job["submitted"]
+        slowdown = (wait + job["runtime"]) / max(job["runtime"], 10.0)
+        per_user.setdefault(job.get("user") or "", []).append(slowdown)
+    return [sum(v) / len(v) for v in per_user.values()]
+
+
+def _jain_index(values: List[float]) -> float:
+    if not values:
+        return 1.0
+    square_sum = sum(v * v for v in values)
+    return (sum(values) ** 2) / (len(values) * square_sum) if square_sum else 1.0
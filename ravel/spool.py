@@ -0,0 +1,115 @@
+"""Spool files for the output of running jobs.
+
+The daemon points a job's stdout and stderr at ``logs/<job_id>.out`` and
+``.err`` in the state dir, so output never passes through daemon memory and
+any number of followers can read it by byte offset. When the job finishes
+the output is stored in the job row and the spool files are removed. The
+row holds text, so a stream that is not valid UTF-8 also keeps its raw
+bytes in ``job_output``; followers read those, and offsets taken from the
+spool file stay valid across the switch.
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+STREAMS = ("stdout", "stderr")
+CHUNK_BYTES = 65536
+
+_SUFFIXES = {"stdout": ".out", "stderr": ".err"}
+
+
+def spool_dir() -> str:
+    state_dir = os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+    return os.path.join(state_dir, "logs")
+
+
+def spool_path(job_id: str, stream: str) -> str:
+    return os.path.join(spool_dir(), f"{job_id}{_SUFFIXES[stream]}")
+
+
+def open_spools(job_id: str):
+    """Create (truncate) both spool files and return them opened for writing."""
+    os.makedirs(spool_dir(), exist_ok=True)
+    return open(spool_path(job_id, "stdout"), "wb"), open(spool_path(job_id, "stderr"), "wb")
+
+
+def read_spool_bytes(job_id: str, stream: str) -> bytes:
+    try:
+        with open(spool_path(job_id, stream), "rb") as handle:
+            return handle.read()
+    except FileNotFoundError:
+        return b""
+
+
+def read_spool(job_id: str, stream: str) -> str:
+    return read_spool_bytes(job_id, stream).decode(errors="replace")
+
+
+def remove_spools(job_id: str) -> None:
+    for stream in STREAMS:
+        try:
+            os.remove(spool_path(job_id, stream))
+        except FileNotFoundError:
+            pass
+
+
+def read_chunk(
+    job: Dict,
+    stream: str,
+    offset: int,
+    max_bytes: int = CHUNK_BYTES,
+) -> Tuple[bytes, int, bool]:
+    """Read up to ``max_bytes`` of a job's output starting at byte ``offset``.
+
+    Returns ``(data, next_offset, complete)``; ``complete`` is true once the
+    job has finished and everything up to the end has been returned.
+    """
+    offset = max(0, offset)
+    max_bytes = max(1, min(max_bytes, CHUNK_BYTES))
+    from .store import FINISHED_STATUSES, get_job_output
+
+    if job["status"] in FINISHED_STATUSES:
+        content = get_job_output(job["id"], stream)
+        if content is None:
+            content = (job.get(stream) or "").encode()
+        data = content[offset:offset + max_bytes]
+        end = offset + len(data)
+        return data, end, end >= len(content)
+    try:
+        with open(spool_path(job["id"], stream), "rb") as handle:
+            handle.seek(offset)
+            data = handle.read(max_bytes)
+    except FileNotFoundError:
+        # Not started yet, or finished between reading the row and the file.
+        data = b""
+    return data, offset + len(data), False
+
+
+def utf8_prefix(data: bytes) -> int:
+    """Length of the longest prefix of ``data`` that does not end mid-character."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue
+        if byte < 0x80:
+            needed = 1
+        elif byte < 0xE0:
+            needed = 2
+        elif byte < 0xF0:
+            needed = 3
+        else:
+            needed = 4
+        return len(data) if needed <= back else len(data) - back
+    return len(data)
+
+
+def offsets(value: Optional[str]) -> Dict[str, int]:
+    """Parse ``N`` (stdout) or ``N,M`` (stdout,stderr) resume offsets."""
+    parts = [p.strip() for p in (value or "").split(",")]
+    result = {stream: 0 for stream in STREAMS}
+    for stream, part in zip(STREAMS, parts):
+        if part:
+            result[stream] = max(0, int(part))
+    return result
@@ -1,11 +1,34 @@
+import getpass
 import json
 import os
 import sqlite3
+import threading
+import time
 import uuid
-from datetime import datetime
-from typing import Dict, Iterable, List, Optional
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from .utils import console
+from . import history, profiler, rollups
+from .metrics import DB_OPERATION_SECONDS
+from .utils import console, current_time
+
+SCHEMA_VERSION = 13
+
+# Statuses a job never leaves; everything that waits on jobs checks these.
+FINISHED_STATUSES = ("done", "cached", "failed", "timeout", "blocked", "stopped")
+
+ADMISSION_LIMITS = {
+    "max_queued": "RAVEL_MAX_QUEUED",
+    "max_queued_per_user": "RAVEL_MAX_QUEUED_PER_USER",
+    "max_submit_rate": "RAVEL_MAX_SUBMIT_RATE",
+}
+
+
+class AdmissionError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 
 def _state_dir() -> str:
@@ -16,21 +39,63 @@ def _state_dir() -> str:
 
 
 def db_path() -> str:
-    return os.environ.get("RAVEL_DB_PATH", os.path.join(_state_dir(), "ravel.db"))
+    path = os.environ.get("RAVEL_DB_PATH")
+    if path is not None:
+        return path
+    return os.path.join(_state_dir(), "ravel.db")
 
 
 def _ensure_state_dir() -> None:
     os.makedirs(_state_dir(), exist_ok=True)
 
 
+def _timed(fn):
+    name = fn.__name__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            DB_OPERATION_SECONDS.observe(end - start, op=name)
+            profiler.record(name, start, end, "store")
+
+    return wrapper
+
+
+# One connection per thread and database file; reopened if the file is replaced.
+_LOCAL = threading.local()
+
+
+def _file_identity(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
 def _connect() -> sqlite3.Connection:
+    path = db_path()
+    cached = getattr(_LOCAL, "conn", None)
+    if cached is not None:
+        conn, cached_path, identity = cached
+        if cached_path == path and identity is not None and identity == _file_identity(path):
+            return conn
+        conn.close()
+        _LOCAL.conn = None
+    start = time.perf_counter()
     _ensure_state_dir()
-    conn = sqlite3.connect(db_path(), timeout=30)
+    conn = sqlite3.connect(path, timeout=30)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
     _init_db(conn)
     conn.commit()
+    _LOCAL.conn = (conn, path, _file_identity(path))
+    profiler.record("store._connect", start, time.perf_counter(), "store")
     return conn
 
 
@@ -43,7 +108,10 @@ def _ensure_column(conn: sqlite3.Connection, table: str, column: str, definition
 
 def _init_db(conn: sqlite3.Connection) -> None:
     _ensure_meta_table(conn)
-    _get_schema_version(conn)
+    # Bump SCHEMA_VERSION with every schema change, or existing databases
+    # will skip the migration below.
+    if _get_schema_version(conn) >= SCHEMA_VERSION:
+        return
     conn.executescript(
         """
         CREATE TABLE IF NOT EXISTS jobs (
@@ -67,12 +135,78 @@ def _init_db(conn: sqlite3.Connection) -> None:
             job_id TEXT NOT NULL,
             depends_on TEXT NOT NULL
         );
+        CREATE TABLE IF NOT EXISTS job_usage (
+            job_id TEXT PRIMARY KEY,
+            samples TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS runtime_stats (
+            signature TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            ewma REAL NOT NULL,
+            histogram TEXT NOT NULL,
+            peak_rss REAL,
+            gpu_mem_peak INTEGER,
+            updated_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS job_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL,
+            status TEXT
+        );
+        CREATE TABLE IF NOT EXISTS job_results (
+            job_id TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS job_output (
+            job_id TEXT NOT NULL,
+            stream TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (job_id, stream)
+        );
+        CREATE TABLE IF NOT EXISTS job_rollups (
+            period TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            key TEXT NOT NULL,
+            jobs INTEGER NOT NULL,
+            failed INTEGER NOT NULL,
+            cached INTEGER NOT NULL,
+            gpu_seconds REAL NOT NULL,
+            runtime_seconds REAL NOT NULL,
+            wait_seconds REAL NOT NULL,
+            wait_sketch TEXT NOT NULL,
+            runtime_sketch TEXT NOT NULL,
+            PRIMARY KEY (period, dimension, bucket, key)
+        );
         """
     )
     _ensure_column(conn, "jobs", "priority", "INTEGER NOT NULL DEFAULT 0")
     _ensure_column(conn, "jobs", "memory_tag", "TEXT")
     _ensure_column(conn, "jobs", "cwd", "TEXT")
     _ensure_column(conn, "jobs", "pid", "INTEGER")
+    _ensure_column(conn, "jobs", "peak_rss", "INTEGER")
+    _ensure_column(conn, "jobs", "cpu_seconds", "REAL")
+    _ensure_column(conn, "jobs", "gpu_util_mean", "REAL")
+    _ensure_column(conn, "jobs", "gpu_mem_peak", "INTEGER")
+    _ensure_column(conn, "jobs", "gpu_seconds", "REAL")
+    _ensure_column(conn, "jobs", "cpus", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(conn, "jobs", "cpus_assigned", "TEXT")
+    _ensure_column(conn, "jobs", "cache", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(conn, "jobs", "cache_env", "TEXT")
+    _ensure_column(conn, "jobs", "cache_key", "TEXT")
+    _ensure_column(conn, "jobs", "inputs", "TEXT")
+    _ensure_column(conn, "jobs", "outputs", "TEXT")
+    _ensure_column(conn, "jobs", "time_limit", "REAL")
+    _ensure_column(conn, "jobs", "user", "TEXT")
+    _ensure_column(conn, "jobs", "critical_path", "REAL NOT NULL DEFAULT 0")
+    _ensure_column(conn, "jobs", "signature", "TEXT")
+    _ensure_column(conn, "jobs", "predicted_runtime", "REAL")
     conn.executescript(
         """
         CREATE INDEX IF NOT EXISTS idx_jobs_status_created
@@ -83,9 +217,29 @@ def _init_db(conn: sqlite3.Connection) -> None:
             ON job_deps(job_id);
         CREATE INDEX IF NOT EXISTS idx_job_deps_depends
             ON job_deps(depends_on);
+        CREATE INDEX IF NOT EXISTS idx_cache_entries_last_used
+            ON cache_entries(last_used);
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_user
+            ON jobs(status, user);
+        CREATE TRIGGER IF NOT EXISTS trg_job_events_insert AFTER INSERT ON jobs
+        BEGIN
+            INSERT INTO job_events (job_id, status) VALUES (NEW.id, NEW.status);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_job_events_update AFTER UPDATE OF status, priority ON jobs
+        WHEN OLD.status IS NOT NEW.status OR OLD.priority IS NOT NEW.priority
+        BEGIN
+            INSERT INTO job_events (job_id, status) VALUES (NEW.id, NEW.status);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_job_events_delete AFTER DELETE ON jobs
+        BEGIN
+            INSERT INTO job_events (job_id, status) VALUES (OLD.id, NULL);
+        END;
         """
     )
-    _set_schema_version(conn, 2)
+    if conn.execute("SELECT 1 FROM job_rollups LIMIT 1").fetchone() is None:
+        # First migration to rollups: fold in the jobs that already finished.
+        _rebuild_rollups(conn)
+    _set_schema_version(conn, SCHEMA_VERSION)
 
 
 def _ensure_meta_table(conn: sqlite3.Connection) -> None:
@@ -121,6 +275,7 @@ def _set_schema_version(conn: sqlite3.Connection, version: int) -> None:
         (str(version),),
     )
 
+@_timed
 def add_job(
     command: List[str],
     gpus: int = 1,
@@ -128,35 +283,364 @@ def add_job(
     depends_on: Optional[List[str]] = None,
     memory_tag: Optional[str] = None,
     cwd: Optional[str] = None,
+    cpus: int = 0,
+    cache: bool = False,
+    inputs: Optional[List[str]] = None,
+    outputs: Optional[List[str]] = None,
+    cache_env: Optional[List[str]] = None,
+    time_limit: Optional[float] = None,
 ) -> str:
     job_id = str(uuid.uuid4())[:8]
-    created_at = datetime.now().isoformat(timespec="seconds")
+    spec = {
+        "command": command,
+        "gpus": gpus,
+        "priority": priority,
+        "memory_tag": memory_tag,
+        "cwd": cwd,
+        "cpus": cpus,
+        "cache": cache,
+        "inputs": inputs,
+        "outputs": outputs,
+        "cache_env": cache_env,
+        "time_limit": time_limit,
+    }
+    created_at = current_time().isoformat(timespec="seconds")
+    user = current_user()
     with _connect() as conn:
-        conn.execute(
-            """
-            INSERT INTO jobs (
-                id, command, gpus, priority, memory_tag, cwd, status, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                job_id,
-                json.dumps(command),
-                gpus,
-                priority,
-                memory_tag,
-                cwd,
-                "queued",
-                created_at,
-            ),
-        )
+        conn.execute("BEGIN IMMEDIATE")
+        _check_admission(conn, user, 1)
+        _insert_job(conn, job_id, spec, user, created_at)
         if depends_on:
             conn.executemany(
                 "INSERT INTO job_deps (job_id, depends_on) VALUES (?, ?)",
                 [(job_id, dep) for dep in depends_on],
             )
+            if _critical_path_enabled():
+                _propagate_critical_paths(conn, [job_id])
     return job_id
 
 
+@_timed
+def add_jobs(jobs: List[Dict], user: Optional[str] = None) -> List[str]:
+    """Insert a batch of jobs in one transaction and return their ids.
+
+    Each job is a dict of ``add_job()`` keyword arguments plus ``command``;
+    an optional ``name`` lets ``depends_on`` of other jobs in the batch
+    refer to it. The batch is admitted or rejected as a whole.
+    """
+    result = add_job_batches([(user or current_user(), jobs)])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+@_timed
+def add_job_batches(batches: List[Tuple[str, List[Dict]]]) -> List:
+    """Insert several ``(user, jobs)`` submissions in one write transaction.
+
+    Returns, per submission, its job ids or the ``AdmissionError`` (or
+    ``ValueError`` for an invalid job) that rejected it; a rejected submission leaves no rows behind and does not
+    affect the others.
+    """
+    created_at = current_time().isoformat(timespec="seconds")
+    results: List = []
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for user, jobs in batches:
+            conn.execute("SAVEPOINT submission")
+            try:
+                _check_admission(conn, user, len(jobs))
+                results.append(_insert_batch(conn, jobs, user, created_at))
+            except (AdmissionError, ValueError) as exc:
+                conn.execute("ROLLBACK TO submission")
+                results.append(exc)
+            conn.execute("RELEASE submission")
+    return results
+
+
+def _insert_batch(conn: sqlite3.Connection, jobs: List[Dict], user: str, created_at: str) -> List[str]:
+    job_ids = [str(uuid.uuid4())[:8] for _ in jobs]
+    names = {job["name"]: job_id for job, job_id in zip(jobs, job_ids) if job.get("name")}
+    edges = []
+    for job, job_id in zip(jobs, job_ids):
+        _insert_job(conn, job_id, job, user, created_at)
+        edges.extend((job_id, names.get(dep, dep)) for dep in job.get("depends_on") or [])
+    if edges:
+        conn.executemany("INSERT INTO job_deps (job_id, depends_on) VALUES (?, ?)", edges)
+        if _critical_path_enabled():
+            _propagate_critical_paths(conn, [job_id for job_id, _ in edges])
+    return job_ids
+
+
+def _insert_job(conn: sqlite3.Connection, job_id: str, job: Dict, user: str, created_at: str) -> None:
+    command = list(job["command"])
+    cores = os.cpu_count() or 1
+    if (job.get("cpus") or 0) > cores:
+        # It could never be allocated and would stay queued forever.
+        raise ValueError(f"job '{' '.join(command)}' asks for {job['cpus']} cpus but this host has {cores}")
+    time_limit = job.get("time_limit")
+    signature = history.signature(command)
+    predicted = _predicted_runtime(conn, signature)
+    conn.execute(
+        """
+        INSERT INTO jobs (
+            id, command, gpus, cpus, priority, memory_tag, cwd, status, created_at,
+            cache, inputs, outputs, cache_env, time_limit, user, critical_path,
+            signature, predicted_runtime
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            job_id,
+            json.dumps(command),
+            job.get("gpus", 1),
+            max(0, job.get("cpus") or 0),
+            job.get("priority") or 0,
+            job.get("memory_tag"),
+            job.get("cwd"),
+            "queued",
+            created_at,
+            1 if job.get("cache") else 0,
+            json.dumps(job["inputs"]) if job.get("inputs") else None,
+            json.dumps(job["outputs"]) if job.get("outputs") else None,
+            json.dumps(job["cache_env"]) if job.get("cache_env") else None,
+            time_limit,
+            user,
+            _runtime_estimate(time_limit, predicted),
+            signature,
+            predicted,
+        ),
+    )
+
+
+def _critical_path_enabled() -> bool:
+    return os.getenv("RAVEL_CRITICAL_PATH") == "1"
+
+
+def _default_runtime() -> float:
+    try:
+        return max(0.0, float(os.getenv("RAVEL_DEFAULT_RUNTIME", "60")))
+    except ValueError:
+        return 60.0
+
+
+def _runtime_estimate(time_limit: Optional[float], predicted: Optional[float] = None) -> float:
+    if predicted is not None:
+        return min(predicted, float(time_limit)) if time_limit else predicted
+    return float(time_limit) if time_limit else _default_runtime()
+
+
+def _predicted_runtime(conn: sqlite3.Connection, signature: str) -> Optional[float]:
+    row = conn.execute(
+        "SELECT ewma FROM runtime_stats WHERE signature = ?", (signature,)
+    ).fetchone()
+    return row["ewma"] if row else None
+
+
+def _propagate_critical_paths(conn: sqlite3.Connection, job_ids: List[str]) -> int:
+    """Recompute ``critical_path`` of ``job_ids`` and their queued ancestors.
+
+    ``critical_path`` is a job's runtime estimate plus the longest chain of
+    estimates through its queued dependents. Only new edges or a changed
+    estimate can move it, so only the ancestor closure of ``job_ids`` is
+    visited, once, in dependents-first order; dependents outside the closure
+    keep their stored values.
+    """
+    if not job_ids:
+        return 0
+    rows = conn.execute(
+        """
+        WITH RECURSIVE affected(id) AS (
+            SELECT value FROM json_each(?)
+            UNION
+            SELECT d.depends_on
+            FROM job_deps d
+            JOIN affected a ON d.job_id = a.id
+            JOIN jobs p ON p.id = d.depends_on AND p.status = 'queued'
+        )
+        SELECT j.id, j.critical_path, j.time_limit, j.predicted_runtime
+        FROM jobs j
+        JOIN affected a ON a.id = j.id
+        WHERE j.status = 'queued'
+        """,
+        (json.dumps(job_ids),),
+    ).fetchall()
+    nodes = {row["id"]: row for row in rows}
+    if not nodes:
+        return 0
+    edges = conn.execute(
+        """
+        SELECT d.job_id, d.depends_on, c.critical_path
+        FROM job_deps d
+        JOIN jobs c ON c.id = d.job_id AND c.status = 'queued'
+        WHERE d.depends_on IN (SELECT value FROM json_each(?))
+        """,
+        (json.dumps(list(nodes)),),
+    ).fetchall()
+    values = {node: float(row["critical_path"] or 0.0) for node, row in nodes.items()}
+    children: Dict[str, List[str]] = {}
+    pending: Dict[str, int] = {node: 0 for node in nodes}
+    for child, parent, stored in edges:
+        children.setdefault(parent, []).append(child)
+        if child in nodes:
+            pending[parent] += 1
+        else:
+            values[child] = float(stored or 0.0)
+    parents: Dict[str, List[str]] = {}
+    for parent, kids in children.items():
+        for child in kids:
+            if child in nodes:
+                parents.setdefault(child, []).append(parent)
+
+    ready = [node for node, count in pending.items() if count == 0]
+    updates = []
+    while ready:
+        node = ready.pop()
+        row = nodes[node]
+        downstream = max((values[c] for c in children.get(node, [])), default=0.0)
+        value = _runtime_estimate(row["time_limit"], row["predicted_runtime"]) + downstream
+        if value != values[node]:
+            values[node] = value
+            updates.append((value, node))
+        for parent in parents.get(node, []):
+            pending[parent] -= 1
+            if pending[parent] == 0:
+                ready.append(parent)
+    conn.executemany("UPDATE jobs SET critical_path = ? WHERE id = ?", updates)
+    return len(updates)
+
+
+def current_user() -> str:
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "unknown"
+
+
+def _admission_limits(conn: sqlite3.Connection) -> Dict[str, float]:
+    limits: Dict[str, float] = {}
+    for name, env_var in ADMISSION_LIMITS.items():
+        raw = os.getenv(env_var)
+        if raw:
+            try:
+                limits[name] = float(raw)
+            except ValueError:
+                pass
+    rows = conn.execute(
+        "SELECT key, value FROM meta WHERE key LIKE 'admission.%'"
+    ).fetchall()
+    for key, value in rows:
+        try:
+            limits[key.split(".", 1)[1]] = float(value)
+        except ValueError:
+            continue
+    return {name: value for name, value in limits.items() if value > 0}
+
+
+def _check_admission(conn: sqlite3.Connection, user: str, count: int) -> None:
+    """Reject ``count`` new jobs for ``user`` if they would exceed a limit.
+
+    Must run inside the inserting transaction (``BEGIN IMMEDIATE``) so the
+    check and the insert are atomic across processes.
+    """
+    limits = _admission_limits(conn)
+    if not limits:
+        return
+    if "max_queued" in limits:
+        queued = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+        if queued + count > limits["max_queued"]:
+            raise AdmissionError(
+                f"queue is full ({queued}/{int(limits['max_queued'])} jobs queued)"
+            )
+    if "max_queued_per_user" in limits:
+        queued = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND user = ?",
+            (user,),
+        ).fetchone()[0]
+        if queued + count > limits["max_queued_per_user"]:
+            raise AdmissionError(
+                f"user {user} has {queued}/{int(limits['max_queued_per_user'])} jobs queued"
+            )
+    if "max_submit_rate" in limits:
+        _take_submit_tokens(conn, user, count, limits["max_submit_rate"])
+
+
+def _take_submit_tokens(conn: sqlite3.Connection, user: str, count: int, rate: float) -> None:
+    # Token bucket per user; the burst size equals one second of submissions,
+    # but a single batch larger than that is still admitted from a full bucket.
+    key = f"submit_bucket.{user}"
+    now = time.time()
+    burst = max(1.0, rate, float(count))
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    tokens, stamp = burst, now
+    if row:
+        try:
+            tokens, stamp = json.loads(row[0])
+        except (TypeError, ValueError):
+            pass
+    tokens = min(burst, tokens + (now - stamp) * rate)
+    if tokens < count:
+        raise AdmissionError(
+            f"submission rate limit of {rate:g}/s exceeded for {user}",
+            retry_after=(count - tokens) / rate,
+        )
+    conn.execute(
+        """
+        INSERT INTO meta (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """,
+        (key, json.dumps([tokens - count, now])),
+    )
+
+
+@_timed
+def get_admission_limits() -> Dict[str, float]:
+    with _connect() as conn:
+        return _admission_limits(conn)
+
+
+@_timed
+def set_admission_limit(name: str, value: Optional[float]) -> None:
+    if name not in ADMISSION_LIMITS:
+        raise ValueError(f"unknown admission limit '{name}'")
+    with _connect() as conn:
+        if value is None:
+            conn.execute("DELETE FROM meta WHERE key = ?", (f"admission.{name}",))
+        else:
+            conn.execute(
+                """
+                INSERT INTO meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """,
+                (f"admission.{name}", str(value)),
+            )
+
+
+@_timed
+def admission_status() -> Dict:
+    with _connect() as conn:
+        limits = _admission_limits(conn)
+        total = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+        by_user = conn.execute(
+            """
+            SELECT COALESCE(user, '-') AS user, COUNT(*) AS queued
+            FROM jobs
+            WHERE status = 'queued'
+            GROUP BY user
+            ORDER BY queued DESC
+            """
+        ).fetchall()
+    return {
+        "limits": limits,
+        "queued": total,
+        "queued_by_user": {row["user"]: row["queued"] for row in by_user},
+    }
+
+
+@_timed
 def add_dependencies(job_id: str, depends_on: List[str]) -> None:
     if not depends_on:
         return
@@ -165,15 +649,128 @@ def add_dependencies(job_id: str, depends_on: List[str]) -> None:
             "INSERT INTO job_deps (job_id, depends_on) VALUES (?, ?)",
             [(job_id, dep) for dep in depends_on],
         )
+        if _critical_path_enabled():
+            _propagate_critical_paths(conn, [job_id])
+
+
+@_timed
+def get_job_dependencies(job_id: str) -> List[str]:
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT depends_on FROM job_deps WHERE job_id = ?",
+            (job_id,),
+        ).fetchall()
+    return [row["depends_on"] for row in rows]
 
 
+@_timed
+def get_dependencies(job_ids: List[str]) -> Dict[str, List[str]]:
+    """Dependencies of many jobs in one query; jobs without any are omitted."""
+    if not job_ids:
+        return {}
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT job_id, depends_on FROM job_deps WHERE job_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(job_ids)),),
+        ).fetchall()
+    result: Dict[str, List[str]] = {}
+    for row in rows:
+        result.setdefault(row["job_id"], []).append(row["depends_on"])
+    return result
+
+
+@_timed
 def get_job(job_id: str) -> Optional[Dict]:
     with _connect() as conn:
         row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
     return _row_to_job(row) if row else None
 
 
-def list_jobs(statuses: Optional[Iterable[str]] = None) -> List[Dict]:
+@_timed
+def get_jobs(job_ids: List[str], statuses: Optional[Iterable[str]] = None) -> List[Dict]:
+    """Fetch many jobs in one query, optionally only those in ``statuses``."""
+    if not job_ids:
+        return []
+    query = "SELECT * FROM jobs WHERE id IN (SELECT value FROM json_each(?))"
+    params: List = [json.dumps(list(job_ids))]
+    if statuses:
+        statuses = list(statuses)
+        query += f" AND status IN ({','.join('?' for _ in statuses)})"
+        params.extend(statuses)
+    with _connect() as conn:
+        rows = conn.execute(query + " ORDER BY finished_at, rowid", params).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+
+@_timed
+def data_version() -> int:
+    """Changes whenever another connection commits to the database."""
+    with _connect() as conn:
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+# A dedicated connection shared by all threads: PRAGMA data_version is only
+# comparable between calls on the same connection.
+_TOKEN_LOCK = threading.Lock()
+_TOKEN_CONN: Optional[Tuple[sqlite3.Connection, str, Optional[Tuple[int, int]], str]] = None
+
+
+@_timed
+def change_token() -> str:
+    """Process-wide token that changes whenever any connection commits."""
+    global _TOKEN_CONN
+    path = db_path()
+    with _TOKEN_LOCK:
+        cached = _TOKEN_CONN
+        if cached is None or cached[1] != path or cached[2] != _file_identity(path):
+            if cached is not None:
+                cached[0].close()
+            _connect()
+            conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            cached = (conn, path, _file_identity(path), uuid.uuid4().hex[:8])
+            _TOKEN_CONN = cached
+        version = cached[0].execute("PRAGMA data_version").fetchone()[0]
+    return f"{cached[3]}.{version}"
+
+
+@_timed
+def latest_job_event() -> int:
+    with _connect() as conn:
+        row = conn.execute("SELECT MAX(seq) FROM job_events").fetchone()
+    return row[0] or 0
+
+
+@_timed
+def job_events_since(seq: int, limit: int = 1000) -> Tuple[List[Tuple[int, str, Optional[str]]], bool]:
+    """Job status changes after ``seq`` as ``(seq, job_id, status)``, oldest first.
+
+    The flag is false when events after ``seq`` were already pruned, or more
+    than ``limit`` are pending; callers should then reload instead of
+    applying the events.
+    """
+    with _connect() as conn:
+        oldest = conn.execute("SELECT MIN(seq) FROM job_events").fetchone()[0]
+        rows = conn.execute(
+            "SELECT seq, job_id, status FROM job_events WHERE seq > ? ORDER BY seq LIMIT ?",
+            (seq, limit + 1),
+        ).fetchall()
+    complete = len(rows) <= limit and (oldest is None or oldest <= seq + 1)
+    return [(row[0], row[1], row[2]) for row in rows[:limit]], complete
+
+
+@_timed
+def prune_job_events(keep: int = 10000) -> int:
+    with _connect() as conn:
+        result = conn.execute(
+            "DELETE FROM job_events WHERE seq <= (SELECT MAX(seq) FROM job_events) - ?",
+            (keep,),
+        )
+    return result.rowcount or 0
+
+
+@_timed
+def list_jobs(statuses: Optional[Iterable[str]] = None, limit: Optional[int] = None) -> List[Dict]:
+    limit_sql = f"LIMIT {int(limit)}" if limit is not None else ""
     with _connect() as conn:
         if statuses:
             placeholders = ",".join("?" for _ in statuses)
@@ -182,15 +779,76 @@ def list_jobs(statuses: Optional[Iterable[str]] = None) -> List[Dict]:
                 SELECT * FROM jobs
                 WHERE status IN ({placeholders})
                 ORDER BY created_at
+                {limit_sql}
                 """,
                 list(statuses),
             ).fetchall()
         else:
             rows = conn.execute(
-                "SELECT * FROM jobs ORDER BY created_at"
+                f"SELECT * FROM jobs ORDER BY created_at {limit_sql}"
             ).fetchall()
     return [_row_to_job(row) for row in rows]
 
+@_timed
+def count_jobs_by_status_and_tag() -> List[Tuple[str, str, int]]:
+    with _connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT status, COALESCE(memory_tag, '') AS memory_tag, COUNT(*) AS n
+            FROM jobs
+            GROUP BY status, COALESCE(memory_tag, '')
+            """
+        ).fetchall()
+    return [(row["status"], row["memory_tag"], row["n"]) for row in rows]
+
+
+@_timed
+def count_jobs_by_status() -> Dict[str, int]:
+    with _connect() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+    return {row["status"]: row["n"] for row in rows}
+
+
+@_timed
+def list_jobs_window(
+    statuses: List[str],
+    offset: int,
+    limit: int,
+    counts: Optional[Dict[str, int]] = None,
+) -> List[Dict]:
+    """Rows ``offset`` to ``offset + limit`` of the jobs in ``statuses``.
+
+    Jobs are ordered by position in ``statuses``, then by creation, and each
+    status is read through ``idx_jobs_status_created``. Statuses that end
+    before the window are skipped by their count (``counts`` as returned by
+    ``count_jobs_by_status()``, queried if not given).
+    """
+    if counts is None:
+        counts = count_jobs_by_status()
+    jobs: List[Dict] = []
+    with _connect() as conn:
+        for status in statuses:
+            if len(jobs) >= limit:
+                break
+            available = counts.get(status, 0)
+            if offset >= available:
+                offset -= available
+                continue
+            rows = conn.execute(
+                """
+                SELECT * FROM jobs
+                WHERE status = ?
+                ORDER BY created_at, rowid
+                LIMIT ? OFFSET ?
+                """,
+                (status, limit - len(jobs), offset),
+            ).fetchall()
+            jobs.extend(_row_to_job(row) for row in rows)
+            offset = 0
+    return jobs
+
+
+@_timed
 def list_recent_jobs(limit: int = 10, statuses: Optional[Iterable[str]] = None) -> List[Dict]:
     with _connect() as conn:
         if statuses:
@@ -215,9 +873,12 @@ def list_recent_jobs(limit: int = 10, statuses: Optional[Iterable[str]] = None)
             ).fetchall()
     return [_row_to_job(row) for row in rows]
 
+@_timed
 def list_ready_jobs(limit: Optional[int] = None) -> List[Dict]:
     with _connect() as conn:
         limit_sql = f"LIMIT {int(limit)}" if limit else ""
+        # With RAVEL_CRITICAL_PATH=1, the longest remaining chain breaks priority ties.
+        tie_break_sql = "j.critical_path DESC, " if _critical_path_enabled() else ""
         rows = conn.execute(
             """
             SELECT j.*
@@ -228,35 +889,71 @@ def list_ready_jobs(limit: Optional[int] = None) -> List[Dict]:
                 FROM job_deps d
                 JOIN jobs dep ON dep.id = d.depends_on
                 WHERE d.job_id = j.id
-                  AND dep.status != 'done'
+                  AND dep.status NOT IN ('done', 'cached')
               )
-            ORDER BY j.priority DESC, j.created_at ASC, j.rowid ASC
+            ORDER BY j.priority DESC, """
+            + tie_break_sql
+            + """j.created_at ASC, j.rowid ASC
             """
             + limit_sql
         ).fetchall()
     return [_row_to_job(row) for row in rows]
 
 
+@_timed
 def mark_blocked_jobs_due_to_failed_deps() -> int:
+    blocked = """
+        status = 'queued'
+        AND EXISTS (
+            SELECT 1
+            FROM job_deps d
+            JOIN jobs dep ON dep.id = d.depends_on
+            WHERE d.job_id = jobs.id
+              AND dep.status IN ('failed', 'blocked', 'timeout')
+        )
+    """
     with _connect() as conn:
-        result = conn.execute(
-            """
-            UPDATE jobs
-            SET status = 'blocked'
-            WHERE status = 'queued'
-              AND EXISTS (
-                SELECT 1
-                FROM job_deps d
-                JOIN jobs dep ON dep.id = d.depends_on
-                WHERE d.job_id = jobs.id
-                  AND dep.status IN ('failed', 'blocked')
-              )
-            """
+        if conn.execute(f"SELECT 1 FROM jobs WHERE {blocked} LIMIT 1").fetchone() is None:
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        job_ids = [row[0] for row in conn.execute(f"SELECT id FROM jobs WHERE {blocked}")]
+        tasks = _task_commands(conn, blocked)
+        conn.execute(
+            f"UPDATE jobs SET status = 'blocked', finished_at = ? WHERE {blocked}",
+            (current_time().isoformat(timespec="seconds"),),
         )
-    return result.rowcount
+        # Blocked jobs never reach set_job_finished; count them here.
+        for job_id in job_ids:
+            _record_rollups(conn, job_id, None)
+        conn.execute("COMMIT")
+    _remove_tasks(tasks)
+    return len(job_ids)
+
+
+def _task_commands(conn: sqlite3.Connection, where: str, params: tuple = ()) -> List[str]:
+    """Commands of the ``submit_fn`` jobs matching ``where``."""
+    rows = conn.execute(
+        f"SELECT command FROM jobs WHERE ({where}) AND command LIKE '%ravel.worker%'",
+        params,
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _remove_tasks(commands: List[str]) -> None:
+    if not commands:
+        return
+    from .worker import remove_task
+
+    for command in commands:
+        remove_task(json.loads(command))
 
 
-def try_claim_job(job_id: str, gpus_assigned: List[int]) -> bool:
+@_timed
+def try_claim_job(
+    job_id: str,
+    gpus_assigned: List[int],
+    cpus_assigned: Optional[List[int]] = None,
+) -> bool:
     with _connect() as conn:
         conn.execute("BEGIN IMMEDIATE")
         result = conn.execute(
@@ -264,12 +961,14 @@ def try_claim_job(job_id: str, gpus_assigned: List[int]) -> bool:
             UPDATE jobs
             SET status = 'running',
                 started_at = ?,
-                gpus_assigned = ?
+                gpus_assigned = ?,
+                cpus_assigned = ?
             WHERE id = ? AND status = 'queued'
             """,
             (
-                datetime.now().isoformat(timespec="seconds"),
+                current_time().isoformat(timespec="seconds"),
                 json.dumps(gpus_assigned),
+                json.dumps(cpus_assigned) if cpus_assigned else None,
                 job_id,
             ),
         )
@@ -277,6 +976,25 @@ def try_claim_job(job_id: str, gpus_assigned: List[int]) -> bool:
     return result.rowcount == 1
 
 
+@_timed
+def requeue_job(job_id: str) -> bool:
+    """Return a claimed job that never started a process to the queue."""
+    with _connect() as conn:
+        result = conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'queued',
+                started_at = NULL,
+                gpus_assigned = NULL,
+                cpus_assigned = NULL
+            WHERE id = ? AND status = 'running' AND pid IS NULL
+            """,
+            (job_id,),
+        )
+    return result.rowcount == 1
+
+
+@_timed
 def set_job_assigned_gpus(job_id: str, gpus_assigned: List[int]) -> None:
     with _connect() as conn:
         conn.execute(
@@ -284,6 +1002,7 @@ def set_job_assigned_gpus(job_id: str, gpus_assigned: List[int]) -> None:
             (json.dumps(gpus_assigned), job_id),
         )
 
+@_timed
 def set_job_pid(job_id: str, pid: int) -> None:
     with _connect() as conn:
         conn.execute(
@@ -292,15 +1011,24 @@ def set_job_pid(job_id: str, pid: int) -> None:
         )
 
 
+@_timed
 def set_job_finished(
     job_id: str,
     status: str,
     returncode: Optional[int],
     stdout: str,
     stderr: str,
+    runtime: Optional[float] = None,
+    raw_output: Optional[Dict[str, bytes]] = None,
 ) -> None:
-    finished_at = datetime.now().isoformat(timespec="seconds")
+    finished_at = current_time().isoformat(timespec="seconds")
+    text = {"stdout": stdout, "stderr": stderr}
     with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT finished_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        # A job can be finished twice (``ravel stop``, then the daemon when the
+        # process exits); it is rolled up once, when finished_at is first set.
+        first_finish = row is not None and row["finished_at"] is None
         conn.execute(
             """
             UPDATE jobs
@@ -314,28 +1042,462 @@ def set_job_finished(
             """,
             (status, finished_at, returncode, stdout, stderr, job_id),
         )
+        # Output that is not valid UTF-8 was decoded with replacement
+        # characters; keep its bytes so offsets taken while the job ran still
+        # line up (see spool.read_chunk). Same transaction as the status.
+        for stream, data in (raw_output or {}).items():
+            if data != (text[stream] or "").encode():
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_output (job_id, stream, data) VALUES (?, ?, ?)",
+                    (job_id, stream, sqlite3.Binary(data)),
+                )
+        if status == "done":
+            _record_runtime(conn, job_id, finished_at, runtime)
+        if first_finish:
+            _record_rollups(conn, job_id, runtime)
+        conn.execute("COMMIT")
+
+
+def _record_runtime(
+    conn: sqlite3.Connection,
+    job_id: str,
+    finished_at: str,
+    runtime: Optional[float],
+) -> None:
+    """Fold a successful run into its signature's statistics in O(1)."""
+    job = conn.execute(
+        "SELECT command, signature, started_at, peak_rss, gpu_mem_peak FROM jobs WHERE id = ?",
+        (job_id,),
+    ).fetchone()
+    if not job:
+        return
+    if runtime is None:
+        if not job["started_at"]:
+            return
+        try:
+            runtime = (
+                datetime.fromisoformat(finished_at) - datetime.fromisoformat(job["started_at"])
+            ).total_seconds()
+        except ValueError:
+            return
+    runtime = max(0.0, runtime)
+    signature = job["signature"] or history.signature(json.loads(job["command"]))
+    stats = conn.execute(
+        "SELECT * FROM runtime_stats WHERE signature = ?", (signature,)
+    ).fetchone()
+    peak_rss = job["peak_rss"]
+    gpu_mem_peak = job["gpu_mem_peak"]
+    if stats:
+        if peak_rss is not None and stats["peak_rss"] is not None:
+            peak_rss = history.update_ewma(stats["peak_rss"], peak_rss)
+        elif peak_rss is None:
+            peak_rss = stats["peak_rss"]
+        if stats["gpu_mem_peak"] is not None:
+            gpu_mem_peak = max(gpu_mem_peak or 0, stats["gpu_mem_peak"])
+    conn.execute(
+        """
+        INSERT INTO runtime_stats (signature, count, ewma, histogram, peak_rss, gpu_mem_peak, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(signature) DO UPDATE SET
+            count = excluded.count,
+            ewma = excluded.ewma,
+            histogram = excluded.histogram,
+            peak_rss = excluded.peak_rss,
+            gpu_mem_peak = excluded.gpu_mem_peak,
+            updated_at = excluded.updated_at
+        """,
+        (
+            signature,
+            (stats["count"] if stats else 0) + 1,
+            history.update_ewma(stats["ewma"] if stats else None, runtime),
+            json.dumps(history.add_sample(json.loads(stats["histogram"]) if stats else [], runtime)),
+            peak_rss,
+            gpu_mem_peak,
+            finished_at,
+        ),
+    )
+    if _critical_path_enabled():
+        # Queued jobs of this signature now have a different estimate.
+        predicted = _predicted_runtime(conn, signature)
+        queued = [
+            row[0]
+            for row in conn.execute(
+                "SELECT id FROM jobs WHERE signature = ? AND status = 'queued' AND predicted_runtime IS NOT ?",
+                (signature, predicted),
+            )
+        ]
+        if queued:
+            conn.execute(
+                "UPDATE jobs SET predicted_runtime = ? WHERE signature = ? AND status = 'queued'",
+                (predicted, signature),
+            )
+            _propagate_critical_paths(conn, queued)
+
+
+_ROLLUP_JOB_COLUMNS = "status, command, user, memory_tag, created_at, started_at, finished_at, gpus_assigned"
+
+
+def _seconds_between(start: Optional[str], end: Optional[str]) -> Optional[float]:
+    if not start or not end:
+        return None
+    try:
+        return max(0.0, (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds())
+    except ValueError:
+        return None
+
+
+def _rollup_entries(job: sqlite3.Row, runtime: Optional[float] = None) -> Dict[Tuple[str, str, str, str], Dict]:
+    """The rollup rows one finished job contributes to, as partial rows."""
+    if runtime is None:
+        runtime = _seconds_between(job["started_at"], job["finished_at"])
+    wait = _seconds_between(job["created_at"], job["started_at"])
+    gpus = len(json.loads(job["gpus_assigned"])) if job["gpus_assigned"] else 0
+    row = {
+        "jobs": 1,
+        "failed": 1 if job["status"] in rollups.FAILED_STATUSES else 0,
+        "cached": 1 if job["status"] == "cached" else 0,
+        "gpu_seconds": gpus * (runtime or 0.0),
+        "runtime_seconds": runtime or 0.0,
+        "wait_seconds": wait or 0.0,
+    }
+    keys = rollups.dimension_keys(job["user"], job["memory_tag"], json.loads(job["command"]))
+    # Each entry gets its own sketches because rebuilds merge into them.
+    return {
+        (period, dimension, bucket, key): dict(
+            row,
+            wait_sketch=rollups.add_to_sketch({}, wait),
+            runtime_sketch=rollups.add_to_sketch({}, runtime),
+        )
+        for period, bucket in rollups.buckets(job["finished_at"])
+        for dimension, key in keys
+    }
+
+
+def _merge_rollup_row(into: Dict, row: Dict) -> Dict:
+    for field in ("jobs", "failed", "cached", "gpu_seconds", "runtime_seconds", "wait_seconds"):
+        into[field] += row[field]
+    for field in ("wait_sketch", "runtime_sketch"):
+        rollups.merge_sketches(into[field], row[field])
+    return into
+
+
+def _write_rollups(conn: sqlite3.Connection, entries: Dict[Tuple[str, str, str, str], Dict]) -> None:
+    for ident, row in entries.items():
+        current = conn.execute(
+            """
+            SELECT * FROM job_rollups
+            WHERE period = ? AND dimension = ? AND bucket = ? AND key = ?
+            """,
+            ident,
+        ).fetchone()
+        if current:
+            row = _merge_rollup_row(_rollup_row(current), row)
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO job_rollups (
+                period, dimension, bucket, key, jobs, failed, cached,
+                gpu_seconds, runtime_seconds, wait_seconds, wait_sketch, runtime_sketch
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                *ident,
+                row["jobs"],
+                row["failed"],
+                row["cached"],
+                row["gpu_seconds"],
+                row["runtime_seconds"],
+                row["wait_seconds"],
+                json.dumps(row["wait_sketch"]),
+                json.dumps(row["runtime_sketch"]),
+            ),
+        )
+
+
+def _record_rollups(conn: sqlite3.Connection, job_id: str, runtime: Optional[float]) -> None:
+    job = conn.execute(
+        f"SELECT {_ROLLUP_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    if job and job["finished_at"]:
+        _write_rollups(conn, _rollup_entries(job, runtime))
+
+
+def _rebuild_rollups(conn: sqlite3.Connection) -> int:
+    entries: Dict[Tuple[str, str, str, str], Dict] = {}
+    count = 0
+    rows = conn.execute(
+        f"SELECT {_ROLLUP_JOB_COLUMNS} FROM jobs WHERE finished_at IS NOT NULL AND status != 'running'"
+    )
+    for job in rows:
+        count += 1
+        for ident, row in _rollup_entries(job).items():
+            if ident in entries:
+                _merge_rollup_row(entries[ident], row)
+            else:
+                entries[ident] = row
+    conn.execute("DELETE FROM job_rollups")
+    _write_rollups(conn, entries)
+    return count
+
+
+def _rollup_row(row: sqlite3.Row) -> Dict:
+    result = dict(row)
+    result["wait_sketch"] = json.loads(result["wait_sketch"])
+    result["runtime_sketch"] = json.loads(result["runtime_sketch"])
+    return result
+
+
+@_timed
+def rebuild_rollups() -> int:
+    """Recompute all rollups from the jobs table; jobs already cleared are lost."""
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        count = _rebuild_rollups(conn)
+        conn.execute("COMMIT")
+    return count
+
+
+@_timed
+def job_stats(dimension: str = "all", since: Optional[datetime] = None) -> List[Dict]:
+    """Per-key totals and wait/runtime quantiles for jobs finished since ``since``."""
+    if dimension not in rollups.DIMENSIONS:
+        raise ValueError(f"unknown dimension {dimension!r}; use one of {', '.join(rollups.DIMENSIONS)}")
+    now = current_time()
+    since = since or now - timedelta(days=7)
+    period = rollups.period_for(since, now)
+    with _connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT * FROM job_rollups
+            WHERE period = ? AND dimension = ? AND bucket >= ?
+            """,
+            (period, dimension, rollups.first_bucket(period, since)),
+        ).fetchall()
+    by_key: Dict[str, List[Dict]] = {}
+    for row in rows:
+        by_key.setdefault(row["key"], []).append(_rollup_row(row))
+    stats = [rollups.summarize(key, key_rows) for key, key_rows in by_key.items()]
+    stats.sort(key=lambda s: (-s["jobs"], s["key"]))
+    return stats
+
+
+@_timed
+def prune_rollups() -> int:
+    cutoff = current_time() - rollups.hourly_retention()
+    with _connect() as conn:
+        result = conn.execute(
+            "DELETE FROM job_rollups WHERE period = 'hour' AND bucket < ?",
+            (rollups.first_bucket("hour", cutoff),),
+        )
+    return result.rowcount or 0
 
 
+@_timed
+def predict_runtimes(jobs: List[Dict]) -> List[Dict]:
+    """Attach current runtime and peak-memory predictions to ``jobs`` in place."""
+    if not jobs:
+        return jobs
+    signatures = {
+        job["id"]: job.get("signature") or history.signature(job["command"])
+        for job in jobs
+    }
+    with _connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT * FROM runtime_stats
+            WHERE signature IN (SELECT value FROM json_each(?))
+            """,
+            (json.dumps(sorted(set(signatures.values()))),),
+        ).fetchall()
+    stats = {row["signature"]: row for row in rows}
+    for job in jobs:
+        row = stats.get(signatures[job["id"]])
+        if not row:
+            job["predicted_runtime"] = None
+            job["predicted_runtime_p90"] = None
+            job["predicted_peak_rss"] = None
+            continue
+        job["predicted_runtime"] = round(row["ewma"], 1)
+        job["predicted_runtime_p90"] = history.quantile(json.loads(row["histogram"]), 0.9)
+        job["predicted_peak_rss"] = int(row["peak_rss"]) if row["peak_rss"] is not None else None
+    return jobs
+
+
+@_timed
+def set_job_cache_key(job_id: str, cache_key: str) -> None:
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET cache_key = ? WHERE id = ?",
+            (cache_key, job_id),
+        )
+
+
+@_timed
+def get_cache_entry(key: str) -> Optional[Dict]:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+@_timed
+def put_cache_entry(key: str, size: int, now: float) -> None:
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO cache_entries (key, size, created_at, last_used)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                size = excluded.size,
+                created_at = excluded.created_at,
+                last_used = excluded.last_used
+            """,
+            (key, size, now, now),
+        )
+
+
+@_timed
+def touch_cache_entry(key: str) -> None:
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE cache_entries SET last_used = ? WHERE key = ?",
+            (time.time(), key),
+        )
+
+
+@_timed
+def list_cache_entries() -> List[Dict]:
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT * FROM cache_entries ORDER BY last_used ASC"
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+@_timed
+def delete_cache_entries(keys: List[str]) -> None:
+    if not keys:
+        return
+    with _connect() as conn:
+        conn.executemany(
+            "DELETE FROM cache_entries WHERE key = ?",
+            [(key,) for key in keys],
+        )
+
+
+@_timed
+def set_job_usage(job_id: str, usage: Dict) -> None:
+    with _connect() as conn:
+        conn.execute(
+            """
+            UPDATE jobs
+            SET peak_rss = ?,
+                cpu_seconds = ?,
+                gpu_util_mean = ?,
+                gpu_mem_peak = ?,
+                gpu_seconds = ?
+            WHERE id = ?
+            """,
+            (
+                usage.get("peak_rss"),
+                usage.get("cpu_seconds"),
+                usage.get("gpu_util_mean"),
+                usage.get("gpu_mem_peak"),
+                usage.get("gpu_seconds"),
+                job_id,
+            ),
+        )
+        conn.execute(
+            """
+            INSERT INTO job_usage (job_id, samples)
+            VALUES (?, ?)
+            ON CONFLICT(job_id) DO UPDATE SET samples = excluded.samples
+            """,
+            (job_id, json.dumps(usage.get("samples") or [])),
+        )
+
+
+@_timed
+def get_job_usage(job_id: str) -> List[List[float]]:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT samples FROM job_usage WHERE job_id = ?", (job_id,)
+        ).fetchone()
+    return json.loads(row[0]) if row else []
+
+
+@_timed
+def set_job_result(job_id: str, data: bytes) -> None:
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO job_results (job_id, data)
+            VALUES (?, ?)
+            ON CONFLICT(job_id) DO UPDATE SET data = excluded.data
+            """,
+            (job_id, sqlite3.Binary(data)),
+        )
+
+
+@_timed
+def get_job_result(job_id: str) -> Optional[bytes]:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT data FROM job_results WHERE job_id = ?", (job_id,)
+        ).fetchone()
+    return bytes(row[0]) if row else None
+
+
+@_timed
+def get_job_output(job_id: str, stream: str) -> Optional[bytes]:
+    """Raw bytes of a finished job's stream, stored only when they are not valid UTF-8."""
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT data FROM job_output WHERE job_id = ? AND stream = ?",
+            (job_id, stream),
+        ).fetchone()
+    return bytes(row[0]) if row else None
+
+
+@_timed
 def clear_jobs_for_tests() -> None:
     if os.getenv("RAVEL_TEST_MODE") != "1":
         console.print("[red]Refusing to clear jobs outside test mode[/]")
         return
     with _connect() as conn:
         conn.execute("DELETE FROM job_deps")
+        conn.execute("DELETE FROM job_usage")
+        conn.execute("DELETE FROM job_results")
+        conn.execute("DELETE FROM job_output")
         conn.execute("DELETE FROM jobs")
+        conn.execute("DELETE FROM runtime_stats")
+        conn.execute("DELETE FROM job_events")
+        conn.execute("DELETE FROM job_rollups")
 
 
+@_timed
 def clear_jobs(statuses: Optional[Iterable[str]] = None) -> int:
     with _connect() as conn:
+        # Running tasks delete their own file once loaded.
         if statuses:
+            statuses = list(statuses)
             placeholders = ",".join("?" for _ in statuses)
+            tasks = _task_commands(
+                conn, f"status IN ({placeholders}) AND status != 'running'", tuple(statuses)
+            )
             result = conn.execute(
                 f"DELETE FROM jobs WHERE status IN ({placeholders})",
-                list(statuses),
+                statuses,
             )
         else:
+            tasks = _task_commands(conn, "status != 'running'")
             result = conn.execute("DELETE FROM jobs")
         conn.execute("DELETE FROM job_deps")
+        conn.execute("DELETE FROM job_usage WHERE job_id NOT IN (SELECT id FROM jobs)")
+        conn.execute("DELETE FROM job_results WHERE job_id NOT IN (SELECT id FROM jobs)")
+        conn.execute("DELETE FROM job_output WHERE job_id NOT IN (SELECT id FROM jobs)")
+    _remove_tasks(tasks)
     return result.rowcount if result.rowcount is not None else 0
 
 
@@ -345,4 +1507,9 @@ def _row_to_job(row: sqlite3.Row) -> Dict:
     job["gpus_assigned"] = (
         json.loads(job["gpus_assigned"]) if job["gpus_assigned"] else []
     )
+    job["cpus_assigned"] = (
+        json.loads(job["cpus_assigned"]) if job.get("cpus_assigned") else []
+    )
+    for key in ("inputs", "outputs", "cache_env"):
+        job[key] = json.loads(job[key]) if job.get(key) else []
     return job
@@ -0,0 +1,306 @@
+"""Host telemetry in a memory-mapped ring buffer.
+
+The daemon samples CPU, memory and GPUs once per ``RAVEL_TELEMETRY_INTERVAL``
+(one ``nvidia-smi`` call for all GPUs) and writes fixed-size records into
+``telemetry.ring`` in the state dir. Readers map the file once and then read
+the latest snapshot or a time window straight from the mapping, so any
+number of readers cost no extra sampling and no syscalls per read.
+
+Layout: a header (magic, version, record size, capacity, GPU slots, sample
+interval, records written) followed by ``capacity`` records. Record ``n``
+lives in slot ``n % capacity`` and carries ``n`` at both ends; the writer
+clears the trailing copy before rewriting a slot, so a reader racing the
+writer sees mismatched copies and skips the record.
+"""
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .utils import console
+
+MAGIC = b"RVTL"
+VERSION = 1
+MAX_GPUS = 16
+
+_HEADER = struct.Struct("<4sIIIIdQ")
+_WRITTEN = struct.Struct("<Q")
+_WRITTEN_OFFSET = _HEADER.size - _WRITTEN.size
+_BODY = struct.Struct("<QdfQQfI" + "ffff" * MAX_GPUS)
+_TAIL = struct.Struct("<Q")
+RECORD_SIZE = _BODY.size + _TAIL.size
+
+
+def _state_dir() -> str:
+    return os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+
+
+def ring_path() -> str:
+    return os.path.join(_state_dir(), "telemetry.ring")
+
+
+def sample_interval() -> float:
+    try:
+        return max(0.0, float(os.getenv("RAVEL_TELEMETRY_INTERVAL", "2.0")))
+    except ValueError:
+        return 2.0
+
+
+def capacity() -> int:
+    try:
+        return max(2, int(os.getenv("RAVEL_TELEMETRY_CAPACITY", "1800")))
+    except ValueError:
+        return 1800
+
+
+class Ring:
+    """A mapped ring file; ``writable`` rings create or resize the file."""
+
+    def __init__(self, path: str, writable: bool = False, slots: int = 0, interval: float = 0.0):
+        self.path = path
+        if writable:
+            self._open_for_writing(slots, interval)
+        else:
+            with open(path, "rb") as handle:
+                self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.capacity, max_gpus, self.interval, _ = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE or max_gpus != MAX_GPUS:
+            self.close()
+            raise ValueError(f"{path} is not a ravel telemetry ring")
+
+    def _open_for_writing(self, slots: int, interval: float) -> None:
+        size = _HEADER.size + slots * RECORD_SIZE
+        header = _HEADER.pack(MAGIC, VERSION, RECORD_SIZE, slots, MAX_GPUS, interval, 0)
+        try:
+            with open(self.path, "r+b") as handle:
+                current = handle.read(_WRITTEN_OFFSET)
+                if current == header[:_WRITTEN_OFFSET] and os.fstat(handle.fileno()).st_size == size:
+                    # Same geometry: keep the history and the readers' mappings.
+                    self._map = mmap.mmap(handle.fileno(), size)
+                    return
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(header)
+            handle.truncate(size)
+        os.replace(tmp_path, self.path)
+        with open(self.path, "r+b") as handle:
+            self._map = mmap.mmap(handle.fileno(), size)
+
+    def close(self) -> None:
+        self._map.close()
+
+    @property
+    def written(self) -> int:
+        return _WRITTEN.unpack_from(self._map, _WRITTEN_OFFSET)[0]
+
+    def append(self, snapshot: Dict) -> None:
+        seq = self.written
+        offset = _HEADER.size + (seq % self.capacity) * RECORD_SIZE
+        gpus = snapshot.get("gpus", [])[:MAX_GPUS]
+        values: List[float] = []
+        for gpu in gpus:
+            values.extend((gpu["util_gpu"], gpu["util_mem"], gpu["memory_total"], gpu["memory_used"]))
+        values.extend([0.0] * (4 * MAX_GPUS - len(values)))
+        _TAIL.pack_into(self._map, offset + _BODY.size, 0)
+        _BODY.pack_into(
+            self._map,
+            offset,
+            seq,
+            snapshot["time"],
+            snapshot["cpu_percent"],
+            int(snapshot["memory_total"]),
+            int(snapshot["memory_used"]),
+            snapshot["memory_percent"],
+            len(gpus),
+            *values,
+        )
+        _TAIL.pack_into(self._map, offset + _BODY.size, seq)
+        _WRITTEN.pack_into(self._map, _WRITTEN_OFFSET, seq + 1)
+
+    def _record(self, seq: int) -> Optional[Dict]:
+        offset = _HEADER.size + (seq % self.capacity) * RECORD_SIZE
+        fields = _BODY.unpack_from(self._map, offset)
+        if fields[0] != seq or _TAIL.unpack_from(self._map, offset + _BODY.size)[0] != seq:
+            return None
+        gpu_count = fields[6]
+        gpus = []
+        for index in range(gpu_count):
+            util_gpu, util_mem, mem_total, mem_used = fields[7 + 4 * index: 11 + 4 * index]
+            gpus.append(
+                {
+                    "index": index,
+                    "util_gpu": round(util_gpu, 1),
+                    "util_mem": round(util_mem, 1),
+                    "memory_total": mem_total,
+                    "memory_used": mem_used,
+                }
+            )
+        return {
+            "time": fields[1],
+            "cpu_percent": round(fields[2], 1),
+            "memory_total": fields[3],
+            "memory_used": fields[4],
+            "memory_percent": round(fields[5], 1),
+            "gpus": gpus,
+        }
+
+    def latest(self) -> Optional[Dict]:
+        written = self.written
+        for seq in range(written - 1, max(-1, written - 3), -1):
+            record = self._record(seq)
+            if record is not None:
+                return record
+        return None
+
+    def history(self, seconds: float, now: Optional[float] = None) -> List[Dict]:
+        """Records from the last ``seconds``, oldest first."""
+        written = self.written
+        cutoff = (time.time() if now is None else now) - seconds
+        records = []
+        for seq in range(written - 1, max(-1, written - self.capacity - 1), -1):
+            record = self._record(seq)
+            if record is None:
+                continue
+            if record["time"] < cutoff:
+                break
+            records.append(record)
+        records.reverse()
+        return records
+
+
+_READER: Optional[Ring] = None
+_READER_LOCK = threading.Lock()
+
+
+def _reader() -> Optional[Ring]:
+    global _READER
+    with _READER_LOCK:
+        if _READER is not None and _READER.path == ring_path():
+            return _READER
+        try:
+            _READER = Ring(ring_path())
+        except (OSError, ValueError):
+            _READER = None
+        return _READER
+
+
+def _fresh(ring: Ring, record: Optional[Dict], max_age: Optional[float]) -> bool:
+    if record is None:
+        return False
+    limit = max_age if max_age is not None else max(3 * ring.interval, 5.0)
+    return time.time() - record["time"] <= limit
+
+
+def latest(max_age: Optional[float] = None) -> Optional[Dict]:
+    """Newest snapshot, or ``None`` if there is no ring or it has gone stale.
+
+    A stale mapping is dropped once, in case the daemon recreated the file.
+    """
+    global _READER
+    for _ in range(2):
+        ring = _reader()
+        if ring is None:
+            return None
+        record = ring.latest()
+        if _fresh(ring, record, max_age):
+            return record
+        with _READER_LOCK:
+            if _READER is ring:
+                _READER = None
+    return None
+
+
+def history(seconds: float) -> List[Dict]:
+    ring = _reader()
+    if ring is None:
+        return []
+    return ring.history(seconds)
+
+
+def sample() -> Dict:
+    import psutil
+
+    mem = psutil.virtual_memory()
+    return {
+        "time": time.time(),
+        "cpu_percent": psutil.cpu_percent(interval=None),
+        "memory_total": mem.total,
+        "memory_used": mem.used,
+        "memory_percent": mem.percent,
+        "gpus": gpu_stats(),
+    }
+
+
+def gpu_stats() -> List[Dict]:
+    if not shutil.which("nvidia-smi"):
+        return []
+    from .metrics import NVIDIA_SMI_SECONDS
+
+    try:
+        start = time.perf_counter()
+        result = subprocess.check_output(
+            [
+                "nvidia-smi",
+                "--query-gpu=index,utilization.gpu,utilization.memory,memory.total,memory.used",
+                "--format=csv,noheader,nounits",
+            ],
+            stderr=subprocess.DEVNULL,
+        )
+        NVIDIA_SMI_SECONDS.observe(time.perf_counter() - start)
+        gpus = []
+        for line in result.decode().strip().splitlines():
+            if not line.strip():
+                continue
+            idx, util, mem_util, mem_total, mem_used = [v.strip() for v in line.split(",")]
+            gpus.append(
+                {
+                    "index": int(idx),
+                    "util_gpu": float(util),
+                    "util_mem": float(mem_util),
+                    "memory_total": float(mem_total),
+                    "memory_used": float(mem_used),
+                }
+            )
+        return gpus
+    except Exception:
+        return []
+
+
+def _append_sample(ring: Ring, failing: Optional[str]) -> Optional[str]:
+    """Append one sample; return the error if it failed, logged when it changes."""
+    try:
+        ring.append(sample())
+    except Exception as exc:
+        message = str(exc) or type(exc).__name__
+        if message != failing:
+            console.print(f"[yellow]Could not sample resources: {message}[/]")
+        return message
+    return None
+
+
+def start_sampler() -> Optional[threading.Thread]:
+    interval = sample_interval()
+    if interval <= 0:
+        return None
+    ring = Ring(ring_path(), writable=True, slots=capacity(), interval=interval)
+
+    def run() -> None:
+        failing = None
+        while True:
+            began = time.monotonic()
+            failing = _append_sample(ring, failing)
+            time.sleep(max(0.0, interval - (time.monotonic() - began)))
+
+    thread = threading.Thread(target=run, name="ravel-telemetry", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,155 @@
+import glob
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+
+def parse_cpulist(value: str) -> List[int]:
+    cpus: List[int] = []
+    for part in value.strip().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+@lru_cache(maxsize=1)
+def numa_nodes() -> Dict[int, List[int]]:
+    allowed = set(available_cpus())
+    nodes: Dict[int, List[int]] = {}
+    for path in glob.glob("/sys/devices/system/node/node[0-9]*/cpulist"):
+        node = int(os.path.basename(os.path.dirname(path))[4:])
+        try:
+            with open(path, "r") as handle:
+                cpus = [c for c in parse_cpulist(handle.read()) if c in allowed]
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes[node] = cpus
+    if not nodes:
+        nodes[0] = sorted(allowed)
+    return nodes
+
+
+@lru_cache(maxsize=1)
+def gpu_numa_nodes() -> Dict[int, int]:
+    if not shutil.which("nvidia-smi"):
+        return {}
+    try:
+        result = subprocess.check_output(
+            [
+                "nvidia-smi",
+                "--query-gpu=index,pci.bus_id",
+                "--format=csv,noheader",
+            ],
+            stderr=subprocess.DEVNULL,
+        )
+    except Exception:
+        return {}
+    mapping: Dict[int, int] = {}
+    for line in result.decode().strip().splitlines():
+        if "," not in line:
+            continue
+        idx, bus_id = [v.strip() for v in line.split(",", 1)]
+        node = _pci_numa_node(bus_id)
+        if node is not None:
+            mapping[int(idx)] = node
+    return mapping
+
+
+def _pci_numa_node(bus_id: str) -> Optional[int]:
+    # nvidia-smi reports an 8-digit PCI domain; sysfs uses 4 lowercase digits.
+    domain, _, rest = bus_id.partition(":")
+    sysfs_id = f"{domain[-4:]}:{rest}".lower()
+    try:
+        with open(f"/sys/bus/pci/devices/{sysfs_id}/numa_node", "r") as handle:
+            node = int(handle.read().strip())
+    except (OSError, ValueError):
+        return None
+    return node if node >= 0 else None
+
+
+def allocate_cpus(
+    count: int,
+    reserved: Optional[Set[int]] = None,
+    gpus: Iterable[int] = (),
+) -> List[int]:
+    """Pick ``count`` free cores, preferring the NUMA node(s) of ``gpus``.
+
+    A request that fits on a single node is kept on one node; otherwise cores
+    are taken node by node, GPU-local nodes first. Returns an empty list if
+    fewer than ``count`` cores are free.
+    """
+    if count <= 0:
+        return []
+    reserved = reserved or set()
+    free_by_node = {
+        node: [c for c in cpus if c not in reserved]
+        for node, cpus in numa_nodes().items()
+    }
+    if sum(len(cpus) for cpus in free_by_node.values()) < count:
+        return []
+
+    gpu_nodes = gpu_numa_nodes()
+    preferred: Dict[int, int] = {}
+    for gpu in gpus:
+        node = gpu_nodes.get(gpu)
+        if node is not None:
+            preferred[node] = preferred.get(node, 0) + 1
+
+    order = sorted(
+        free_by_node,
+        key=lambda node: (-preferred.get(node, 0), -len(free_by_node[node]), node),
+    )
+    for node in order:
+        if len(free_by_node[node]) >= count:
+            return free_by_node[node][:count]
+
+    chosen: List[int] = []
+    for node in order:
+        chosen.extend(free_by_node[node][: count - len(chosen)])
+        if len(chosen) >= count:
+            break
+    return chosen
+
+
+@contextmanager
+def pinned_thread(cpus: List[int]) -> Iterator[None]:
+    """Pin the calling thread to ``cpus`` for the duration of the block.
+
+    Affinity is per thread on Linux and inherited by children, so a process
+    spawned inside the block is pinned from its first instruction, without a
+    ``preexec_fn`` (unsafe in the threaded daemon) or a window in which it
+    runs on other cores. If the mask cannot be set (e.g. a core went
+    offline) the child runs unpinned and a warning is printed.
+    """
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        yield
+        return
+    previous = os.sched_getaffinity(0)
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as exc:
+        from .utils import console
+
+        console.print(f"[yellow]Could not pin to cores {cpus}: {exc}; running unpinned[/]")
+        yield
+        return
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous)
@@ -0,0 +1,120 @@
+"""Compact binary trace of scheduler events for ``ravel simulate``.
+
+A trace file starts with ``MAGIC`` followed by records of a fixed header
+(kind, unix time, payload length) and a small JSON payload. Records are
+appended by the daemon when ``RAVEL_TRACE`` names a file. SUBMIT records
+come from the ``job_events`` feed, stamped with the job's ``created_at``, so
+every job queued while the daemon traces is recorded whether or not it ever
+starts. A SUBMIT may be written twice for one job (e.g. after a daemon
+restart); the copies are identical and readers keep the last.
+"""
+import json
+import os
+import struct
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b"RAVELTR1"
+_RECORD = struct.Struct("!BdI")
+
+SUBMIT = 1
+START = 2
+FINISH = 3
+GPUS = 4
+
+KIND_NAMES = {SUBMIT: "submit", START: "start", FINISH: "finish", GPUS: "gpus"}
+
+
+class TraceWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_gpus: Optional[Tuple[int, int]] = None
+        # Last job_events sequence number whose submissions were written.
+        self.events_seq: Optional[int] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._handle = open(path, "ab")
+        if self._handle.tell() == 0:
+            self._handle.write(MAGIC)
+            self._handle.flush()
+
+    def write(self, kind: int, timestamp: float, payload: Dict) -> None:
+        data = json.dumps(payload, separators=(",", ":")).encode()
+        with self._lock:
+            self._handle.write(_RECORD.pack(kind, timestamp, len(data)) + data)
+            self._handle.flush()
+
+    def submit(self, job: Dict, depends_on: List[str]) -> None:
+        self.write(
+            SUBMIT,
+            _timestamp(job.get("created_at")),
+            {
+                "id": job["id"],
+                "gpus": job.get("gpus", 1),
+                "cpus": job.get("cpus", 0),
+                "priority": job.get("priority", 0),
+                "memory_tag": job.get("memory_tag"),
+                "time_limit": job.get("time_limit"),
+                "user": job.get("user"),
+                "after": depends_on,
+            },
+        )
+
+    def start(self, job_id: str, timestamp: float, gpus: List[int]) -> None:
+        self.write(START, timestamp, {"id": job_id, "gpus": gpus})
+
+    def finish(self, job_id: str, timestamp: float, status: str, runtime: float) -> None:
+        self.write(FINISH, timestamp, {"id": job_id, "status": status, "runtime": round(runtime, 3)})
+
+    def gpus(self, timestamp: float, total: int, allocated: int) -> None:
+        if self._last_gpus == (total, allocated):
+            return
+        self._last_gpus = (total, allocated)
+        self.write(GPUS, timestamp, {"total": total, "allocated": allocated})
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+
+def read_trace(path: str) -> Iterator[Tuple[int, float, Dict]]:
+    with open(path, "rb") as handle:
+        if handle.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a ravel trace")
+        while True:
+            header = handle.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            kind, timestamp, length = _RECORD.unpack(header)
+            data = handle.read(length)
+            if len(data) < length:
+                # Truncated final record from a daemon that was killed mid-write.
+                return
+            yield kind, timestamp, json.loads(data)
+
+
+def _timestamp(value: Optional[str]) -> float:
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return 0.0
+
+
+_WRITER: Optional[TraceWriter] = None
+_WRITER_LOCK = threading.Lock()
+
+
+def get_writer() -> Optional[TraceWriter]:
+    global _WRITER
+    path = os.getenv("RAVEL_TRACE")
+    if not path:
+        return None
+    with _WRITER_LOCK:
+        if _WRITER is None or _WRITER.path != path:
+            if _WRITER is not None:
+                _WRITER.close()
+            _WRITER = TraceWriter(path)
+        return _WRITER
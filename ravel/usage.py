@@ -0,0 +1,270 @@
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+from . import telemetry
+
+# Each sample is [elapsed_seconds, rss_bytes, cpu_percent, gpu_util, gpu_mem_mb].
+Sample = List[float]
+
+
+def sample_interval() -> float:
+    try:
+        return max(0.0, float(os.getenv("RAVEL_USAGE_INTERVAL", "2.0")))
+    except ValueError:
+        return 2.0
+
+
+def max_samples() -> int:
+    try:
+        return max(2, int(os.getenv("RAVEL_USAGE_MAX_SAMPLES", "120")))
+    except ValueError:
+        return 120
+
+
+def start_sampler(
+    pid: int,
+    gpus_assigned: List[int],
+    baseline: Optional[Dict] = None,
+) -> Optional["UsageSampler"]:
+    interval = sample_interval()
+    if interval <= 0:
+        return None
+    sampler = UsageSampler(pid, gpus_assigned, interval=interval, limit=max_samples(), baseline=baseline)
+    sampler.start()
+    return sampler
+
+
+def snapshot(pid: int) -> Optional[Dict]:
+    """CPU seconds per pid and total RSS of a process tree right now.
+
+    A pooled worker outlives its tasks, so the daemon takes this before
+    handing a task over and the sampler reports usage above it.
+    """
+    try:
+        import psutil
+
+        root = psutil.Process(pid)
+        procs = [root] + root.children(recursive=True)
+    except Exception:
+        return None
+    cpu: Dict[int, float] = {}
+    rss = 0
+    for proc in procs:
+        try:
+            with proc.oneshot():
+                times = proc.cpu_times()
+                rss += proc.memory_info().rss
+        except psutil.Error:
+            continue
+        cpu[proc.pid] = (
+            times.user + times.system + getattr(times, "children_user", 0.0) + getattr(times, "children_system", 0.0)
+        )
+    return {"cpu": cpu, "rss": rss}
+
+
+class UsageSampler(threading.Thread):
+    """Samples a job's process tree until stopped.
+
+    Sampling is cheap relative to the interval: if a single sample takes
+    more than a tenth of the interval the interval is stretched, and once
+    the series reaches ``limit`` points adjacent samples are merged so the
+    stored series stays bounded for arbitrarily long jobs. With a
+    ``baseline`` from ``snapshot()``, CPU time and RSS are reported above it.
+    """
+
+    def __init__(
+        self,
+        pid: int,
+        gpus_assigned: List[int],
+        interval: float,
+        limit: int,
+        baseline: Optional[Dict] = None,
+    ):
+        super().__init__(name=f"ravel-usage-{pid}", daemon=True)
+        self.pid = pid
+        self.gpus_assigned = list(gpus_assigned)
+        self.interval = interval
+        self.limit = limit
+        self.samples: List[Sample] = []
+        self._stride = 1
+        self._pending: List[Sample] = []
+        self._cpu_by_pid: Dict[int, float] = {}
+        self._cpu_base: Dict[int, float] = dict(baseline["cpu"]) if baseline else {}
+        self._rss_base = baseline["rss"] if baseline else 0
+        self._procs: Dict[int, object] = {}
+        self._parents: Dict[int, int] = {}
+        self._peak_rss = 0
+        self._peak_gpu_mem = 0.0
+        self._gpu_util_sum = 0.0
+        self._gpu_util_count = 0
+        self._final_cpu: Optional[float] = None
+        self._t0 = time.monotonic()
+        self._halt = threading.Event()
+        self._has_nvidia = bool(self.gpus_assigned) and shutil.which("nvidia-smi") is not None
+
+    def run(self) -> None:
+        try:
+            import psutil
+        except ImportError:
+            return
+        try:
+            root = psutil.Process(self.pid)
+        except psutil.Error:
+            return
+        while not self._halt.is_set():
+            began = time.monotonic()
+            if not self._sample(root, psutil):
+                break
+            cost = time.monotonic() - began
+            if cost * 10 > self.interval:
+                self.interval = cost * 10
+            self._halt.wait(self.interval)
+
+    def stop(self, cpu_seconds: Optional[float] = None) -> Optional[Dict]:
+        """Stop sampling; ``cpu_seconds`` is the job's total from its exit rusage, if known."""
+        self._halt.set()
+        if self.is_alive():
+            self.join(timeout=5)
+        if cpu_seconds is not None:
+            self._final_cpu = cpu_seconds
+        return self.summary()
+
+    def summary(self) -> Optional[Dict]:
+        if not self.samples and not self._pending and not self._peak_rss:
+            return None
+        self._flush_pending()
+        wall = time.monotonic() - self._t0
+        gpu_util_mean = (
+            self._gpu_util_sum / self._gpu_util_count if self._gpu_util_count else None
+        )
+        sampled = sum(max(0.0, cpu - self._cpu_base.get(pid, 0.0)) for pid, cpu in self._cpu_by_pid.items())
+        return {
+            "peak_rss": self._peak_rss,
+            "cpu_seconds": round(max(sampled, self._final_cpu or 0.0), 3),
+            "gpu_util_mean": round(gpu_util_mean, 2) if gpu_util_mean is not None else None,
+            "gpu_mem_peak": int(self._peak_gpu_mem) if self._has_nvidia else None,
+            "gpu_seconds": round(wall * len(self.gpus_assigned), 3),
+            "samples": self.samples,
+        }
+
+    def _sample(self, root, psutil) -> bool:
+        try:
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return False
+        rss = 0
+        cpu_pct = 0.0
+        pids = set()
+        for proc in procs:
+            # Reuse Process objects so cpu_percent() measures since the last sample.
+            proc = self._procs.setdefault(proc.pid, proc)
+            try:
+                with proc.oneshot():
+                    rss += proc.memory_info().rss
+                    times = proc.cpu_times()
+                    cpu_pct += proc.cpu_percent(interval=None)
+                    parent = proc.ppid()
+            except psutil.Error:
+                continue
+            pids.add(proc.pid)
+            self._parents[proc.pid] = parent
+            # Children a process has waited for count towards it.
+            self._cpu_by_pid[proc.pid] = (
+                times.user + times.system + getattr(times, "children_user", 0.0) + getattr(times, "children_system", 0.0)
+            )
+        if not pids:
+            return False
+        for pid in list(self._cpu_by_pid):
+            # A process that exited under a live parent is now in the parent's children times.
+            if pid not in pids and self._parents.get(pid) in pids:
+                del self._cpu_by_pid[pid]
+        rss = max(0, rss - self._rss_base)
+        self._peak_rss = max(self._peak_rss, rss)
+
+        gpu_util = 0.0
+        gpu_mem = 0.0
+        if self._has_nvidia:
+            gpu_util, gpu_mem = _gpu_usage(self.gpus_assigned)
+            self._gpu_util_sum += gpu_util
+            self._gpu_util_count += 1
+            self._peak_gpu_mem = max(self._peak_gpu_mem, gpu_mem)
+
+        elapsed = round(time.monotonic() - self._t0, 3)
+        self._append([elapsed, rss, round(cpu_pct, 1), gpu_util, gpu_mem])
+        return True
+
+    def _append(self, sample: Sample) -> None:
+        self._pending.append(sample)
+        if len(self._pending) < self._stride:
+            return
+        self._flush_pending()
+        if len(self.samples) >= self.limit:
+            self.samples = downsample(self.samples)
+            self._stride *= 2
+
+    def _flush_pending(self) -> None:
+        if self._pending:
+            self.samples.append(merge_samples(self._pending))
+            self._pending = []
+
+
+def merge_samples(samples: List[Sample]) -> Sample:
+    count = len(samples)
+    return [
+        samples[-1][0],
+        max(s[1] for s in samples),
+        round(sum(s[2] for s in samples) / count, 1),
+        round(sum(s[3] for s in samples) / count, 1),
+        max(s[4] for s in samples),
+    ]
+
+
+def downsample(samples: List[Sample]) -> List[Sample]:
+    return [merge_samples(samples[i : i + 2]) for i in range(0, len(samples), 2)]
+
+
+# One nvidia-smi query shared by every job's sampler when the ring is stale.
+_GPU_STATS: tuple = (0.0, [])
+_GPU_STATS_LOCK = threading.Lock()
+
+
+def _gpu_stats() -> List[Dict]:
+    record = telemetry.latest()
+    if record and record["gpus"]:
+        return record["gpus"]
+    global _GPU_STATS
+    with _GPU_STATS_LOCK:
+        taken, gpus = _GPU_STATS
+        if time.monotonic() - taken >= sample_interval():
+            gpus = telemetry.gpu_stats()
+            _GPU_STATS = (time.monotonic(), gpus)
+        return gpus
+
+
+def _gpu_usage(gpus_assigned: List[int]) -> tuple:
+    """Mean utilization and memory used (MB) of the job's GPUs.
+
+    GPUs are assigned to one job at a time, so whole-device memory is the
+    job's. Read from the daemon's telemetry ring, which already samples every
+    GPU once per tick, instead of querying ``nvidia-smi`` per job.
+    """
+    mine = [gpu for gpu in _gpu_stats() if gpu["index"] in gpus_assigned]
+    if not mine:
+        return 0.0, 0.0
+    util = sum(gpu["util_gpu"] for gpu in mine) / len(mine)
+    return round(util, 1), sum(gpu["memory_used"] for gpu in mine)
+
+
+def format_bytes(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    units = ["B", "K", "M", "G", "T"]
+    size = float(value)
+    idx = 0
+    while size >= 1024 and idx < len(units) - 1:
+        size /= 1024
+        idx += 1
+    return f"{size:.1f}{units[idx]}"
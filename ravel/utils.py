@@ -1,16 +1,119 @@
-from typing import List, Optional, Set
+from datetime import datetime
+from typing import Callable, List, Optional, Set
 
-import shutil, os
-from rich.console import Console
+import re, shutil, os, sys, time
+
+from .metrics import GPUS_TOTAL, NVIDIA_SMI_SECONDS
+
+_TAG_RE = re.compile(r"\[([^\[\]]*)\]")
+_EMOJI_RE = re.compile(r":[a-z0-9_+-]+:")
+# Styles the CLI writes itself; any other bracketed text is left to rich.
+_CLI_STYLES = {"bold", "dim", "italic", "underline", "red", "green", "yellow", "blue", "cyan", "magenta", "white"}
+
+
+class _LazyConsole:
+    """Stands in for ``rich.console.Console`` until something needs rich.
+
+    Importing rich costs more than the rest of a ``ravel run --no-wait``
+    call, so short strings that only use the CLI's own style tags are
+    printed to a non-terminal with the tags stripped (which is what rich
+    prints there). Anything rich would render differently (other brackets,
+    escapes, emoji codes, tabs, lines it would wrap), terminals, renderables
+    and keyword options go to the real console.
+    """
+
+    def __init__(self):
+        self._console = None
+
+    def _real(self):
+        if self._console is None:
+            from rich.console import Console
+
+            self._console = Console()
+        return self._console
+
+    def print(self, *objects, **kwargs) -> None:
+        if self._console is None and not kwargs and _plain_output():
+            if all(isinstance(o, str) for o in objects):
+                plain = _strip_cli_markup(" ".join(objects))
+                if plain is not None:
+                    sys.stdout.write(plain + "\n")
+                    return
+        self._real().print(*objects, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._real(), name)
+
+
+def _strip_cli_markup(text: str) -> Optional[str]:
+    """``text`` without its tags, or ``None`` if rich could print it differently."""
+    if "\\" in text or "\t" in text or _EMOJI_RE.search(text):
+        return None
+    depth = 0
+    for match in _TAG_RE.finditer(text):
+        closing = match.group(1).startswith("/")
+        words = match.group(1).lstrip("/").split()
+        if not set(words) <= _CLI_STYLES or not (closing or words):
+            return None
+        # rich rejects a closing tag with nothing open.
+        depth += -1 if closing else 1
+        if depth < 0:
+            return None
+    plain = _TAG_RE.sub("", text)
+    if "[" in plain or any(len(line) > _plain_width() for line in plain.split("\n")):
+        return None
+    return plain
+
+
+def _plain_width() -> int:
+    # What rich uses when stdout is not a terminal.
+    try:
+        return int(os.environ.get("COLUMNS", "80"))
+    except ValueError:
+        return 80
+
+
+def _plain_output() -> bool:
+    if os.getenv("FORCE_COLOR") or os.getenv("TTY_COMPATIBLE") == "1":
+        return False
+    try:
+        return not sys.stdout.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+console = _LazyConsole()
+
+_clock: Optional[Callable[[], datetime]] = None
+
+
+def current_time() -> datetime:
+    """Wall-clock time, or virtual time while ``ravel simulate`` is replaying."""
+    return _clock() if _clock else datetime.now()
+
+
+def set_clock(clock: Optional[Callable[[], datetime]]) -> None:
+    global _clock
+    _clock = clock
+
+
+def _fake_gpu_count() -> Optional[int]:
+    try:
+        value = int(os.getenv("RAVEL_FAKE_GPUS", ""))
+    except ValueError:
+        return None
+    return max(0, value)
 
-console = Console()
 
 def get_free_gpus(requested: int = 1, reserved: Optional[Set[int]] = None) -> list[int]:
     reserved = reserved or set()
     if os.getenv("RAVEL_NO_GPU") == "1":
+        limit = _fake_gpu_count()
+        if limit is not None:
+            GPUS_TOTAL.set(limit)
         free = []
         candidate = 0
-        while len(free) < requested:
+        while len(free) < requested and (limit is None or candidate < limit):
             if candidate not in reserved:
                 free.append(candidate)
             candidate += 1
@@ -18,14 +121,24 @@ def get_free_gpus(requested: int = 1, reserved: Optional[Set[int]] = None) -> li
 
     if shutil.which("nvidia-smi"):
         try:
-            import subprocess
-            result = subprocess.check_output([
-                "nvidia-smi",
-                "--query-gpu=index,utilization.gpu",
-                "--format=csv,noheader,nounits"
-            ], stderr=subprocess.DEVNULL)
-
-            lines = result.decode().strip().splitlines()
+            from . import telemetry
+
+            # Use the daemon's shared sample when it is fresh instead of forking.
+            snapshot = telemetry.latest()
+            if snapshot and snapshot["gpus"]:
+                lines = [f"{gpu['index']}, {int(gpu['util_gpu'])}" for gpu in snapshot["gpus"]]
+            else:
+                import subprocess
+                start = time.perf_counter()
+                result = subprocess.check_output([
+                    "nvidia-smi",
+                    "--query-gpu=index,utilization.gpu",
+                    "--format=csv,noheader,nounits"
+                ], stderr=subprocess.DEVNULL)
+                NVIDIA_SMI_SECONDS.observe(time.perf_counter() - start)
+                lines = result.decode().strip().splitlines()
+
+            GPUS_TOTAL.set(sum(1 for line in lines if line.strip()))
             free = []
             for line in lines:
                 if not line.strip():
@@ -45,3 +158,26 @@ def get_free_gpus(requested: int = 1, reserved: Optional[Set[int]] = None) -> li
 
     console.print("[dim]No NVIDIA → pretending GPUs are available[/]")
     return list(range(requested))
+
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> float:
+    """Parse ``90``, ``1.5h``, ``1h30m`` or ``HH:MM:SS`` into seconds."""
+    text = str(value).strip().lower()
+    if not text:
+        raise ValueError("empty duration")
+    if ":" in text:
+        seconds = 0.0
+        for part in text.split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)([smhd])", text)
+    if not parts or "".join(n + u for n, u in parts) != text:
+        raise ValueError(f"invalid duration '{value}'")
+    return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
@@ -0,0 +1,431 @@
+"""Python-callable jobs and the worker processes that run them.
+
+``Client.submit_fn()`` pickles ``(func, args, kwargs)`` (with ``cloudpickle``
+when it is installed) into ``$RAVEL_STATE_DIR/tasks/`` and queues an
+ordinary job whose command is ``python -m ravel.worker run <task>``. The
+daemon recognizes that command and hands the task to a long-lived worker
+started with the job's GPUs in its environment, so a task pays neither
+interpreter start nor imports its module has already done. Idle workers are
+reused only for the same GPU assignment and thread count. A worker exits after
+``RAVEL_WORKER_MAX_TASKS`` tasks or once its RSS exceeds
+``RAVEL_WORKER_MAX_RSS_MB``, and idle workers are stopped after
+``RAVEL_WORKER_IDLE`` seconds. Without the pool the command runs the task in
+a fresh interpreter. Either way the pickled return value or exception is
+stored in ``job_results``.
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import cloudpickle as pickler
+except ImportError:  # Functions must then be importable by the worker.
+    import pickle as pickler
+
+_RUN_ARGS = ["-m", "ravel.worker", "run"]
+
+
+def pool_enabled() -> bool:
+    return os.getenv("RAVEL_WORKER_POOL", "1") != "0"
+
+
+def max_tasks() -> int:
+    try:
+        return max(1, int(os.getenv("RAVEL_WORKER_MAX_TASKS", "100")))
+    except ValueError:
+        return 100
+
+
+def max_rss() -> int:
+    try:
+        return int(float(os.getenv("RAVEL_WORKER_MAX_RSS_MB", "4096")) * 1024 * 1024)
+    except ValueError:
+        return 4096 * 1024 * 1024
+
+
+def idle_timeout() -> float:
+    try:
+        return max(0.0, float(os.getenv("RAVEL_WORKER_IDLE", "300")))
+    except ValueError:
+        return 300.0
+
+
+def task_dir() -> str:
+    state_dir = os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+    return os.path.join(state_dir, "tasks")
+
+
+def write_task(func, args: tuple, kwargs: dict) -> str:
+    os.makedirs(task_dir(), exist_ok=True)
+    path = os.path.join(task_dir(), f"{uuid.uuid4().hex}.pkl")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as handle:
+        pickler.dump((func, args, kwargs), handle)
+    os.replace(tmp_path, path)
+    return path
+
+
+def task_command(path: str) -> List[str]:
+    return [sys.executable, *_RUN_ARGS, path]
+
+
+def task_path(command: List[str]) -> Optional[str]:
+    """The task file of a ``submit_fn`` job, or None for other commands."""
+    if len(command) == 5 and command[1:4] == _RUN_ARGS:
+        return command[4]
+    return None
+
+
+def owns_task(path: str) -> bool:
+    """Whether ``path`` is a task file under ``task_dir()``.
+
+    Task paths come from job commands, which anyone can write; only files
+    ``write_task`` could have created are ever deleted.
+    """
+    directory = os.path.realpath(task_dir())
+    return os.path.dirname(os.path.realpath(path)) == directory and path.endswith(".pkl")
+
+
+def remove_task(command: List[str]) -> None:
+    """Delete the task file of a ``submit_fn`` job that will never run."""
+    path = task_path(command)
+    if path and owns_task(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_result(data: bytes):
+    """Return the stored value, or raise the exception the function raised."""
+    ok, value = pickler.loads(data)
+    if not ok:
+        raise value
+    return value
+
+
+def run_task(path: str, job_id: str) -> int:
+    from .store import set_job_result
+
+    try:
+        with open(path, "rb") as handle:
+            func, args, kwargs = pickler.load(handle)
+        outcome = (True, func(*args, **kwargs))
+    except BaseException as exc:
+        import traceback
+
+        traceback.print_exc()
+        outcome = (False, exc)
+    try:
+        data = pickler.dumps(outcome)
+    except Exception as exc:
+        outcome = (False, RuntimeError(f"could not pickle the result of {job_id}: {exc}"))
+        data = pickler.dumps(outcome)
+    set_job_result(job_id, data)
+    if owns_task(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return 0 if outcome[0] else 1
+
+
+class WorkerTask:
+    """``Popen``-like handle for a task running in a pooled worker."""
+
+    def __init__(self, pool: "WorkerPool", worker: "_Worker", usage_baseline: Optional[Dict] = None):
+        self.pid = worker.proc.pid
+        self.returncode: Optional[int] = None
+        # What the worker had used before this task (see usage.snapshot).
+        self.usage_baseline = usage_baseline
+        self._pool = pool
+        self._worker = worker
+        self._waiter = threading.Thread(target=self._wait_for_reply, daemon=True)
+        self._waiter.start()
+
+    def _wait_for_reply(self) -> None:
+        try:
+            line = self._worker.proc.stdout.readline()
+            reply = json.loads(line) if line else None
+        except (OSError, ValueError):
+            reply = None
+        if reply is None:
+            # The worker died (or was killed by a stop or time limit).
+            self._pool.discard(self._worker)
+            code = self._worker.proc.wait()
+            self.returncode = code if code else -signal.SIGKILL
+        else:
+            self.returncode = reply["returncode"]
+            self._pool.release(self._worker, recycle=reply.get("recycle", False))
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        self._waiter.join(timeout)
+        if self._waiter.is_alive():
+            raise subprocess.TimeoutExpired(["ravel-worker", str(self.pid)], timeout)
+        return self.returncode
+
+    def communicate(self, timeout: Optional[float] = None) -> Tuple[None, None]:
+        # Output went to the job's spool files.
+        self.wait(timeout)
+        return None, None
+
+    def send_signal(self, sig: int) -> None:
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+
+# GPU assignment and OMP_NUM_THREADS: both are read when a worker starts
+# (by CUDA and by the OpenMP runtime), so a worker only fits jobs that match.
+PoolKey = Tuple[Tuple[int, ...], Optional[str]]
+
+
+def pool_key(gpus: List[int], env: dict) -> PoolKey:
+    return tuple(gpus), env.get("OMP_NUM_THREADS")
+
+
+class _Worker:
+    def __init__(self, proc: subprocess.Popen, key: PoolKey):
+        self.proc = proc
+        self.key = key
+        self.idle_since = time.monotonic()
+
+
+class WorkerPool:
+    """Daemon-side set of worker processes, grouped by ``pool_key``."""
+
+    def __init__(self):
+        self._idle: Dict[PoolKey, List[_Worker]] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        path: str,
+        job_id: str,
+        gpus: List[int],
+        env: dict,
+        cwd: Optional[str],
+        cpus: Optional[List[int]],
+        stdout: str,
+        stderr: str,
+    ) -> Optional[WorkerTask]:
+        request = json.dumps(
+            {
+                "task": path,
+                "job_id": job_id,
+                "cwd": cwd,
+                "cpus": cpus or [],
+                "threads": env.get("OMP_NUM_THREADS"),
+                "stdout": stdout,
+                "stderr": stderr,
+            }
+        )
+        from .usage import snapshot
+
+        self.reap_idle()
+        # A worker may have exited while idle; try a fresh one before giving up.
+        for _ in range(2):
+            worker = self._acquire(pool_key(gpus, env), env)
+            if worker is None:
+                return None
+            baseline = snapshot(worker.proc.pid)
+            try:
+                worker.proc.stdin.write(request + "\n")
+                worker.proc.stdin.flush()
+            except OSError:
+                self.discard(worker)
+                continue
+            return WorkerTask(self, worker, baseline)
+        return None
+
+    def _acquire(self, key: PoolKey, env: dict) -> Optional[_Worker]:
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                worker = idle.pop()
+                if worker.proc.poll() is None:
+                    return worker
+        worker_env = dict(env)
+        worker_env.pop("RAVEL_JOB_ID", None)
+        try:
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "ravel.worker", "serve"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                env=worker_env,
+                close_fds=True,
+                start_new_session=True,
+            )
+        except OSError:
+            return None
+        return _Worker(proc, key)
+
+    def release(self, worker: _Worker, recycle: bool = False) -> None:
+        if recycle or worker.proc.poll() is not None:
+            self.discard(worker)
+            return
+        worker.idle_since = time.monotonic()
+        with self._lock:
+            self._idle.setdefault(worker.key, []).append(worker)
+
+    def discard(self, worker: _Worker) -> None:
+        with self._lock:
+            idle = self._idle.get(worker.key, [])
+            if worker in idle:
+                idle.remove(worker)
+        _close(worker)
+
+    def reap_idle(self) -> int:
+        cutoff = time.monotonic() - idle_timeout()
+        expired = []
+        with self._lock:
+            for idle in self._idle.values():
+                expired.extend(w for w in idle if w.idle_since < cutoff)
+                idle[:] = [w for w in idle if w.idle_since >= cutoff]
+        for worker in expired:
+            _close(worker)
+        return len(expired)
+
+    def stop(self) -> None:
+        with self._lock:
+            workers = [w for idle in self._idle.values() for w in idle]
+            self._idle.clear()
+        for worker in workers:
+            _close(worker)
+
+
+def _close(worker: _Worker) -> None:
+    # Closing stdin makes an idle worker exit; a busy one is being killed.
+    try:
+        worker.proc.stdin.close()
+    except OSError:
+        pass
+    if worker.proc.stdout:
+        try:
+            worker.proc.stdout.close()
+        except OSError:
+            pass
+    threading.Thread(target=worker.proc.wait, daemon=True).start()
+
+
+_POOL: Optional[WorkerPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> Optional[WorkerPool]:
+    global _POOL
+    if not pool_enabled():
+        return None
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = WorkerPool()
+        return _POOL
+
+
+def serve() -> None:
+    """Worker loop: one JSON request per line on stdin, one reply per task."""
+    requests = os.fdopen(os.dup(0), "r")
+    replies = os.fdopen(os.dup(1), "w", buffering=1)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    # Stray prints between tasks land in the daemon log, not the protocol.
+    os.dup2(2, 1)
+    done = 0
+    for line in requests:
+        request = json.loads(line)
+        returncode = _run_request(request)
+        done += 1
+        rss = _current_rss()
+        recycle = done >= max_tasks() or rss > max_rss()
+        replies.write(json.dumps({"returncode": returncode, "rss": rss, "recycle": recycle}) + "\n")
+        if recycle:
+            break
+
+
+def _run_request(request: dict) -> int:
+    saved_fds = (os.dup(1), os.dup(2))
+    saved_cwd = os.getcwd()
+    saved_path = list(sys.path)
+    saved_threads = {k: os.environ.get(k) for k in ("OMP_NUM_THREADS", "MKL_NUM_THREADS")}
+    affinity = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+    try:
+        for fd, path in ((1, request["stdout"]), (2, request["stderr"])):
+            target = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.dup2(target, fd)
+            os.close(target)
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+            sys.path.insert(0, request["cwd"])
+        if request.get("cpus") and affinity is not None:
+            try:
+                os.sched_setaffinity(0, request["cpus"])
+            except OSError as exc:
+                print(f"ravel: could not pin to cores {request['cpus']}: {exc}; running unpinned", file=sys.stderr)
+        if request.get("threads"):
+            os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = request["threads"]
+        os.environ["RAVEL_JOB_ID"] = request["job_id"]
+        return run_task(request["task"], request["job_id"])
+    except Exception:
+        import traceback
+
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved in zip((1, 2), saved_fds):
+            os.dup2(saved, fd)
+            os.close(saved)
+        os.chdir(saved_cwd)
+        sys.path[:] = saved_path
+        if affinity is not None:
+            os.sched_setaffinity(0, affinity)
+        os.environ.pop("RAVEL_JOB_ID", None)
+        for key, value in saved_threads.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _current_rss() -> int:
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return 0
+
+
+def main() -> None:
+    if len(sys.argv) >= 3 and sys.argv[1] == "run":
+        job_id = os.environ.get("RAVEL_JOB_ID")
+        if not job_id:
+            print("ravel worker: RAVEL_JOB_ID is not set", file=sys.stderr)
+            sys.exit(2)
+        sys.path.insert(0, os.getcwd())
+        sys.exit(run_task(sys.argv[2], job_id))
+    serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""Pre-forked Python zygote for low-latency ``python script.py`` jobs.
+
+The zygote is a long-lived interpreter that has already imported the modules
+listed in ``RAVEL_ZYGOTE_MODULES``. For each job the daemon connects to its
+unix socket, passes the job's stdout/stderr descriptors with ``SCM_RIGHTS``
+and a JSON request (argv, cwd, env, cpus). The zygote forks a supervisor,
+which forks the job process and reports its pid and exit code back over the
+connection. The job process runs the target with ``runpy`` in its own
+session, so it can be signalled exactly like a ``Popen`` child.
+"""
+import importlib
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+_HEADER = struct.Struct("!I")
+_PYTHON_RE = re.compile(r"^python(\d+(\.\d+)?)?$")
+
+
+def zygote_enabled() -> bool:
+    return os.getenv("RAVEL_ZYGOTE") == "1" and hasattr(socket, "send_fds")
+
+
+def zygote_modules() -> List[str]:
+    value = os.getenv("RAVEL_ZYGOTE_MODULES", "")
+    return [m.strip() for m in value.split(",") if m.strip()]
+
+
+def socket_path() -> str:
+    state_dir = os.environ.get(
+        "RAVEL_STATE_DIR",
+        os.path.join(os.path.expanduser("~"), ".ravel"),
+    )
+    return os.path.join(state_dir, "zygote.sock")
+
+
+def zygote_target(command: List[str], env: Optional[dict] = None) -> Optional[List[str]]:
+    """Return the argv the zygote should run, or None if the job is not eligible.
+
+    Eligible commands are ``python[3] script.py ...`` and ``python[3] -m mod ...``
+    where the interpreter resolves to the same executable as the zygote.
+    """
+    if len(command) < 2 or not _PYTHON_RE.match(os.path.basename(command[0])):
+        return None
+    path = (env or os.environ).get("PATH")
+    interpreter = shutil.which(command[0], path=path)
+    if not interpreter:
+        return None
+    if os.path.realpath(interpreter) != os.path.realpath(sys.executable):
+        return None
+    if command[1] == "-m" and len(command) >= 3:
+        return command[1:]
+    if command[1].endswith(".py"):
+        return command[1:]
+    return None
+
+
+class ZygoteProcess:
+    """``Popen``-like handle for a job forked by the zygote."""
+
+    def __init__(
+        self,
+        conn: socket.socket,
+        reader,
+        pid: int,
+        stdout_fd: Optional[int],
+        stderr_fd: Optional[int],
+    ):
+        self.pid = pid
+        self.returncode: Optional[int] = None
+        self._conn = conn
+        # The reader that returned the pid line: it may already hold the exit line.
+        self._reader = reader
+        # A stream is None when the job writes to a file instead of a pipe.
+        self._chunks: dict = {
+            "stdout": None if stdout_fd is None else [],
+            "stderr": None if stderr_fd is None else [],
+        }
+        self._threads = [
+            threading.Thread(target=self._drain, args=(fd, name), daemon=True)
+            for fd, name in ((stdout_fd, "stdout"), (stderr_fd, "stderr"))
+            if fd is not None
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._waiter = threading.Thread(target=self._wait_for_exit, daemon=True)
+        self._waiter.start()
+
+    def _drain(self, fd: int, name: str) -> None:
+        with os.fdopen(fd, "rb") as handle:
+            for chunk in iter(lambda: handle.read(65536), b""):
+                self._chunks[name].append(chunk)
+
+    def _wait_for_exit(self) -> None:
+        try:
+            line = self._reader.readline()
+            message = json.loads(line) if line else {}
+        except (OSError, ValueError):
+            message = {}
+        self.returncode = message.get("returncode", -signal.SIGKILL)
+        self._reader.close()
+        self._conn.close()
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        self._waiter.join(timeout)
+        if self._waiter.is_alive():
+            raise subprocess.TimeoutExpired(["zygote", str(self.pid)], timeout)
+        return self.returncode
+
+    def communicate(self, timeout: Optional[float] = None) -> Tuple[Optional[str], Optional[str]]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in [*self._threads, self._waiter]:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            thread.join(remaining)
+            if thread.is_alive():
+                raise subprocess.TimeoutExpired(["zygote", str(self.pid)], timeout)
+        return tuple(
+            None if chunks is None else b"".join(chunks).decode(errors="replace")
+            for chunks in (self._chunks["stdout"], self._chunks["stderr"])
+        )
+
+    def send_signal(self, sig: int) -> None:
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+
+class Zygote:
+    """Daemon-side manager that keeps one warm zygote server running."""
+
+    def __init__(self, modules: List[str], path: Optional[str] = None):
+        self.modules = modules
+        self.path = path or socket_path()
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        with self._lock:
+            if self._proc and self._proc.poll() is None:
+                return
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self._proc = subprocess.Popen(
+                [sys.executable, "-m", "ravel.zygote", self.path, ",".join(self.modules)],
+                stdin=subprocess.DEVNULL,
+                close_fds=True,
+            )
+
+    def ready(self) -> bool:
+        return bool(self._proc and self._proc.poll() is None and os.path.exists(self.path))
+
+    def spawn(
+        self,
+        argv: List[str],
+        cwd: Optional[str],
+        env: dict,
+        cpus: Optional[List[int]] = None,
+        stdout=None,
+        stderr=None,
+    ) -> Optional[ZygoteProcess]:
+        """Fork ``argv`` in the zygote; output goes to the given files or pipes."""
+        self.ensure_started()
+        if not self.ready():
+            return None
+        out_r, out_w = (None, os.dup(stdout.fileno())) if stdout else os.pipe()
+        err_r, err_w = (None, os.dup(stderr.fileno())) if stderr else os.pipe()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.path)
+            payload = json.dumps(
+                {"argv": argv, "cwd": cwd, "env": env, "cpus": cpus or []}
+            ).encode()
+            socket.send_fds(conn, [_HEADER.pack(len(payload))], [out_w, err_w])
+            conn.sendall(payload)
+            reader = conn.makefile("rb")
+            pid = json.loads(reader.readline())["pid"]
+        except (OSError, ValueError, KeyError):
+            conn.close()
+            for fd in (out_r, err_r):
+                if fd is not None:
+                    os.close(fd)
+            return None
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+        return ZygoteProcess(conn, reader, pid, out_r, err_r)
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._proc and self._proc.poll() is None:
+                self._proc.terminate()
+            self._proc = None
+
+
+_ZYGOTE: Optional[Zygote] = None
+_ZYGOTE_LOCK = threading.Lock()
+
+
+def get_zygote() -> Optional[Zygote]:
+    global _ZYGOTE
+    if not zygote_enabled():
+        return None
+    with _ZYGOTE_LOCK:
+        if _ZYGOTE is None:
+            _ZYGOTE = Zygote(zygote_modules())
+        return _ZYGOTE
+
+
+def serve(path: str, modules: List[str]) -> None:
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as exc:
+            print(f"ravel zygote: failed to preload {module}: {exc}", file=sys.stderr)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    parent = os.getppid()
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    tmp_path = f"{path}.{os.getpid()}"
+    server.bind(tmp_path)
+    server.listen(64)
+    os.replace(tmp_path, path)
+    server.settimeout(1.0)
+    while os.getppid() == parent:
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            continue
+        conn.settimeout(None)
+        try:
+            request, fds = _recv_request(conn)
+        except (OSError, ValueError):
+            conn.close()
+            continue
+        if os.fork() == 0:
+            server.close()
+            _supervise(conn, request, fds)
+        conn.close()
+        for fd in fds:
+            os.close(fd)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _recv_request(conn: socket.socket) -> Tuple[dict, List[int]]:
+    header, fds, _, _ = socket.recv_fds(conn, _HEADER.size, 2)
+    while len(header) < _HEADER.size:
+        more = conn.recv(_HEADER.size - len(header))
+        if not more:
+            raise ValueError("truncated zygote request")
+        header += more
+    (length,) = _HEADER.unpack(header)
+    payload = b""
+    while len(payload) < length:
+        more = conn.recv(length - len(payload))
+        if not more:
+            raise ValueError("truncated zygote request")
+        payload += more
+    return json.loads(payload), list(fds)
+
+
+def _supervise(conn: socket.socket, request: dict, fds: List[int]) -> None:
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    child = os.fork()
+    if child == 0:
+        conn.close()
+        _run_target(request, fds)
+    for fd in fds:
+        os.close(fd)
+    returncode = -signal.SIGKILL
+    try:
+        conn.sendall(json.dumps({"pid": child}).encode() + b"\n")
+        _, status = os.waitpid(child, 0)
+        returncode = os.waitstatus_to_exitcode(status)
+        conn.sendall(json.dumps({"returncode": returncode}).encode() + b"\n")
+    except OSError:
+        pass
+    os._exit(0)
+
+
+def _run_target(request: dict, fds: List[int]) -> None:
+    code = 1
+    try:
+        os.setsid()
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in (devnull, *fds):
+            os.close(fd)
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request.get("env") or {})
+        if request.get("cpus") and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, request["cpus"])
+            except OSError as exc:
+                print(f"ravel: could not pin to cores {request['cpus']}: {exc}; running unpinned", file=sys.stderr)
+        code = _run_argv(request["argv"])
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _run_argv(argv: List[str]) -> int:
+    import runpy
+
+    try:
+        if argv[0] == "-m":
+            sys.argv = [argv[1], *argv[2:]]
+            sys.path[0] = os.getcwd()
+            runpy.run_module(argv[1], run_name="__main__", alter_sys=True)
+        else:
+            script = os.path.abspath(argv[0])
+            sys.argv = [argv[0], *argv[1:]]
+            sys.path[0] = os.path.dirname(script)
+            runpy.run_path(script, run_name="__main__")
+    except SystemExit as exc:
+        if exc.code is None:
+            return 0
+        if isinstance(exc.code, int):
+            return exc.code
+        print(exc.code, file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> None:
+    path = sys.argv[1] if len(sys.argv) > 1 else socket_path()
+    modules = sys.argv[2].split(",") if len(sys.argv) > 2 and sys.argv[2] else []
+    serve(path, modules)
+
+
+if __name__ == "__main__":
+    main()
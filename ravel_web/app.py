@@ -1,52 +1,184 @@
 import os
+import time
+from datetime import timedelta
 from typing import Optional
 
-from flask import Flask, jsonify, render_template, request
-import psutil
+from flask import Flask, Response, g, jsonify, render_template, request
 
-from ravel.daemon import daemon_running
-from ravel.store import list_jobs
+from ravel import metrics, spool, telemetry
+from ravel.lifecycle import daemon_running
+from ravel.store import count_jobs_by_status, get_job, get_job_usage, job_stats, list_jobs, predict_runtimes
+from ravel.utils import current_time, parse_duration
+from ravel_web import responses, stream
+
+
+HTTP_REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "http_request_seconds", "Latency of ravel_web requests.", ["endpoint", "status"]
+)
 
 
 def create_app() -> Flask:
     app = Flask(__name__)
 
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=request.endpoint or "unknown",
+                status=str(response.status_code),
+            )
+        return response
+
+    @app.get("/metrics")
+    def metrics_endpoint():
+        # Daemon metrics come from its periodic snapshot file, never from SQLite.
+        body = metrics.read_snapshot() + metrics.REGISTRY.render(namespace="ravel_web")
+        return Response(body, mimetype=None, content_type=metrics.CONTENT_TYPE)
+
     @app.get("/")
     def index():
         return render_template("index.html")
 
+    cache = responses.ResponseCache()
+    app.extensions["ravel_response_cache"] = cache
+
     @app.get("/api/summary")
     def summary():
-        statuses = ["queued", "running", "blocked", "failed", "done"]
-        counts = {status: len(list_jobs([status])) for status in statuses}
-        return jsonify(
-            {
-                "daemon": "running" if daemon_running() else "stopped",
-                "counts": counts,
+        daemon = "running" if daemon_running() else "stopped"
+
+        def build():
+            counts = count_jobs_by_status()
+            statuses = ["queued", "running", "blocked", "failed", "timeout", "done", "cached"]
+            return {
+                "daemon": daemon,
+                "counts": {status: counts.get(status, 0) for status in statuses},
                 "db": os.environ.get("RAVEL_DB_PATH", "") or "default",
             }
-        )
+
+        return responses.cached_json(cache, build, extra=(daemon,))
 
     @app.get("/api/resources")
     def resources():
-        mem = psutil.virtual_memory()
-        cpu = psutil.cpu_percent(interval=None)
+        return jsonify(_resources())
+
+    @app.get("/api/resources/history")
+    def resources_history():
+        try:
+            minutes = float(request.args.get("minutes", "10"))
+            points = int(request.args.get("points", "300"))
+        except ValueError:
+            return jsonify({"error": "minutes and points must be numbers"}), 400
+        samples = telemetry.history(minutes * 60)
+        stride = max(1, -(-len(samples) // max(1, points)))
         return jsonify(
             {
-                "cpu_percent": cpu,
-                "memory_total": mem.total,
-                "memory_used": mem.used,
-                "memory_percent": mem.percent,
-                "gpus": _gpu_stats(),
+                "columns": ["time", "cpu_percent", "memory_used", "memory_percent", "gpu_util", "gpu_memory_used"],
+                "samples": [
+                    [
+                        s["time"],
+                        s["cpu_percent"],
+                        s["memory_used"],
+                        s["memory_percent"],
+                        [g["util_gpu"] for g in s["gpus"]],
+                        [g["memory_used"] for g in s["gpus"]],
+                    ]
+                    for s in samples[::stride]
+                ],
             }
         )
 
+    hub = stream.Hub(_serialize_job, _stream_resources)
+
+    @app.get("/api/stream")
+    def events():
+        last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+        return Response(
+            stream.stream(hub, last_event_id, _serialize_job),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @app.get("/api/jobs")
     def jobs():
         statuses = _parse_statuses(request.args.get("status"))
         limit = int(request.args.get("limit", "50"))
-        jobs = list_jobs(statuses)[:limit]
-        return jsonify({"jobs": [_serialize_job(j) for j in jobs]})
+
+        def build():
+            jobs = list_jobs(statuses, limit=limit)
+            predict_runtimes([j for j in jobs if j["status"] in ("queued", "running")])
+            return {"jobs": [_serialize_job(j) for j in jobs]}
+
+        return responses.cached_json(cache, build)
+
+    @app.get("/api/stats")
+    def stats():
+        dimension = request.args.get("by", "all")
+        since = request.args.get("since", "7d")
+        try:
+            window = timedelta(seconds=parse_duration(since))
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        now = current_time()
+
+        def build():
+            try:
+                rows = job_stats(dimension, since=now - window)
+            except ValueError as exc:
+                return {"error": str(exc)}, 400
+            return {"by": dimension, "since": since, "stats": rows}
+
+        # The window slides with the clock, so the current hour joins the key.
+        return responses.cached_json(cache, build, extra=(now.isoformat()[:13],))
+
+    @app.get("/api/jobs/<job_id>/usage")
+    def job_usage(job_id: str):
+        def build():
+            job = get_job(job_id)
+            if not job:
+                return {"error": "job not found"}, 404
+            return {
+                "job": _serialize_job(job),
+                "columns": ["elapsed", "rss", "cpu_percent", "gpu_util", "gpu_mem"],
+                "samples": get_job_usage(job_id),
+            }
+
+        return responses.cached_json(cache, build)
+
+    @app.get("/api/jobs/<job_id>/log")
+    def job_log(job_id: str):
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"error": "job not found"}), 404
+        stream = request.args.get("stream", "stdout")
+        if stream not in spool.STREAMS:
+            return jsonify({"error": "stream must be stdout or stderr"}), 400
+        try:
+            offset = int(request.args.get("offset", "0"))
+            max_bytes = int(request.args.get("max_bytes", str(spool.CHUNK_BYTES)))
+        except ValueError:
+            return jsonify({"error": "offset and max_bytes must be integers"}), 400
+        data, next_offset, complete = spool.read_chunk(job, stream, offset, max_bytes)
+        if not complete:
+            # Leave a character split across reads for the next request.
+            keep = spool.utf8_prefix(data)
+            next_offset -= len(data) - keep
+            data = data[:keep]
+        return jsonify(
+            {
+                "status": job["status"],
+                "stream": stream,
+                "offset": offset,
+                "next_offset": next_offset,
+                "complete": complete,
+                "data": data.decode(errors="replace"),
+            }
+        )
 
     return app
 
@@ -60,50 +192,37 @@ def _serialize_job(job: dict) -> dict:
         "created_at": job.get("created_at"),
         "finished_at": job.get("finished_at"),
         "command": " ".join(job.get("command", [])),
+        "peak_rss": job.get("peak_rss"),
+        "cpu_seconds": job.get("cpu_seconds"),
+        "gpu_util_mean": job.get("gpu_util_mean"),
+        "gpu_mem_peak": job.get("gpu_mem_peak"),
+        "gpu_seconds": job.get("gpu_seconds"),
+        "predicted_runtime": job.get("predicted_runtime"),
+        "predicted_runtime_p90": job.get("predicted_runtime_p90"),
     }
 
 
-def _parse_statuses(value: Optional[str]) -> Optional[list[str]]:
-    if not value:
-        return None
-    return [s for s in value.split(",") if s]
-
-
-def _gpu_stats() -> list[dict]:
-    if not _has_nvidia_smi():
-        return []
-    try:
-        import subprocess
+def _resources() -> dict:
+    # The daemon's sampler keeps telemetry.ring current; sample directly only
+    # when it is not running.
+    snapshot = telemetry.latest() or telemetry.sample()
+    return {
+        "cpu_percent": snapshot["cpu_percent"],
+        "memory_total": snapshot["memory_total"],
+        "memory_used": snapshot["memory_used"],
+        "memory_percent": snapshot["memory_percent"],
+        "gpus": snapshot["gpus"],
+    }
 
-        result = subprocess.check_output(
-            [
-                "nvidia-smi",
-                "--query-gpu=index,utilization.gpu,utilization.memory,memory.total,memory.used",
-                "--format=csv,noheader,nounits",
-            ],
-            stderr=subprocess.DEVNULL,
-        )
-        lines = result.decode().strip().splitlines()
-        gpus = []
-        for line in lines:
-            if not line.strip():
-                continue
-            idx, util, mem_util, mem_total, mem_used = [v.strip() for v in line.split(",")]
-            gpus.append(
-                {
-                    "index": int(idx),
-                    "util_gpu": float(util),
-                    "util_mem": float(mem_util),
-                    "memory_total": float(mem_total),
-                    "memory_used": float(mem_used),
-                }
-            )
-        return gpus
-    except Exception:
-        return []
 
+def _stream_resources() -> dict:
+    payload = _resources()
+    payload["daemon"] = "running" if daemon_running() else "stopped"
+    payload["db"] = os.environ.get("RAVEL_DB_PATH", "") or "default"
+    return payload
 
-def _has_nvidia_smi() -> bool:
-    import shutil
 
-    return shutil.which("nvidia-smi") is not None
+def _parse_statuses(value: Optional[str]) -> Optional[list[str]]:
+    if not value:
+        return None
+    return [s for s in value.split(",") if s]
@@ -0,0 +1,124 @@
+"""Conditional GET and a shared cache for JSON API responses.
+
+Payloads are cached per process under ``(endpoint, arguments, extra)`` and
+tagged with the store's change token, which moves whenever any connection
+commits. A request whose ``If-None-Match`` carries the current ETag gets a
+304 without touching the payload; otherwise the cached body (and its gzip
+encoding, made once per entry) is reused until the next commit.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple, Union
+
+from flask import Response, request
+
+from ravel.store import change_token
+
+GZIP_MIN_BYTES = 1024
+
+
+def cache_size() -> int:
+    try:
+        return max(0, int(os.getenv("RAVEL_WEB_CACHE_SIZE", "256")))
+    except ValueError:
+        return 256
+
+
+class _Entry:
+    __slots__ = ("token", "etag", "body", "status", "gzipped")
+
+    def __init__(self, token: str, etag: str, body: bytes, status: int):
+        self.token = token
+        self.etag = etag
+        self.body = body
+        self.status = status
+        self.gzipped: Optional[bytes] = None
+
+
+class ResponseCache:
+    """Bounded LRU of encoded payloads shared by all request threads."""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = cache_size() if max_entries is None else max_entries
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, token: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.token != token:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: _Entry) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _etag(key: Hashable, token: str) -> str:
+    digest = hashlib.sha1(repr((key, token)).encode()).hexdigest()[:16]
+    return f'W/"{token}-{digest}"'
+
+
+def cached_json(
+    cache: ResponseCache,
+    build: Callable[[], Union[Dict, Tuple[Dict, int]]],
+    extra: Tuple = (),
+) -> Response:
+    """Respond with ``build()`` as JSON, reusing or revalidating a cached copy.
+
+    ``build`` returns a payload or ``(payload, status)``; ``extra`` adds state
+    that is not in the database (such as whether the daemon runs) to the key.
+    """
+    token = change_token()
+    key = (
+        request.endpoint,
+        tuple(sorted((request.view_args or {}).items())),
+        tuple(sorted(request.args.items(multi=True))),
+        extra,
+    )
+    entry = cache.get(key, token)
+    if entry is None:
+        payload = build()
+        status = 200
+        if isinstance(payload, tuple):
+            payload, status = payload
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        entry = _Entry(token, _etag(key, token), body, status)
+        cache.put(key, entry)
+
+    if entry.status == 200 and entry.etag in request.headers.get("If-None-Match", ""):
+        response = Response(status=304)
+    else:
+        body = entry.body
+        encoding = None
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("Accept-Encoding", ""):
+            if entry.gzipped is None:
+                entry.gzipped = gzip.compress(body, compresslevel=6)
+            body = entry.gzipped
+            encoding = "gzip"
+        response = Response(body, status=entry.status, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.headers["ETag"] = entry.etag
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,191 @@
+"""Server-Sent Events for the dashboard.
+
+One watcher thread per process turns ``job_events`` rows into job deltas and
+samples resources every few seconds; each event is encoded once and put on
+the queue of every connected client, so the cost of a change or a resource
+sample does not grow with the number of open tabs. Job events carry the
+``job_events`` sequence number as their SSE id, which lets a reconnecting
+client resume from ``Last-Event-ID``.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from ravel.store import (
+    count_jobs_by_status,
+    data_version,
+    get_jobs,
+    job_events_since,
+    latest_job_event,
+    predict_runtimes,
+)
+from ravel.utils import console
+
+POLL_INTERVAL = 0.5
+KEEPALIVE = 15.0
+MAX_DELTA = 1000
+CLIENT_BACKLOG = 256
+
+
+def resources_interval() -> float:
+    try:
+        return max(0.5, float(os.getenv("RAVEL_WEB_RESOURCES_INTERVAL", "2")))
+    except ValueError:
+        return 2.0
+
+
+def encode(event: str, data: Dict, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def job_delta(events: List[Tuple[int, str, Optional[str]]], serialize: Callable[[Dict], Dict]) -> Dict:
+    """Current rows of the jobs touched by ``events``, plus the ids deleted since."""
+    ids = list(dict.fromkeys(job_id for _, job_id, _ in events))
+    jobs = get_jobs(ids)
+    predict_runtimes([j for j in jobs if j["status"] in ("queued", "running")])
+    present = {j["id"] for j in jobs}
+    return {
+        "jobs": [serialize(j) for j in jobs],
+        "removed": [job_id for job_id in ids if job_id not in present],
+        "counts": count_jobs_by_status(),
+    }
+
+
+class Hub:
+    """Single watcher that fans encoded events out to every subscriber."""
+
+    def __init__(self, serialize: Callable[[Dict], Dict], resources: Callable[[], Dict]):
+        self._serialize = serialize
+        self._resources = resources
+        self._subscribers: List["queue.Queue[Optional[str]]"] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._seq: Optional[int] = None
+        self._version: Optional[int] = None
+        self._next_resources = 0.0
+        self._failing = False
+        self.last_resources: Optional[str] = None
+
+    def subscribe(self) -> "queue.Queue[Optional[str]]":
+        client: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=CLIENT_BACKLOG)
+        with self._lock:
+            self._subscribers.append(client)
+            if self._thread is None:
+                self._seq = latest_job_event()
+                self._thread = threading.Thread(target=self._run, name="ravel-web-stream", daemon=True)
+                self._thread.start()
+        return client
+
+    def unsubscribe(self, client: "queue.Queue[Optional[str]]") -> None:
+        with self._lock:
+            if client in self._subscribers:
+                self._subscribers.remove(client)
+
+    def publish(self, message: str) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for client in subscribers:
+            try:
+                client.put_nowait(message)
+            except queue.Full:
+                # A client this far behind reloads instead of catching up.
+                self.unsubscribe(client)
+                while not client.empty():
+                    try:
+                        client.get_nowait()
+                    except queue.Empty:
+                        break
+                client.put_nowait(None)
+
+    def tick(self) -> None:
+        if self._seq is None:
+            self._seq = latest_job_event()
+        version = data_version()
+        if version != self._version:
+            events, complete = job_events_since(self._seq, limit=MAX_DELTA)
+            if not complete:
+                self._seq = latest_job_event()
+                self.publish(encode("reset", {"counts": count_jobs_by_status()}, self._seq))
+            elif events:
+                self._seq = events[-1][0]
+                self.publish(encode("jobs", job_delta(events, self._serialize), self._seq))
+                if len(events) == MAX_DELTA:
+                    return
+            self._version = version
+        now = time.monotonic()
+        if now >= self._next_resources:
+            self._next_resources = now + resources_interval()
+            self.last_resources = encode("resources", self._resources())
+            self.publish(self.last_resources)
+
+    def safe_tick(self) -> None:
+        try:
+            self.tick()
+        except Exception as exc:
+            if not self._failing:
+                # Clients may have missed deltas; tell them to fetch instead.
+                # Logged and published once until a tick succeeds again.
+                self._failing = True
+                console.print(f"[yellow]Dashboard stream failed: {exc}[/]")
+                self._seq = self._version = None
+                self.publish(encode("reset", {}))
+        else:
+            self._failing = False
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                idle = not self._subscribers
+            if not idle:
+                self.safe_tick()
+            time.sleep(POLL_INTERVAL)
+
+
+def stream(hub: Hub, last_event_id: Optional[str], serialize: Callable[[Dict], Dict]) -> Iterator[str]:
+    """Events for one client: a resume or snapshot, then the hub's broadcast."""
+    client = hub.subscribe()
+    try:
+        # Subscribe before reading the backlog so nothing falls in between;
+        # broadcast events already covered by the backlog are skipped below.
+        seen = latest_job_event()
+        if last_event_id is not None and last_event_id.isdigit():
+            events, complete = job_events_since(int(last_event_id), limit=MAX_DELTA)
+            if not complete:
+                yield encode("reset", {"counts": count_jobs_by_status()}, seen)
+            elif events:
+                seen = events[-1][0]
+                yield encode("jobs", job_delta(events, serialize), seen)
+        else:
+            yield encode("snapshot", {"counts": count_jobs_by_status()}, seen)
+        if hub.last_resources:
+            yield hub.last_resources
+        idle = 0.0
+        while True:
+            try:
+                message = client.get(timeout=1.0)
+            except queue.Empty:
+                idle += 1.0
+                if idle >= KEEPALIVE:
+                    idle = 0.0
+                    yield ": keepalive\n\n"
+                continue
+            if message is None:
+                yield encode("reset", {"counts": count_jobs_by_status()}, latest_job_event())
+                return
+            idle = 0.0
+            if message.startswith("id: "):
+                event_id = int(message[4:message.index("\n")])
+                if event_id <= seen:
+                    continue
+                seen = event_id
+            yield message
+    finally:
+        hub.unsubscribe(client)
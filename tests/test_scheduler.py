@@ -1,11 +1,16 @@
+import json
+import os
 import subprocess
+import time
 
 from ravel.cli import _collect_submit_jobs, _parse_submit_line
 from ravel.daemon import run_once
+from ravel.usage import downsample
 from ravel.store import (
     add_job,
     clear_jobs_for_tests,
     get_job,
+    get_job_usage,
     list_jobs,
     list_recent_jobs,
     mark_blocked_jobs_due_to_failed_deps,
@@ -204,3 +209,1368 @@ def test_ravelfile_parsing_defaults_and_heredoc():
     parsed = _parse_submit_line(jobs[0], defaults["gpus"], defaults["priority"], None)
     assert parsed["name"] == "prep"
     assert parsed["after"] == ["seed"]
+
+    # A bad time limit keeps the default instead of raising, and is reported.
+    from ravel.ravelfile import compile_lines
+
+    errors = []
+    parsed = _parse_submit_line("time=2x gpus=0 -- echo hi", 1, 0, None, errors=errors)
+    assert parsed["time_limit"] is None and parsed["gpus"] == 0
+    assert errors == ["invalid time limit '2x'"]
+    errors = []
+    list(compile_lines(["JOB time=1h -- echo ok", "JOB time=soon -- echo late"], defaults, errors))
+    assert errors == ["line 2: invalid time limit 'soon'"]
+
+
+def test_job_usage_is_sampled(monkeypatch, tmp_path):
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_USAGE_INTERVAL", "0.01")
+
+    clear_jobs_for_tests()
+    real_popen = subprocess.Popen
+
+    class FakeProc:
+        def __init__(self, cmd):
+            # Sample the test process itself so there is a live tree to measure.
+            self.pid = os.getpid()
+            self.returncode = 0
+
+        def communicate(self):
+            time.sleep(0.1)
+            return "", ""
+
+    monkeypatch.setattr(subprocess, "Popen", lambda cmd, **kwargs: FakeProc(cmd))
+
+    job_id = add_job(["echo", "usage"], gpus=1)
+    run_once(inline=True)
+
+    job = get_job(job_id)
+    assert job["status"] == "done"
+    assert job["peak_rss"] > 0
+    assert job["cpu_seconds"] >= 0
+    assert job["gpu_seconds"] > 0
+    assert get_job_usage(job_id)
+
+    # CPU a child spends after the last sample still counts, via the exit rusage.
+    monkeypatch.setattr(subprocess, "Popen", real_popen)
+    monkeypatch.setenv("RAVEL_USAGE_INTERVAL", "60")
+    spin = "import time\nwhile time.process_time() < 0.3: pass"
+    job_id = add_job(["sh", "-c", f"sleep 0.2; python3 -c '{spin}'"], gpus=1)
+    run_once(inline=True)
+    assert get_job(job_id)["cpu_seconds"] >= 0.25
+
+
+def test_usage_downsample_keeps_peaks():
+    samples = [[float(i), i * 10, 50.0, 0.0, 0.0] for i in range(1, 5)]
+    merged = downsample(samples)
+    assert len(merged) == 2
+    assert merged[0] == [2.0, 20, 50.0, 0.0, 0.0]
+    assert merged[1][1] == 40
+
+
+def test_cpu_pinning_prefers_gpu_numa_node(monkeypatch, tmp_path):
+    import ravel.topology as topology
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_MAX_WORKERS", "2")
+    monkeypatch.setattr(topology, "numa_nodes", lambda: {0: [0, 1], 1: [2, 3]})
+    monkeypatch.setattr(topology, "gpu_numa_nodes", lambda: {0: 1, 1: 0})
+
+    clear_jobs_for_tests()
+
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    # Stand-in for the calling thread's affinity mask.
+    mask = {"cpus": {0, 1, 2, 3}}
+
+    def set_affinity(pid, cpus):
+        if 9 in cpus:
+            raise OSError(22, "Invalid argument")
+        mask["cpus"] = set(cpus)
+
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(mask["cpus"]), raising=False)
+    monkeypatch.setattr(os, "sched_setaffinity", set_affinity, raising=False)
+
+    envs = []
+    pinned = []
+
+    class FakeProc:
+        def __init__(self, cmd, env):
+            self.pid = 12345
+            self.returncode = 0
+            envs.append(env)
+            # The child starts with the mask of the thread that spawned it.
+            pinned.append(sorted(mask["cpus"]))
+
+        def communicate(self):
+            return "", ""
+
+    monkeypatch.setattr(
+        subprocess, "Popen", lambda cmd, **kwargs: FakeProc(cmd, kwargs["env"])
+    )
+
+    job_a = add_job(["echo", "a"], gpus=1, cpus=2)
+    job_b = add_job(["echo", "b"], gpus=1, cpus=2)
+    run_once(inline=True)
+
+    assert get_job(job_a)["cpus_assigned"] == [2, 3]
+    assert get_job(job_b)["cpus_assigned"] == [0, 1]
+    assert envs[0]["OMP_NUM_THREADS"] == "2"
+    assert envs[0]["MKL_NUM_THREADS"] == "2"
+    assert pinned == [[2, 3], [0, 1]]
+    assert mask["cpus"] == {0, 1, 2, 3}
+    assert topology.allocate_cpus(5, reserved=set(), gpus=[0]) == []
+
+    # A core that cannot be used leaves the job unpinned instead of failing it.
+    with topology.pinned_thread([9]):
+        assert mask["cpus"] == {0, 1, 2, 3}
+
+    # More cores than the host has could never be allocated.
+    import pytest
+
+    with pytest.raises(ValueError, match="5 cpus"):
+        add_job(["echo", "c"], gpus=1, cpus=5)
+
+
+def test_zygote_runs_python_script(monkeypatch, tmp_path):
+    import sys
+
+    import ravel.zygote as zygote_mod
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_ZYGOTE", "1")
+    monkeypatch.setenv("RAVEL_ZYGOTE_MODULES", "json")
+    monkeypatch.setattr(zygote_mod, "_ZYGOTE", None)
+
+    clear_jobs_for_tests()
+
+    script = tmp_path / "job.py"
+    script.write_text(
+        "import os, sys\n"
+        "print(sys.argv[1:], os.getcwd(), os.environ['NVIDIA_VISIBLE_DEVICES'])\n"
+        "sys.exit(3)\n"
+    )
+    zygote = zygote_mod.get_zygote()
+    zygote.ensure_started()
+    try:
+        deadline = time.monotonic() + 30
+        while not zygote.ready() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        def no_popen(*args, **kwargs):
+            raise AssertionError("job should not fall back to Popen")
+
+        monkeypatch.setattr(subprocess, "Popen", no_popen)
+        job_id = add_job([sys.executable, str(script), "--x", "1"], gpus=1, cwd=str(tmp_path))
+        run_once(inline=True)
+    finally:
+        zygote.stop()
+
+    job = get_job(job_id)
+    assert job["status"] == "failed"
+    assert job["returncode"] == 3
+    assert job["stdout"].strip() == f"['--x', '1'] {tmp_path} 0"
+
+    # A job that exits at once: the pid and exit lines arrive in one read.
+    import socket
+    import threading
+
+    path = str(tmp_path / "fake.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+
+    def answer():
+        conn, _ = server.accept()
+        _, fds = zygote_mod._recv_request(conn)
+        for fd in fds:
+            os.close(fd)
+        conn.sendall(b'{"pid": 4242}\n{"returncode": 0}\n')
+        conn.close()
+
+    threading.Thread(target=answer, daemon=True).start()
+    fake = zygote_mod.Zygote([], path=path)
+    monkeypatch.setattr(fake, "ensure_started", lambda: None)
+    monkeypatch.setattr(fake, "ready", lambda: True)
+    proc = fake.spawn(["quick.py"], cwd=None, env={})
+    assert proc.pid == 4242
+    assert proc.wait(timeout=5) == 0
+    proc.communicate(timeout=5)
+    server.close()
+
+
+def test_cached_job_skips_rerun_and_restores_outputs(monkeypatch, tmp_path):
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path / "state"))
+
+    clear_jobs_for_tests()
+
+    work = tmp_path / "work"
+    work.mkdir()
+    (work / "in.txt").write_text("data")
+    calls = []
+
+    class FakeProc:
+        def __init__(self, cmd):
+            self.pid = 12345
+            self._cmd = cmd
+            self.returncode = 0
+
+        def communicate(self):
+            calls.append(self._cmd)
+            (work / "out.txt").write_text("result")
+            return "built\n", ""
+
+    monkeypatch.setattr(subprocess, "Popen", lambda cmd, **kwargs: FakeProc(cmd))
+
+    # Variables the daemon sets per run never split the key between the
+    # dispatcher's lookup and the run that stores the result.
+    spec = dict(
+        cwd=str(work), cache=True, inputs=["in.txt"], outputs=["out.txt"], cache_env=["SEED", "NVIDIA_VISIBLE_DEVICES"]
+    )
+    first = add_job(["make"], gpus=1, **spec)
+    run_once(inline=True)
+    (work / "out.txt").unlink()
+
+    second = add_job(["make"], gpus=1, **spec)
+    # A hit finishes even with every GPU taken and holds none while doing so.
+    import ravel.daemon as daemon_mod
+
+    free_gpus = daemon_mod.get_free_gpus
+    monkeypatch.setattr(daemon_mod, "get_free_gpus", lambda count, reserved=None: [])
+    run_once(inline=True)
+    monkeypatch.setattr(daemon_mod, "get_free_gpus", free_gpus)
+
+    assert len(calls) == 1
+    assert get_job(first)["status"] == "done"
+    job = get_job(second)
+    assert job["status"] == "cached"
+    assert job["gpus_assigned"] == []
+    assert job["stdout"] == "built\n"
+    assert (work / "out.txt").read_text() == "result"
+
+    (work / "in.txt").write_text("changed")
+    third = add_job(["make"], gpus=1, **spec)
+    run_once(inline=True)
+    assert len(calls) == 2
+    assert get_job(third)["status"] == "done"
+    # A checked miss is remembered on the row, not in daemon memory.
+    assert get_job(first)["cache_key"] == get_job(second)["cache_key"] != get_job(third)["cache_key"]
+
+    # The daemon hashes on its cache thread and leaves the job queued meanwhile.
+    from concurrent.futures import ThreadPoolExecutor
+
+    fourth = add_job(["make"], gpus=1, **spec)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        run_once(executor=executor)
+        for _ in range(100):
+            if get_job(fourth)["status"] != "queued":
+                break
+            time.sleep(0.02)
+    assert get_job(fourth)["status"] == "cached"
+    assert len(calls) == 2
+
+
+def test_incremental_selects_dirty_subgraph(monkeypatch, tmp_path):
+    from ravel.incremental import StatIndex, select_dirty_jobs
+
+    def touch(name, mtime):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+        os.utime(path, (mtime, mtime))
+
+    touch("raw/a.csv", 100)
+    touch("features.parquet", 200)
+    touch("model.pt", 300)
+    touch("report.txt", 50)
+
+    defaults = {"gpus": 1, "priority": 0, "memory_tag": None}
+    lines = [
+        "JOB name=features inputs=raw/*.csv outputs=features.parquet -- make features",
+        "JOB name=train after=features inputs=features.parquet outputs=model.pt -- make train",
+        "JOB name=report after=train outputs=report.txt -- make report",
+        "JOB name=eval after=train -- make eval",
+    ]
+    entries = [
+        _parse_submit_line(raw, 1, 0, None)
+        for raw in _collect_submit_jobs(lines, defaults)
+    ]
+    index = StatIndex(str(tmp_path / "state" / "stat_index.json"))
+
+    dirty, skipped = select_dirty_jobs(entries, str(tmp_path), index)
+
+    assert [e["name"] for e in skipped] == ["features", "train"]
+    assert [e["name"] for e in dirty] == ["report", "eval"]
+    assert all(e["after"] == [] for e in dirty)
+
+    touch("raw/b.csv", 400)
+    dirty, skipped = select_dirty_jobs(entries, str(tmp_path), StatIndex(index.path))
+    assert [e["name"] for e in dirty] == ["features", "train", "report", "eval"]
+    assert dirty[1]["after"] == ["features"]
+
+
+def test_time_limit_kills_process_group(monkeypatch, tmp_path):
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_KILL_GRACE", "0.2")
+    monkeypatch.setenv("RAVEL_USAGE_INTERVAL", "0")
+
+    clear_jobs_for_tests()
+
+    # The trap keeps bash alive after SIGTERM, so SIGKILL escalation is needed.
+    job_id = add_job(
+        ["/bin/bash", "-c", "trap '' TERM; sleep 30 & wait"], gpus=1, time_limit=0.3
+    )
+    started = time.monotonic()
+    run_once(inline=True)
+
+    job = get_job(job_id)
+    assert time.monotonic() - started < 5
+    assert job["status"] == "timeout"
+    assert "time limit" in job["stderr"]
+
+
+def test_backfill_uses_reserved_gpus_only_for_short_jobs(monkeypatch, tmp_path):
+    import ravel.daemon as daemon
+    from ravel.store import try_claim_job
+
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_MAX_WORKERS", "4")
+    monkeypatch.setenv("RAVEL_BACKFILL", "1")
+
+    def fake_free_gpus(requested=1, reserved=None):
+        reserved = reserved or set()
+        return [g for g in (0, 1) if g not in reserved][:requested]
+
+    monkeypatch.setattr(daemon, "get_free_gpus", fake_free_gpus)
+
+    clear_jobs_for_tests()
+
+    calls = []
+
+    class FakeProc:
+        def __init__(self, cmd):
+            self.pid = 12345
+            self._cmd = cmd
+            self.returncode = 0
+
+        def communicate(self, timeout=None):
+            calls.append(self._cmd)
+            return "", ""
+
+    monkeypatch.setattr(subprocess, "Popen", lambda cmd, **kwargs: FakeProc(cmd))
+
+    holder = add_job(["echo", "holder"], gpus=1, time_limit=3600)
+    assert try_claim_job(holder, [0])
+    big = add_job(["echo", "big"], gpus=2, priority=10)
+    add_job(["echo", "long"], gpus=1, priority=5)
+    add_job(["echo", "short"], gpus=1, priority=1, time_limit=60)
+
+    run_once(inline=True)
+
+    assert calls == [["echo", "short"]]
+    assert get_job(big)["status"] == "queued"
+
+
+def test_admission_limits_reject_at_insert(monkeypatch, tmp_path):
+    import pytest
+
+    from ravel.store import AdmissionError, admission_status, set_admission_limit
+
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_MAX_QUEUED_PER_USER", "2")
+
+    clear_jobs_for_tests()
+
+    add_job(["echo", "a"], gpus=1)
+    add_job(["echo", "b"], gpus=1)
+    with pytest.raises(AdmissionError):
+        add_job(["echo", "c"], gpus=1)
+    assert len(list_jobs(["queued"])) == 2
+
+    set_admission_limit("max_queued_per_user", 0)
+    set_admission_limit("max_submit_rate", 1)
+    add_job(["echo", "c"], gpus=1)
+    with pytest.raises(AdmissionError) as excinfo:
+        add_job(["echo", "d"], gpus=1)
+    assert excinfo.value.retry_after > 0
+
+    status = admission_status()
+    assert status["queued"] == 3
+    assert status["limits"] == {"max_submit_rate": 1.0}
+
+
+def test_metrics_exposed_without_querying_store(monkeypatch, tmp_path):
+    from ravel import metrics
+    from ravel.daemon import refresh_metrics
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+
+    clear_jobs_for_tests()
+
+    class FakeProc:
+        def __init__(self, cmd):
+            self.pid = 12345
+            self.returncode = 0
+
+        def communicate(self):
+            return "", ""
+
+    monkeypatch.setattr(subprocess, "Popen", lambda cmd, **kwargs: FakeProc(cmd))
+
+    started = metrics.JOBS_STARTED.value()
+    ticks = metrics.DISPATCH_TICK_SECONDS.count()
+    add_job(["echo", "a"], gpus=1)
+    add_job(["echo", "b"], gpus=1, memory_tag="big")
+    run_once(inline=True)
+    refresh_metrics()
+
+    assert metrics.JOBS_STARTED.value() == started + 1
+    assert metrics.DISPATCH_TICK_SECONDS.count() == ticks + 1
+    assert metrics.QUEUE_JOBS.value(status="queued", memory_tag="big") == 1
+
+    text = metrics.read_snapshot()
+    assert 'ravel_queue_jobs{status="done",memory_tag=""} 1' in text
+    assert 'ravel_db_operation_seconds_count{op="try_claim_job"}' in text
+    assert "# EOF" not in text
+
+    from ravel_web.app import create_app
+
+    def fail(*args, **kwargs):
+        raise AssertionError("/metrics must not query the store")
+
+    monkeypatch.setattr("ravel.store._connect", fail)
+    response = create_app().test_client().get("/metrics")
+    body = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert "ravel_dispatch_tick_seconds_bucket" in body
+    assert body.rstrip().endswith("# EOF")
+
+
+def test_trace_recording_and_simulated_replay(monkeypatch, tmp_path):
+    from ravel import trace
+    from ravel.simulate import parse_policy, simulate
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_TRACE", str(tmp_path / "daemon.trace"))
+
+    clear_jobs_for_tests()
+
+    class FakeProc:
+        def __init__(self, cmd):
+            self.pid = 12345
+            self.returncode = 0
+
+        def communicate(self):
+            return "", ""
+
+    monkeypatch.setattr(subprocess, "Popen", lambda cmd, **kwargs: FakeProc(cmd))
+
+    job_id = add_job(["echo", "traced"], gpus=1, priority=3)
+    run_once(inline=True)
+    records = list(trace.read_trace(str(tmp_path / "daemon.trace")))
+    kinds = [kind for kind, _, _ in records]
+    assert kinds.index(trace.SUBMIT) < kinds.index(trace.START) < kinds.index(trace.FINISH)
+    assert records[0][2]["id"] == job_id
+    assert records[0][2]["priority"] == 3
+
+    # Jobs that never start are traced at submission with their created_at.
+    failed = add_job(["echo", "failed"], gpus=1)
+    set_job_finished(failed, "failed", 1, "", "")
+    blocked = add_job(["echo", "blocked"], gpus=1, depends_on=[failed])
+    waiting = add_job(["echo", "waiting"], gpus=1, memory_tag="huge")
+    monkeypatch.setenv("RAVEL_MEMORY_LIMITS", "huge=0")
+    run_once(inline=True)
+    records = list(trace.read_trace(str(tmp_path / "daemon.trace")))
+    submits = {p["id"]: (t, p) for kind, t, p in records if kind == trace.SUBMIT}
+    assert set(submits) == {job_id, failed, blocked, waiting}
+    assert submits[blocked][1]["after"] == [failed]
+    assert submits[waiting][0] == trace._timestamp(get_job(waiting)["created_at"])
+    assert (trace.FINISH, blocked) in [(kind, p.get("id")) for kind, _, p in records]
+    assert trace.START not in [kind for kind, _, p in records if p.get("id") == waiting]
+
+    path = str(tmp_path / "synthetic.trace")
+    writer = trace.TraceWriter(path)
+    writer.gpus(1000.0, 2, 0)
+    for idx in range(4):
+        job = {"id": f"j{idx}", "created_at": "2026-01-01T00:00:00", "gpus": 1, "user": "alice"}
+        writer.submit(job, ["j0"] if idx == 3 else [])
+        writer.finish(f"j{idx}", 0.0, "done", 100.0)
+    writer.close()
+
+    serial = simulate(path, parse_policy(["max_workers=1"]))
+    parallel = simulate(path, parse_policy(["RAVEL_MAX_WORKERS=2"]))
+    assert serial["gpus"] == 2
+    assert serial["simulated"]["makespan"] == 400.0
+    assert parallel["simulated"]["makespan"] == 200.0
+    assert parallel["simulated"]["utilization"] == 1.0
+    assert parallel["simulated"]["wait_p99"] == 100.0
+
+    # A job still queued when the trace ends competes in the replay.
+    writer = trace.TraceWriter(path)
+    writer.submit({"id": "late", "created_at": "2026-01-01T00:00:00", "gpus": 2, "user": "bob"}, [])
+    writer.close()
+    replay = simulate(path, parse_policy(["max_workers=1"]))
+    assert replay["jobs"] == 5
+    assert replay["recorded"]["unscheduled"] == 5
+    assert replay["simulated"]["started"] == 5
+    assert os.environ["RAVEL_TRACE"] == str(tmp_path / "daemon.trace")
+
+
+def test_profiler_writes_chrome_trace(monkeypatch, tmp_path):
+    import json
+
+    from ravel import profiler
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+
+    clear_jobs_for_tests()
+
+    class FakeProc:
+        def __init__(self, cmd):
+            self.pid = 12345
+            self.returncode = 0
+
+        def communicate(self):
+            return "", ""
+
+    monkeypatch.setattr(subprocess, "Popen", lambda cmd, **kwargs: FakeProc(cmd))
+
+    assert profiler.span("idle") is profiler.span("other")
+    add_job(["echo", "profiled"], gpus=1)
+
+    output = str(tmp_path / "profile.json")
+    profiler.write_request(60, output)
+    profiler._requested = True
+    profiler.poll()
+    assert profiler.active()
+    run_once(inline=True)
+    profiler._deadline = 0.0
+    profiler.poll()
+    assert not profiler.active()
+
+    with open(output) as handle:
+        events = json.load(handle)["traceEvents"]
+    names = {e["name"] for e in events if e["ph"] == "X"}
+    assert {"run_once", "try_claim_job", "job.spawn", "job.wait", "set_job_finished"} <= names
+    with open(profiler.summary_path(output)) as handle:
+        phases = {row["name"]: row for row in json.load(handle)["phases"]}
+    assert phases["run_once"]["calls"] == 1
+
+
+def test_critical_path_breaks_priority_ties(monkeypatch, tmp_path):
+    from ravel.store import add_dependencies, list_ready_jobs, set_job_finished, try_claim_job
+
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+
+    clear_jobs_for_tests()
+
+    # Without the policy, submissions skip propagation entirely.
+    first = add_job(["echo", "first"], gpus=1)
+    add_job(["echo", "second"], gpus=1, depends_on=[first])
+    assert get_job(first)["critical_path"] == 60.0
+
+    monkeypatch.setenv("RAVEL_CRITICAL_PATH", "1")
+    side = add_job(["echo", "side"], gpus=1)
+    head = add_job(["echo", "head"], gpus=1, time_limit=10)
+    mid = add_job(["echo", "mid"], gpus=1, depends_on=[head], time_limit=100)
+    add_job(["echo", "tail"], gpus=1, depends_on=[mid])
+    assert get_job(head)["critical_path"] == 170.0
+    assert get_job(side)["critical_path"] == 60.0
+    assert [j["id"] for j in list_ready_jobs()][:3] == [head, first, side]
+    monkeypatch.delenv("RAVEL_CRITICAL_PATH")
+    assert [j["id"] for j in list_ready_jobs()][:3] == [first, side, head]
+    monkeypatch.setenv("RAVEL_CRITICAL_PATH", "1")
+
+    # Batched propagation (as used by `ravel submit`) gives the same result.
+    root = add_job(["echo", "root"], gpus=1)
+    chain = [root]
+    for idx in range(5):
+        job_id = add_job(["echo", str(idx)], gpus=1)
+        add_dependencies(job_id, [chain[-1]])
+        chain.append(job_id)
+    assert get_job(root)["critical_path"] == 360.0
+    assert get_job(chain[3])["critical_path"] == 180.0
+
+    # A finished run changes the estimate of queued jobs with its signature,
+    # and their ancestors follow, down as well as up.
+    sibling = add_job(["echo", "0"], gpus=1)
+    assert try_claim_job(sibling, [0])
+    set_job_finished(sibling, "done", 0, "", "", runtime=10.0)
+    assert get_job(chain[1])["critical_path"] == 250.0
+    assert get_job(root)["critical_path"] == 310.0
+
+
+def test_runtime_prediction_from_history(monkeypatch, tmp_path):
+    from ravel.history import signature
+    from ravel.store import predict_runtimes, set_job_finished, try_claim_job
+
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+
+    clear_jobs_for_tests()
+
+    assert signature(["python3", "train.py", "--lr", "0.1", "data/a.csv"]) == signature(
+        ["python", "train.py", "--lr", "0.3", "data/b.csv"]
+    )
+    assert signature(["bash", "-lc", "python train.py --epochs=3"]) == "python train.py --epochs=<num>"
+    assert signature(["python", "train.py"]) != signature(["python", "eval.py"])
+
+    for lr, runtime in (("0.1", 100.0), ("0.2", 200.0)):
+        job_id = add_job(["python", "train.py", "--lr", lr], gpus=1)
+        assert try_claim_job(job_id, [0])
+        set_job_finished(job_id, "done", 0, "", "", runtime=runtime)
+    failed = add_job(["python", "train.py", "--lr", "9"], gpus=1)
+    assert try_claim_job(failed, [0])
+    set_job_finished(failed, "failed", 1, "", "", runtime=1.0)
+
+    queued = add_job(["python", "train.py", "--lr", "0.5"], gpus=1)
+    other = add_job(["python", "eval.py"], gpus=1)
+    jobs = predict_runtimes([get_job(queued), get_job(other)])
+    assert jobs[0]["predicted_runtime"] == 130.0
+    assert jobs[0]["predicted_runtime_p90"] is not None
+    assert jobs[1]["predicted_runtime"] is None
+
+    # The prediction replaces the default estimate in the critical path weight.
+    assert get_job(queued)["critical_path"] == 130.0
+    assert get_job(other)["critical_path"] == 60.0
+
+
+def test_run_no_wait_startup_stays_lean(tmp_path):
+    import sys
+
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    # Point the pid file at this test process so the CLI sees a running daemon.
+    (state_dir / "daemon.pid").write_text(str(os.getpid()))
+    env = dict(os.environ)
+    env.update({"RAVEL_STATE_DIR": str(state_dir), "RAVEL_DB_PATH": str(tmp_path / "ravel.db")})
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "ravel.cli", "run", "--no-wait", "echo hi"],
+        capture_output=True,
+        text=True,
+        env=env,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "Enqueued" in result.stdout
+
+    imported = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        imported[name.strip()] = int(self_us)
+    for heavy in ("rich", "psutil", "flask", "ravel.daemon", "ravel.cache", "concurrent.futures"):
+        assert heavy not in imported
+    # The submit path needs the store and the RPC client and nothing else of ravel.
+    assert {name for name in imported if name.split(".")[0] == "ravel"} <= {
+        "ravel",
+        "ravel.history",
+        "ravel.lifecycle",
+        "ravel.metrics",
+        "ravel.profiler",
+        "ravel.ravelfile",
+        "ravel.rollups",
+        "ravel.rpc",
+        "ravel.scheduler",
+        "ravel.store",
+        "ravel.utils",
+    }
+
+    # Without rich, only the CLI's own short markup is printed; the rest goes
+    # through rich, so the output is the same either way.
+    import io
+
+    from rich.console import Console
+
+    from ravel.utils import _strip_cli_markup
+
+    for text in (
+        "[bold green]Finished[/] abc123 — done",
+        "[yellow]Unknown job[/] x",
+        "matched [a-z] files",
+        "- [x] checked",
+        "[/] stray",
+        "word " * 30,
+    ):
+        plain = _strip_cli_markup(text)
+        if plain is not None:
+            out = io.StringIO()
+            Console(file=out, width=80).print(text)
+            assert out.getvalue() == plain + "\n"
+    assert _strip_cli_markup("[bold green]Finished[/] abc123") == "Finished abc123"
+    assert _strip_cli_markup("matched [a-z] files") is None
+    assert _strip_cli_markup("- [x] checked") is None
+    assert _strip_cli_markup("word " * 30) is None
+    assert _strip_cli_markup("[/] stray") is None
+
+
+def test_rpc_submission_batches_and_falls_back(monkeypatch, tmp_path):
+    import threading
+
+    import pytest
+
+    from ravel import rpc
+    from ravel.scheduler import submit_jobs
+    from ravel.store import AdmissionError, get_job_dependencies
+
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_RPC", "1")
+
+    clear_jobs_for_tests()
+
+    # No daemon listening: jobs are written directly.
+    (direct,) = submit_jobs([{"command": ["echo", "direct"]}])
+    assert get_job(direct)["status"] == "queued"
+
+    server = rpc.serve()
+    try:
+        assert os.stat(rpc.socket_path()).st_mode & 0o777 == 0o600
+        # The daemon charges jobs to the peer's uid, not to the login name.
+        monkeypatch.setenv("USER", "mallory")
+        monkeypatch.setenv("LOGNAME", "mallory")
+        prep, train = submit_jobs(
+            [
+                {"name": "prep", "command": ["echo", "prep"]},
+                {"command": ["echo", "train"], "depends_on": ["prep"], "gpus": 2},
+            ]
+        )
+        assert get_job_dependencies(train) == [prep]
+        assert get_job(train)["gpus"] == 2
+        assert get_job(prep)["user"] == rpc.user_name(os.getuid()) != "mallory"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda i=i: results.extend(submit_jobs([{"command": ["echo", str(i)]}])))
+            for i in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(results)) == 20
+        assert all(get_job(job_id) for job_id in results)
+
+        monkeypatch.setenv("RAVEL_MAX_QUEUED", "1")
+        with pytest.raises(AdmissionError):
+            submit_jobs([{"command": ["echo", "rejected"]}])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert len(list_jobs(["queued"])) == 23
+
+
+def test_wait_reports_jobs_in_completion_order(monkeypatch, tmp_path):
+    from datetime import datetime
+
+    from click.testing import CliRunner
+
+    from ravel.cli import main
+    from ravel.store import try_claim_job
+    from ravel.utils import set_clock
+
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+
+    clear_jobs_for_tests()
+
+    first = add_job(["echo", "first"], gpus=1)
+    second = add_job(["echo", "second"], gpus=1)
+    third = add_job(["echo", "third"], gpus=1, memory_tag="large")
+    for job_id in (first, second):
+        assert try_claim_job(job_id, [0])
+    # finished_at has one-second resolution; make the completion order explicit.
+    set_clock(lambda: datetime(2026, 1, 1, 0, 0, 1))
+    set_job_finished(second, "done", 0, "second out\n", "")
+    set_clock(lambda: datetime(2026, 1, 1, 0, 0, 2))
+    set_job_finished(first, "failed", 1, "", "")
+    set_clock(None)
+
+    ids_file = tmp_path / "ids.txt"
+    ids_file.write_text(f"# submitted jobs\n{first}\n{second}\n")
+    result = CliRunner().invoke(main, ["wait", "--all-from-file", str(ids_file)])
+    assert result.exit_code == 1
+    assert result.output.index(second) < result.output.index(first)
+    assert "second out" in result.output
+    assert "1/2 succeeded" in result.output
+
+    result = CliRunner().invoke(main, ["wait", "--tag", "large", "--timeout", "0.2", "-q"])
+    assert result.exit_code == 124
+    assert "1 pending" in result.output
+
+    set_job_finished(third, "done", 0, "", "")
+    assert CliRunner().invoke(main, ["wait", second, third]).exit_code == 0
+
+    # Stopped jobs are finished, and jobs cleared while waiting count as missing.
+    import threading
+
+    from ravel.store import clear_jobs
+
+    stopped = add_job(["sleep", "60"], gpus=1)
+    set_job_finished(stopped, "stopped", -1, "", "killed by user")
+    cleared = add_job(["sleep", "60"], gpus=1)
+    timer = threading.Timer(0.3, clear_jobs, [["queued"]])
+    timer.start()
+    result = CliRunner().invoke(main, ["wait", stopped, cleared, "--timeout", "10"])
+    timer.join()
+    assert result.exit_code == 1
+    assert "0/2 succeeded (1 missing, 1 stopped)" in result.output
+
+
+def test_follow_running_job_output_by_offset(monkeypatch, tmp_path):
+    from click.testing import CliRunner
+
+    from ravel import spool
+    from ravel.cli import main
+    from ravel.store import try_claim_job
+    from ravel_web.app import create_app
+
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+
+    clear_jobs_for_tests()
+
+    job_id = add_job(["python", "train.py"], gpus=1)
+    assert try_claim_job(job_id, [0])
+    out_file, err_file = spool.open_spools(job_id)
+    client = create_app().test_client()
+
+    out_file.write("step 1 é".encode())
+    out_file.flush()
+    body = client.get(f"/api/jobs/{job_id}/log?offset=0&max_bytes=8").get_json()
+    # The two-byte character is split by max_bytes and left for the next read.
+    assert body == {
+        "status": "running",
+        "stream": "stdout",
+        "offset": 0,
+        "next_offset": 7,
+        "complete": False,
+        "data": "step 1 ",
+    }
+
+    out_file.write(b"\nstep 2\n")
+    out_file.close()
+    err_file.write(b"bad \xff\xfe tail\n")
+    err_file.close()
+    body = client.get(f"/api/jobs/{job_id}/log?offset=7").get_json()
+    assert body["data"] == "é\nstep 2\n" and not body["complete"]
+
+    raw_output = {stream: spool.read_spool_bytes(job_id, stream) for stream in spool.STREAMS}
+    set_job_finished(
+        job_id,
+        "done",
+        0,
+        spool.read_spool(job_id, "stdout"),
+        spool.read_spool(job_id, "stderr"),
+        raw_output=raw_output,
+    )
+    spool.remove_spools(job_id)
+    body = client.get(f"/api/jobs/{job_id}/log?offset=10").get_json()
+    assert body["data"] == "step 2\n" and body["complete"]
+    # Invalid UTF-8 is served from its raw bytes, so an offset taken while the
+    # job ran still points at the same place.
+    body = client.get(f"/api/jobs/{job_id}/log?stream=stderr&offset=6").get_json()
+    assert body["data"] == " tail\n" and body["complete"]
+
+    result = CliRunner().invoke(main, ["logs", job_id, "-f", "--offset", "10,6"])
+    assert result.exit_code == 0
+    assert result.output == "step 2\n tail\n"
+
+    # A stopped job's log is complete too, so following it returns.
+    stopped = add_job(["python", "train.py"], gpus=1)
+    assert try_claim_job(stopped, [0])
+    set_job_finished(stopped, "stopped", -1, "partial\n", "killed by user")
+    assert client.get(f"/api/jobs/{stopped}/log").get_json()["complete"]
+    result = CliRunner().invoke(main, ["logs", stopped, "-f"])
+    assert result.exit_code == 0 and "partial" in result.output
+
+
+def test_ravelfile_matrix_expansion_and_plan_cache(monkeypatch, tmp_path):
+    from ravel import ravelfile
+
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    path = tmp_path / "Ravelfile"
+    path.write_text(
+        "SET PRIORITY 5\n"
+        "JOB name=prep -- echo prep\n"
+        "MATRIX lr=0.1,0.01 seed=1..2\n"
+        "  JOB name=train-{lr}-{seed} after=prep -- python train.py --lr {lr} --seed {seed}\n"
+        "END\n"
+        "SET PRIORITY 9\n"
+        "FOREACH lr=0.1,0.01 tag=a,b\n"
+        "  JOB name=eval-{tag} after=train-{lr}-1 -- python eval.py {tag}\n"
+        "END\n"
+    )
+    defaults = {"gpus": 1, "cpus": 0, "priority": 0, "memory_tag": None, "cache": False, "time_limit": None}
+
+    jobs, errors = ravelfile.load_plan(str(path), defaults)
+    assert errors == []
+    assert [j["name"] for j in jobs] == [
+        "prep", "train-0.1-1", "train-0.1-2", "train-0.01-1", "train-0.01-2", "eval-a", "eval-b",
+    ]
+    assert jobs[2]["command"] == "python train.py --lr 0.1 --seed 2"
+    # SET applies to the jobs after it, not retroactively.
+    assert [j["priority"] for j in jobs] == [5, 5, 5, 5, 5, 9, 9]
+    assert jobs[6]["after"] == ["train-0.01-1"]
+
+    # Id-shaped references must name a job in the database, checked on every load.
+    from ravel.store import clear_jobs
+
+    existing = add_job(["echo", "x"], gpus=0)
+    ids_file = tmp_path / "ids.jobs"
+    ids_file.write_text(f"JOB after={existing} -- echo ok\nJOB after=abcd1234 -- echo missing\n")
+    assert ravelfile.load_plan(str(ids_file), defaults)[1] == ["line 2: unknown dependency 'abcd1234'"]
+    clear_jobs()
+    assert ravelfile.load_plan(str(ids_file), defaults)[1] == [
+        f"line 1: unknown dependency '{existing}'",
+        "line 2: unknown dependency 'abcd1234'",
+    ]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached plan should skip compiling")
+
+    monkeypatch.setattr(ravelfile, "compile_file", fail)
+    assert ravelfile.load_plan(str(path), defaults) == (jobs, errors)
+
+    cyclic = [
+        {"name": "a", "after": ["c"], "line": 1},
+        {"name": "b", "after": ["a"], "line": 2},
+        {"name": "c", "after": ["b"], "line": 3},
+        {"name": "d", "after": ["nope", "abcd1234"], "line": 4},
+    ]
+    problems = ravelfile.check_dependencies(cyclic)
+    assert problems == [
+        "line 4: unknown dependency 'nope'",
+        "dependency cycle among 3 jobs: a, b, c",
+    ]
+
+
+def test_dashboard_window_spans_running_and_queued(monkeypatch, tmp_path):
+    from ravel.dashboard import _parse_keys, _scroll
+    from ravel.store import count_jobs_by_status, list_jobs_window, try_claim_job
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+
+    clear_jobs_for_tests()
+
+    ids = [add_job(["echo", str(i)], gpus=0) for i in range(6)]
+    for job_id in ids[4:]:
+        try_claim_job(job_id, [])
+
+    counts = count_jobs_by_status()
+    assert counts == {"queued": 4, "running": 2}
+    window = list_jobs_window(["running", "queued"], 1, 3, counts=counts)
+    assert [job["id"] for job in window] == [ids[5], ids[0], ids[1]]
+    assert [job["id"] for job in list_jobs_window(["running", "queued"], 4, 10)] == ids[2:4]
+
+    assert _parse_keys("jj\x1b[6~q") == ["down", "down", "page_down", "quit"]
+    assert _scroll(0, "page_down", 4, 6) == 2
+    assert _scroll(2, "up", 4, 6) == 1
+    assert _scroll(1, "top", 4, 6) == 0
+
+
+def test_event_stream_resumes_from_last_event_id(monkeypatch, tmp_path):
+    from ravel.store import latest_job_event
+    from ravel_web.app import create_app
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+
+    clear_jobs_for_tests()
+    first = add_job(["echo", "one"], gpus=0)
+    second = add_job(["echo", "two"], gpus=0)
+    client = create_app().test_client()
+
+    def events(response, count):
+        chunks = iter(response.response)
+        seen = []
+        while len(seen) < count:
+            chunk = next(chunks)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith(":"):
+                continue
+            fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+            seen.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+        return seen
+
+    live = client.get("/api/stream", buffered=False)
+    (event_id, name, data), = events(live, 1)
+    assert name == "snapshot"
+    assert int(event_id) == latest_job_event()
+    assert data["counts"] == {"queued": 2}
+
+    set_job_finished(first, "done", 0, "", "")
+    # The shared watcher pushes the change to the open stream.
+    delta = events(live, 1)[0]
+    while delta[1] != "jobs":
+        delta = events(live, 1)[0]
+    assert [j["id"] for j in delta[2]["jobs"]] == [first]
+    live.close()
+
+    set_job_finished(second, "failed", 1, "", "")
+    resumed = client.get("/api/stream", headers={"Last-Event-ID": delta[0]}, buffered=False)
+    (event_id, name, data), = events(resumed, 1)
+    assert name == "jobs"
+    assert [(j["id"], j["status"]) for j in data["jobs"]] == [(second, "failed")]
+    assert data["counts"] == {"done": 1, "failed": 1}
+    assert int(event_id) == latest_job_event()
+    resumed.close()
+
+    # A failing watcher tick is logged and turns into one reset event, so
+    # clients fall back to fetching instead of silently missing deltas.
+    import queue
+
+    from ravel_web.stream import Hub
+
+    def failing_tick():
+        raise RuntimeError("database is locked")
+
+    hub = Hub(lambda job: job, dict)
+    subscriber = queue.Queue()
+    hub._subscribers.append(subscriber)
+    hub.tick = failing_tick
+    hub.safe_tick()
+    hub.safe_tick()
+    assert subscriber.get_nowait() == "event: reset\ndata: {}\n\n"
+    assert subscriber.empty()
+
+
+def test_api_conditional_get_and_shared_cache(monkeypatch, tmp_path):
+    import gzip
+
+    from ravel_web.app import create_app
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+
+    clear_jobs_for_tests()
+    for i in range(40):
+        add_job(["python", "train.py", "--seed", str(i)], gpus=0)
+    app = create_app()
+    cache = app.extensions["ravel_response_cache"]
+    client = app.test_client()
+
+    first = client.get("/api/jobs?limit=30")
+    assert first.status_code == 200
+    assert len(first.get_json()["jobs"]) == 30
+    etag = first.headers["ETag"]
+
+    unchanged = client.get("/api/jobs?limit=30", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.headers["ETag"] == etag
+
+    compressed = client.get("/api/jobs?limit=30", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(compressed.data)) == first.get_json()
+    assert cache.stats()["misses"] == 1
+
+    add_job(["echo", "new"], gpus=0)
+    changed = client.get("/api/jobs?limit=30", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert client.get("/api/summary").get_json()["counts"]["queued"] == 41
+    assert client.get("/api/jobs/missing/usage").status_code == 404
+
+
+def test_telemetry_ring_wraps_and_serves_history(monkeypatch, tmp_path):
+    from ravel import telemetry
+    from ravel_web.app import create_app
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setattr(telemetry, "_READER", None)
+
+    ring = telemetry.Ring(telemetry.ring_path(), writable=True, slots=4, interval=1.0)
+    now = time.time()
+    for i in range(6):
+        ring.append(
+            {
+                "time": now - 5 + i,
+                "cpu_percent": float(i),
+                "memory_total": 1000,
+                "memory_used": 100 + i,
+                "memory_percent": 10.0,
+                "gpus": [{"util_gpu": 5.0 * i, "util_mem": 1.0, "memory_total": 80.0, "memory_used": 8.0}],
+            }
+        )
+    assert ring.written == 6
+    # Only the last four records survive the wrap.
+    assert [r["cpu_percent"] for r in ring.history(60, now=now)] == [2.0, 3.0, 4.0, 5.0]
+    assert [r["cpu_percent"] for r in ring.history(2.5, now=now)] == [3.0, 4.0, 5.0]
+
+    snapshot = telemetry.latest()
+    assert snapshot["memory_used"] == 105
+    assert snapshot["gpus"] == [{"index": 0, "util_gpu": 25.0, "util_mem": 1.0, "memory_total": 80.0, "memory_used": 8.0}]
+    assert telemetry.latest(max_age=0.0) is None
+
+    # Job samplers read GPU usage from the ring rather than running nvidia-smi.
+    from ravel import usage
+
+    monkeypatch.setattr(telemetry, "gpu_stats", lambda: 1 / 0)
+    assert usage._gpu_usage([0]) == (25.0, 8.0)
+    assert usage._gpu_usage([1]) == (0.0, 0.0)
+
+    # Reopening with the same geometry keeps the history.
+    ring.close()
+    ring = telemetry.Ring(telemetry.ring_path(), writable=True, slots=4, interval=1.0)
+    assert ring.written == 6
+
+    client = create_app().test_client()
+    data = client.get("/api/resources/history?minutes=1&points=2").get_json()
+    assert data["columns"][:2] == ["time", "cpu_percent"]
+    assert [row[1] for row in data["samples"]] == [2.0, 4.0]
+    assert data["samples"][-1][4] == [20.0]
+    assert client.get("/api/resources").get_json()["cpu_percent"] == 5.0
+
+    # Sampling errors are logged once, not on every interval.
+    logged = []
+
+    def broken_sample():
+        raise OSError("nvidia-smi hung")
+
+    monkeypatch.setattr(telemetry, "sample", broken_sample)
+    monkeypatch.setattr(telemetry.console, "print", logged.append)
+    failing = None
+    for _ in range(3):
+        failing = telemetry._append_sample(ring, failing)
+    assert failing == "nvidia-smi hung"
+    assert len(logged) == 1 and "nvidia-smi hung" in logged[0]
+    assert ring.written == 6
+    ring.close()
+
+
+def test_rollups_answer_stats_without_scanning_jobs(monkeypatch, tmp_path):
+    from click.testing import CliRunner
+
+    from ravel.cli import main
+    from ravel.store import add_jobs, job_stats, rebuild_rollups, try_claim_job
+    from ravel_web.app import create_app
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+
+    clear_jobs_for_tests()
+    alice = add_jobs(
+        [
+            {"command": ["python", "train.py", "--lr", "0.1"], "gpus": 2, "memory_tag": "large"},
+            {"command": ["python", "train.py", "--lr", "0.2"], "gpus": 2, "memory_tag": "large"},
+        ],
+        user="alice",
+    )
+    bob = add_jobs([{"command": ["python", "-u", "eval.py"], "gpus": 1}], user="bob")
+    for job_id, gpus, status in [(alice[0], [0, 1], "done"), (alice[1], [2, 3], "failed"), (bob[0], [0], "done")]:
+        assert try_claim_job(job_id, gpus)
+        set_job_finished(job_id, status, 0 if status == "done" else 1, "", "", runtime=3600.0)
+
+    by_user = {row["key"]: row for row in job_stats("user")}
+    assert by_user["alice"]["jobs"] == 2
+    assert by_user["alice"]["failed"] == 1
+    assert by_user["alice"]["failure_rate"] == 0.5
+    assert by_user["alice"]["gpu_hours"] == 4.0
+    assert by_user["bob"]["gpu_hours"] == 1.0
+    assert 3000 < by_user["bob"]["runtime_p95"] < 4300
+    assert by_user["bob"]["wait_p50"] == 0.5
+    assert {row["key"]: row["jobs"] for row in job_stats("script")} == {"python train.py": 2, "python eval.py": 1}
+    assert {row["key"]: row["jobs"] for row in job_stats("tag")} == {"large": 2, "": 1}
+
+    # Rebuilding from the jobs table gives the same rows the finishes produced.
+    incremental = job_stats("user")
+    assert rebuild_rollups() == 3
+    rebuilt = job_stats("user")
+    for before, after in zip(incremental, rebuilt):
+        assert before["key"] == after["key"] and before["jobs"] == after["jobs"]
+        assert before["failed"] == after["failed"] and before["wait_p95"] == after["wait_p95"]
+
+    data = create_app().test_client().get("/api/stats?by=tag&since=30d").get_json()
+    assert data["stats"][0] == dict(data["stats"][0], key="large", jobs=2, failed=1)
+    assert create_app().test_client().get("/api/stats?by=nope").status_code == 400
+
+    result = CliRunner().invoke(main, ["stats", "--by", "user", "--since", "24h", "--json"])
+    assert result.exit_code == 0, result.output
+    assert [row["key"] for row in json.loads(result.output)["stats"]] == ["alice", "bob"]
+
+    # ravel stop finishes a job and the daemon finishes it again when the
+    # process exits; it is counted once. Blocked jobs count when blocked.
+    from ravel.store import mark_blocked_jobs_due_to_failed_deps
+
+    stopped = add_job(["python", "stop.py"], gpus=0)
+    child = add_job(["python", "after.py"], gpus=0, depends_on=[stopped])
+    assert try_claim_job(stopped, [])
+    set_job_finished(stopped, "stopped", -1, "", "terminated by user")
+    set_job_finished(stopped, "failed", -15, "", "", runtime=1.0)
+    assert mark_blocked_jobs_due_to_failed_deps() == 1
+    assert mark_blocked_jobs_due_to_failed_deps() == 0
+    assert get_job(child)["status"] == "blocked" and get_job(child)["finished_at"]
+    by_script = {row["key"]: row for row in job_stats("script")}
+    assert by_script["python stop.py"]["jobs"] == 1
+    assert by_script["python stop.py"]["failure_rate"] == 0.0
+    assert by_script["python after.py"]["jobs"] == 1
+    assert rebuild_rollups() == 5
+
+
+def test_client_handles_resolve_from_one_watcher(monkeypatch, tmp_path):
+    import asyncio
+    import concurrent.futures
+    import sys
+    import threading
+
+    import ravel
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.chdir(tmp_path)
+
+    clear_jobs_for_tests()
+    with ravel.Client(poll_interval=0.05, start_daemon=False) as client:
+        first, broken = client.submit_many(
+            [
+                {"command": [sys.executable, "-c", "print('hi')"], "gpus": 0, "name": "first"},
+                {"command": "false", "gpus": 0, "time_limit": "1m"},
+            ]
+        )
+        second = client.submit([sys.executable, "-c", "print('after')"], gpus=0, depends_on=[first])
+        assert get_job(broken.id)["time_limit"] == 60
+        assert get_job(second.id)["cwd"] == str(tmp_path)
+        assert not first.done()
+        assert [t.name for t in threading.enumerate()].count("ravel-client") == 1
+
+        while get_job(second.id)["status"] != "done":
+            run_once(inline=True)
+
+        done, _ = concurrent.futures.wait([first, broken, second], timeout=5)
+        assert len(done) == 3
+        result = first.result()
+        assert result.ok and result.stdout.strip() == "hi" and result.returncode == 0
+        assert broken.result().status == "failed" and not broken.result().ok
+
+        async def gather():
+            return await asyncio.gather(second, client.get(first.id))
+
+        after, again = asyncio.run(gather())
+        assert after.stdout.strip() == "after"
+        assert again.id == first.id and again.finished_at == result.finished_at
+
+        assert isinstance(client.get("missing").exception(timeout=5), KeyError)
+        pending = client.submit("true", gpus=0)
+
+    # Closing the client fails what it can no longer resolve.
+    error = pending.exception(timeout=5)
+    assert isinstance(error, RuntimeError) and str(error) == "client closed"
+
+
+def test_submit_fn_runs_in_recycled_worker_pool(monkeypatch, tmp_path):
+    import functools
+    import math
+    import sys
+
+    import ravel
+    from ravel import worker
+
+    monkeypatch.setenv("RAVEL_NO_GPU", "1")
+    monkeypatch.setenv("RAVEL_TEST_MODE", "1")
+    monkeypatch.setenv("RAVEL_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("RAVEL_DB_PATH", str(tmp_path / "ravel.db"))
+    monkeypatch.setenv("RAVEL_WORKER_MAX_TASKS", "2")
+    monkeypatch.setattr(worker, "_POOL", None)
+
+    clear_jobs_for_tests()
+    with ravel.Client(poll_interval=0.05, start_daemon=False) as client:
+        pids = [client.submit_fn(os.getpid, gpus=0) for _ in range(3)]
+        shown = client.submit_fn(functools.partial(print, "from", "worker"), gpus=0)
+        value = client.submit_fn(math.factorial, 5, gpus=0)
+        broken = client.submit_fn(divmod, 1, 0, gpus=0)
+        handles = pids + [shown, value, broken]
+        while any(get_job(h.id)["status"] in ("queued", "running") for h in handles):
+            run_once(inline=True)
+
+        first, second, third = [h.result(timeout=5) for h in pids]
+        # Two tasks share one long-lived worker, which then recycles.
+        assert first == second != third
+        assert os.getpid() not in (first, third)
+        assert value.result(timeout=5) == 120
+        assert shown.result(timeout=5) is None and get_job(shown.id)["stdout"] == "from worker\n"
+        assert isinstance(broken.exception(timeout=5), ZeroDivisionError)
+        assert broken.job.status == "failed" and "ZeroDivisionError" in broken.job.stderr
+        assert os.listdir(worker.task_dir()) == []
+
+        # Tasks that will never run do not leave their pickles behind.
+        from ravel.store import clear_jobs
+
+        blocked = client.submit_fn(math.factorial, 3, gpus=0, depends_on=[broken])
+        run_once(inline=True)
+        assert isinstance(blocked.exception(timeout=5), ravel.JobError)
+        pending = client.submit_fn(math.factorial, 4, gpus=0)
+        assert len(os.listdir(worker.task_dir())) == 1
+        assert clear_jobs(["queued"]) == 1
+        assert isinstance(pending.exception(timeout=5), KeyError)
+        assert os.listdir(worker.task_dir()) == []
+        # Only files in the task directory are ever deleted.
+        outside = tmp_path / "keep.pkl"
+        outside.write_bytes(b"")
+        worker.remove_task([sys.executable, "-m", "ravel.worker", "run", str(outside)])
+        assert outside.exists()
+        # Thread count is fixed at worker start, so it is part of the pool key.
+        assert worker.pool_key([0], {"OMP_NUM_THREADS": "2"}) != worker.pool_key([0], {"OMP_NUM_THREADS": "4"})
+
+        # Without the pool the same command runs the task in a fresh interpreter.
+        monkeypatch.setenv("RAVEL_WORKER_POOL", "0")
+        solo = client.submit_fn(math.factorial, 6, gpus=0)
+        run_once(inline=True)
+        assert solo.result(timeout=5) == 720
+    worker._POOL.stop()
+
+    # A pooled task is measured above what its worker had already used.
+    from ravel.usage import UsageSampler, snapshot
+
+    busy = subprocess.Popen([sys.executable, "-c", "import time\nwhile time.process_time() < 0.3: pass\ntime.sleep(30)"])
+    try:
+        while snapshot(busy.pid)["cpu"].get(busy.pid, 0.0) < 0.2:
+            time.sleep(0.05)
+        baseline = snapshot(busy.pid)
+        sampler = UsageSampler(busy.pid, [], interval=1.0, limit=10, baseline=baseline)
+        import psutil
+
+        sampler._sample(psutil.Process(busy.pid), psutil)
+        assert sampler.summary()["cpu_seconds"] < 0.1
+        assert sampler.summary()["peak_rss"] < baseline["rss"]
+    finally:
+        busy.kill()
+        busy.wait()